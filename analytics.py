@@ -0,0 +1,324 @@
+# analytics.py
+"""
+Estadísticas de partido y de torneo, calculadas desde el historial de puntos
+(la proyección del log de eventos, ver event_log.py).
+
+Por set:
+* racha más larga de cada equipo (puntos seguidos),
+* side-out: rallies ganados por el equipo que recibía (el saque lo tiene
+  quien ganó el punto anterior), y puntos de quiebre (ganados sacando),
+* cambios de líder y empates,
+* ritmo (segundos entre puntos) y duración (del primer al último punto).
+
+El cálculo es por columnas: de cada set se arman listas (quién anotó,
+diferencia de score, timestamps) y todo sale de `map`/`operator`/`groupby`
+sobre ellas, sin un loop de Python por punto.
+
+Los resultados se cachean por partido junto con el `event_seq` con el que se
+calcularon. Si el partido avanzó, sólo se recalculan los sets que cambiaron
+(en la práctica, el set en juego): los sets cerrados no cambian más. El
+torneo suma los totales cacheados de cada partido, y el resultado se reusa
+unos segundos (ANALYTICS_TOURNAMENT_TTL_SECONDS).
+
+Los partidos archivados (ver archive.py) también cuentan para el torneo: sus
+puntos salen del archivo histórico. Un archivo no cambia nunca, así que lo
+que suma cada uno se calcula una vez y se guarda por ruta.
+"""
+import os
+import time
+import datetime
+import operator
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from typing import Callable, Dict, List, Optional
+
+from event_log import GameProjection
+from models import GameStats, SetStats, StatsSummary, TeamStats, TournamentStats, TournamentTeamStats
+
+
+ANALYTICS_TOURNAMENT_TTL_SECONDS = float(os.environ.get("ANALYTICS_TOURNAMENT_TTL_SECONDS", "15"))
+
+TEAM_FIELDS = ("points", "longest_run", "side_outs", "side_out_opportunities", "break_points")
+
+
+_SCORER = operator.itemgetter("scoring_team_id")
+_TEAM1_SCORE = operator.itemgetter("team1_score_after")
+_TEAM2_SCORE = operator.itemgetter("team2_score_after")
+_TIMESTAMP = operator.itemgetter("timestamp")
+_ZERO = datetime.timedelta(0)
+
+
+def _empty_team() -> dict:
+    return dict.fromkeys(TEAM_FIELDS, 0)
+
+
+def _empty_totals() -> dict:
+    return {
+        "points": 0, "team1": _empty_team(), "team2": _empty_team(),
+        "lead_changes": 0, "ties": 0, "duration_seconds": 0.0,
+        "gap_sum": 0.0, "gap_count": 0, "gap_max": None, "sets": 0,
+    }
+
+
+def set_totals(points: List[dict], team1_id: str) -> dict:
+    """Totales crudos (sumables) de un set."""
+    totals = _empty_totals()
+    n = len(points)
+    totals["points"] = n
+    if n == 0:
+        return totals
+    totals["sets"] = 1
+
+    # Columnas
+    won = list(map(team1_id.__eq__, map(_SCORER, points))) # True: punto del equipo 1
+    diffs = list(map(operator.sub, map(_TEAM1_SCORE, points), map(_TEAM2_SCORE, points)))
+    times = list(map(_TIMESTAMP, points))
+
+    team1, team2 = totals["team1"], totals["team2"]
+    team1["points"] = sum(won)
+    team2["points"] = n - team1["points"]
+
+    # Rachas: largo de cada tramo de puntos seguidos del mismo equipo
+    for team1_run, run in groupby(won):
+        length = sum(1 for _ in run)
+        team = team1 if team1_run else team2
+        if length > team["longest_run"]:
+            team["longest_run"] = length
+
+    # Saque y side-out: en cada rally (desde el segundo) saca quien ganó el anterior
+    previous, current = won[:-1], won[1:]
+    team1_serves = sum(previous)
+    team2_serves = len(previous) - team1_serves
+    team1["side_outs"] = sum(map(operator.gt, current, previous))  # Sacaba 2, ganó 1
+    team2["side_outs"] = sum(map(operator.lt, current, previous))  # Sacaba 1, ganó 2
+    team1["side_out_opportunities"] = team2_serves
+    team2["side_out_opportunities"] = team1_serves
+    team1["break_points"] = team1_serves - team2["side_outs"]
+    team2["break_points"] = team2_serves - team1["side_outs"]
+
+    # Cambios de líder: cuántas veces cambia el signo de la diferencia (sin contar empates)
+    leaders = [diff > 0 for diff in diffs if diff]
+    totals["lead_changes"] = sum(map(operator.ne, leaders[1:], leaders[:-1]))
+    totals["ties"] = diffs.count(0)
+
+    # Ritmo y duración (restas de datetimes: timedeltas)
+    gaps = list(map(operator.sub, times[1:], times[:-1]))
+    totals["duration_seconds"] = (times[-1] - times[0]).total_seconds()
+    totals["gap_sum"] = sum(gaps, _ZERO).total_seconds()
+    totals["gap_count"] = len(gaps)
+    totals["gap_max"] = max(gaps).total_seconds() if gaps else None
+    return totals
+
+
+def _add_team(into: dict, team: dict):
+    for field in TEAM_FIELDS:
+        if field == "longest_run":
+            into[field] = max(into[field], team[field])
+        else:
+            into[field] += team[field]
+
+
+def merge_totals(into: dict, totals: dict):
+    """Suma `totals` en `into` (mismo orden de equipos)."""
+    for field in ("points", "lead_changes", "ties", "duration_seconds", "gap_sum", "gap_count", "sets"):
+        into[field] += totals[field]
+    if totals["gap_max"] is not None and (into["gap_max"] is None or totals["gap_max"] > into["gap_max"]):
+        into["gap_max"] = totals["gap_max"]
+    _add_team(into["team1"], totals["team1"])
+    _add_team(into["team2"], totals["team2"])
+
+
+def _empty_tournament() -> dict:
+    return {"games": 0, "totals": _empty_totals(), "teams": {}, "team_games": {}}
+
+
+def _add_game(tournament: dict, team1_id: str, team2_id: str, totals: dict):
+    tournament["games"] += 1
+    merge_totals(tournament["totals"], totals)
+    for team_id, team in ((team1_id, totals["team1"]), (team2_id, totals["team2"])):
+        _add_team(tournament["teams"].setdefault(team_id, _empty_team()), team)
+        tournament["team_games"][team_id] = tournament["team_games"].get(team_id, 0) + 1
+
+
+def _merge_tournament(into: dict, other: dict):
+    into["games"] += other["games"]
+    merge_totals(into["totals"], other["totals"])
+    for team_id, team in other["teams"].items():
+        _add_team(into["teams"].setdefault(team_id, _empty_team()), team)
+        into["team_games"][team_id] = into["team_games"].get(team_id, 0) + other["team_games"][team_id]
+
+
+def segment_tournament(segment) -> dict:
+    """Lo que suman al torneo los partidos terminados de un archivo histórico (un ArchiveSegment)."""
+    tournament = _empty_tournament()
+    for i, status in enumerate(segment.games["status"]):
+        if status != "finished":
+            continue # Como en vivo: los anulados no cuentan
+        game = segment.game(i, with_points=True)
+        totals = _empty_totals()
+        for game_set in game["sets"]:
+            if game_set["points"]:
+                merge_totals(totals, set_totals(game_set["points"], game["team1_id"]))
+        if totals["points"]:
+            _add_game(tournament, game["team1_id"], game["team2_id"], totals)
+    return tournament
+
+
+def _team_stats(team_id: str, team: dict, model=TeamStats, **extra):
+    opportunities = team["side_out_opportunities"]
+    return model(
+        team_id=team_id, **team,
+        side_out_rate=round(team["side_outs"] / opportunities, 4) if opportunities else None,
+        **extra
+    )
+
+
+def _summary_fields(totals: dict, team1_id: str, team2_id: str) -> dict:
+    gap_count = totals["gap_count"]
+    return {
+        "points": totals["points"],
+        "team1": _team_stats(team1_id, totals["team1"]),
+        "team2": _team_stats(team2_id, totals["team2"]),
+        "lead_changes": totals["lead_changes"],
+        "ties": totals["ties"],
+        "duration_seconds": round(totals["duration_seconds"], 3),
+        "avg_point_seconds": round(totals["gap_sum"] / gap_count, 3) if gap_count else None,
+        "max_point_seconds": round(totals["gap_max"], 3) if totals["gap_max"] is not None else None,
+    }
+
+
+class _GameEntry:
+    __slots__ = ("seq", "status", "team1_id", "team2_id", "sets", "totals", "stats")
+
+    def __init__(self):
+        self.seq = -1
+        self.sets: Dict[int, tuple] = {} # set_number -> (cantidad de puntos, seq del último, status, totales)
+        self.stats: Optional[GameStats] = None # Se arma al pedirla (el torneo sólo usa los totales)
+
+
+class MatchAnalytics:
+
+    def __init__(self, max_games: int = 4096, tournament_ttl: float = ANALYTICS_TOURNAMENT_TTL_SECONDS):
+        self._max_games = max_games
+        self._tournament_ttl = tournament_ttl
+        self._games: "OrderedDict[str, _GameEntry]" = OrderedDict()
+        self._tournaments: Dict[str, tuple] = {} # category_id -> (monotonic, TournamentStats)
+        self._segments: Dict[str, dict] = {}     # ruta del archivo histórico -> lo que suma al torneo
+        self._lock = threading.Lock()
+
+    def game_stats(self, game_id: str, projection: GameProjection) -> GameStats:
+        entry = self._entry(game_id, projection)
+        if entry.stats is None:
+            entry.stats = GameStats(
+                game_id=game_id, status=entry.status, event_seq=entry.seq,
+                totals=StatsSummary(**_summary_fields(entry.totals, entry.team1_id, entry.team2_id)),
+                sets=[
+                    SetStats(set_number=set_number, status=status,
+                             **_summary_fields(totals, entry.team1_id, entry.team2_id))
+                    for set_number, (_, _, status, totals) in entry.sets.items()
+                ]
+            )
+        return entry.stats
+
+    def _entry(self, game_id: str, projection: GameProjection) -> _GameEntry:
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is not None and entry.seq == projection.seq:
+                self._games.move_to_end(game_id)
+                return entry
+            previous_sets = entry.sets if entry is not None else {}
+
+        entry = _GameEntry()
+        entry.seq = projection.seq
+        entry.status = projection.status
+        entry.team1_id, entry.team2_id = projection.team1_id, projection.team2_id
+        entry.totals = _empty_totals()
+
+        for set_number in sorted(projection.sets):
+            game_set = projection.sets[set_number]
+            points = list(game_set["points"]) # La proyección puede seguir creciendo mientras tanto
+            if not points:
+                continue
+            # Un set sin cambios (mismos puntos, mismo último) no se recalcula
+            cached = previous_sets.get(set_number)
+            if cached is not None and cached[0] == len(points) and cached[1] == points[-1]["seq"]:
+                totals = cached[3]
+            else:
+                totals = set_totals(points, projection.team1_id)
+            entry.sets[set_number] = (len(points), points[-1]["seq"], game_set["status"], totals)
+            merge_totals(entry.totals, totals)
+
+        with self._lock:
+            current = self._games.get(game_id)
+            if current is None or current.seq <= entry.seq:
+                self._games[game_id] = entry
+                self._games.move_to_end(game_id)
+                while len(self._games) > self._max_games:
+                    self._games.popitem(last=False)
+        return entry
+
+    def tournament_stats(self, category_id: str, category_name: str,
+                         list_games: Callable[[], List[dict]],
+                         load_projection: Callable[[str, int], Optional[GameProjection]],
+                         list_segments: Callable[[], list] = lambda: []) -> TournamentStats:
+        """
+        Suma los partidos que devuelve `list_games` (game docs con 'id' y
+        'event_seq') y los archivados en los segmentos de `list_segments`
+        (ver archive.py). Sólo se cargan las proyecciones de los partidos que
+        cambiaron desde el último cálculo. El resultado se reusa durante
+        ANALYTICS_TOURNAMENT_TTL_SECONDS: listar los partidos de un torneo
+        cuesta una lectura por partido.
+        """
+        with self._lock:
+            cached = self._tournaments.get(category_id)
+        if cached is not None and time.monotonic() - cached[0] < self._tournament_ttl:
+            return cached[1]
+
+        stats = self._tournament_stats(category_id, category_name, list_games(), load_projection, list_segments())
+        with self._lock:
+            self._tournaments[category_id] = (time.monotonic(), stats)
+        return stats
+
+    def _tournament_stats(self, category_id: str, category_name: str, games: List[dict],
+                          load_projection: Callable[[str, int], Optional[GameProjection]],
+                          segments: list) -> TournamentStats:
+        tournament = _empty_tournament()
+
+        for game in games:
+            game_id, event_seq = game["id"], game.get("event_seq", 0)
+            with self._lock:
+                entry = self._games.get(game_id)
+            if entry is None or entry.seq != event_seq:
+                projection = load_projection(game_id, event_seq)
+                if projection is None:
+                    continue
+                entry = self._entry(game_id, projection)
+            if entry.totals["points"] == 0:
+                continue
+            _add_game(tournament, entry.team1_id, entry.team2_id, entry.totals)
+
+        for segment in segments:
+            with self._lock:
+                archived = self._segments.get(segment.path)
+            if archived is None:
+                archived = segment_tournament(segment)
+                with self._lock:
+                    self._segments[segment.path] = archived
+            _merge_tournament(tournament, archived)
+
+        totals, team_games = tournament["totals"], tournament["team_games"]
+        gap_count = totals["gap_count"]
+        team_stats = [
+            _team_stats(team_id, team, TournamentTeamStats, games=team_games[team_id])
+            for team_id, team in tournament["teams"].items()
+        ]
+        team_stats.sort(key=lambda team: team.points, reverse=True)
+        return TournamentStats(
+            category_id=category_id, category_name=category_name,
+            games=tournament["games"], sets=totals["sets"], points=totals["points"],
+            lead_changes=totals["lead_changes"],
+            avg_set_seconds=round(totals["duration_seconds"] / totals["sets"], 3) if totals["sets"] else None,
+            avg_point_seconds=round(totals["gap_sum"] / gap_count, 3) if gap_count else None,
+            teams=team_stats
+        )
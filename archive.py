@@ -0,0 +1,461 @@
+# archive.py
+"""
+Archivo histórico de partidos terminados, en un formato columnar en disco.
+
+Los partidos finalizados o anulados hace más de ARCHIVE_AFTER_DAYS días se
+pasan a archivos `.vcol` y se borran del storage en vivo (game doc, sets,
+log de eventos y snapshots), así `games` queda chico.
+
+Los archivos están particionados por categoría y mes de creación:
+`ARCHIVE_DIR/<categoría>/<AAAA-MM>/<corrida>.vcol`. Cada uno tiene:
+
+* un encabezado JSON con la tabla de partidos por columnas (ids, equipos,
+  status, sets con su score final...) y dónde empieza cada columna de puntos;
+* las columnas de puntos, una atrás de la otra, como arrays binarios
+  (set, quién anotó, scores después del punto, timestamp). Los puntos de un
+  partido son un rango contiguo de filas.
+
+En el primer uso (o en el warm-up del arranque) se abren todos los archivos
+con mmap y sólo se parsean los encabezados: listar partidos no toca los puntos, y el detalle de un partido
+lee únicamente su rango de filas (memoryview sobre el mmap, sin copiar el
+archivo). No se usa Parquet/Arrow para no sumar dependencias: el formato
+es lo mínimo que necesitan estas consultas.
+
+Un archivo se escribe completo en un temporal, con fsync, y recién después
+de renombrarlo se borran los partidos del storage. Si el proceso se corta
+entre las dos cosas, la corrida siguiente ve que esos partidos ya están
+archivados y sólo los borra.
+
+Borrar del storage sólo es seguro si el archivo sobrevive a la instancia.
+En Cloud Run el disco es efímero y de cada instancia, así que:
+
+* con ARCHIVE_BUCKET (bucket de GCS, opcionalmente `bucket/carpeta`) cada
+  segmento se sube al bucket antes de borrar nada, y cada instancia baja
+  los que le falten (al abrir el archivo y cada ARCHIVE_SYNC_SECONDS): el
+  disco local queda como cache;
+* sin bucket, sólo se borra si ARCHIVE_DIR está configurado a mano (un
+  volumen persistente); si no, `archive()` lanza ArchiveNotDurableError.
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import secrets
+import datetime
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from event_log import GameProjection
+from storage import Storage
+
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# Configurarlo a mano es declarar que el directorio es persistente
+ARCHIVE_DIR_PERSISTENT = "ARCHIVE_DIR" in os.environ
+ARCHIVE_BUCKET = os.environ.get("ARCHIVE_BUCKET", "")
+ARCHIVE_SYNC_SECONDS = float(os.environ.get("ARCHIVE_SYNC_SECONDS", "300"))
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", "2"))
+ARCHIVED_STATUSES = ["finished", "cancelled"]
+
+MAGIC = b"VOLEYCOL"
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+# Columnas de puntos: nombre -> typecode de `array`
+POINT_COLUMNS = (
+    ("set_number", "B"),
+    ("team1_scored", "B"),   # 1 si anotó el equipo 1
+    ("team1_score", "H"),    # Score después del punto
+    ("team2_score", "H"),
+    ("timestamp", "d"),      # Epoch en segundos
+)
+
+# Columnas de la tabla de partidos (en el encabezado)
+GAME_COLUMNS = (
+    "id", "team1_id", "team2_id", "team1_name", "team2_name", "team1_flag", "team2_flag",
+    "category_id", "category_name", "status", "winner_id", "created_at",
+    "team1_sets_won", "team2_sets_won",
+    "sets",                  # [[set_number, status, winner_id, team1_score, team2_score], ...]
+    "row_start", "row_end",  # Rango de filas de puntos del partido
+)
+
+
+def category_key(game: dict) -> str:
+    """Nombre de la partición de categoría (los partidos viejos no guardan category_id)."""
+    if game.get("category_id"):
+        return game["category_id"]
+    slug = re.sub(r"[^a-z0-9]+", "-", (game.get("category_name") or "").lower()).strip("-")
+    return slug or "sin-categoria"
+
+
+def _created_at(game: dict) -> datetime.datetime:
+    created_at = game["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.datetime.fromisoformat(created_at)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    return created_at
+
+
+def _padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+def write_segment(path: str, partition: dict, games: List[dict], projections: List[GameProjection]):
+    """Escribe un archivo .vcol (temporal + fsync + rename)."""
+    columns = {name: array.array(typecode) for name, typecode in POINT_COLUMNS}
+    table = {name: [] for name in GAME_COLUMNS}
+
+    for game, projection in zip(games, projections):
+        row_start = len(columns["set_number"])
+        sets = []
+        for set_number in sorted(projection.sets):
+            game_set = projection.sets[set_number]
+            points = game_set["points"]
+            if not points and game_set["status"] == "live":
+                continue # El set vacío que se abre al cerrar el anterior
+            for point in points:
+                columns["set_number"].append(set_number)
+                columns["team1_scored"].append(1 if point["scoring_team_id"] == projection.team1_id else 0)
+                columns["team1_score"].append(point["team1_score_after"])
+                columns["team2_score"].append(point["team2_score_after"])
+                columns["timestamp"].append(point["timestamp"].timestamp())
+            score_t1, score_t2 = projection.scores(set_number)
+            sets.append([set_number, game_set["status"], game_set["winner_id"], score_t1, score_t2])
+
+        for name in GAME_COLUMNS[:-3]:
+            value = game.get(name)
+            table[name].append(_created_at(game).isoformat() if name == "created_at" else value)
+        table["sets"].append(sets)
+        table["row_start"].append(row_start)
+        table["row_end"].append(len(columns["set_number"]))
+
+    # Ubicación de cada columna de puntos, relativa al final del encabezado
+    layout = {}
+    offset = 0
+    for name, typecode in POINT_COLUMNS:
+        offset += _padding(offset)
+        nbytes = len(columns[name]) * columns[name].itemsize
+        layout[name] = {"type": typecode, "offset": offset, "bytes": nbytes}
+        offset += nbytes
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "partition": partition,
+        "rows": len(columns["set_number"]),
+        "games": table,
+        "columns": layout,
+    }, separators=(",", ":")).encode("utf-8")
+    prefix = MAGIC + len(header).to_bytes(8, "little") + header
+    prefix += b"\0" * _padding(len(prefix))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        written = 0
+        for name, _ in POINT_COLUMNS:
+            f.write(b"\0" * (layout[name]["offset"] - written))
+            f.write(columns[name].tobytes())
+            written = layout[name]["offset"] + layout[name]["bytes"]
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class ArchiveSegment:
+    """Un archivo .vcol abierto con mmap. Sólo se parsea el encabezado."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} no es un archivo de archivo histórico")
+        header_len = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], "little")
+        header_end = len(MAGIC) + 8 + header_len
+        header = json.loads(self._mmap[len(MAGIC) + 8:header_end])
+        self._data_offset = header_end + _padding(header_end)
+        self._swap = header["byteorder"] != sys.byteorder
+        self.partition = header["partition"]
+        self.columns = header["columns"]
+        self.games = header["games"]
+        self.game_ids = self.games["id"]
+
+    def _column(self, name: str, start: int, end: int):
+        """Filas [start, end) de una columna, sin copiar (salvo otro byteorder)."""
+        spec = self.columns[name]
+        itemsize = array.array(spec["type"]).itemsize
+        begin = self._data_offset + spec["offset"] + start * itemsize
+        view = memoryview(self._mmap)[begin:begin + (end - start) * itemsize].cast(spec["type"])
+        if self._swap:
+            values = array.array(spec["type"], view)
+            values.byteswap()
+            return values
+        return view
+
+    def game(self, index: int, with_points: bool = False) -> dict:
+        game = {name: self.games[name][index] for name in GAME_COLUMNS[:-3]}
+        game["created_at"] = datetime.datetime.fromisoformat(game["created_at"])
+        sets = [
+            {"set_number": n, "status": status, "winner_id": winner_id,
+             "team1_score": score_t1, "team2_score": score_t2}
+            for n, status, winner_id, score_t1, score_t2 in self.games["sets"][index]
+        ]
+        if with_points:
+            start, end = self.games["row_start"][index], self.games["row_end"][index]
+            columns = [self._column(name, start, end) for name, _ in POINT_COLUMNS]
+            by_set: Dict[int, List[dict]] = {}
+            for set_number, team1_scored, score_t1, score_t2, timestamp in zip(*columns):
+                by_set.setdefault(set_number, []).append({
+                    "timestamp": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc),
+                    "scoring_team_id": game["team1_id"] if team1_scored else game["team2_id"],
+                    "team1_score_after": score_t1,
+                    "team2_score_after": score_t2,
+                })
+            for game_set in sets:
+                game_set["points"] = by_set.get(game_set["set_number"], [])
+        game["sets"] = sets
+        return game
+
+    def close(self):
+        self._mmap.close()
+
+
+class ArchiveNotDurableError(Exception):
+    """No hay dónde guardar el archivo de forma durable: no se borra nada del storage."""
+
+
+class ArchiveStore:
+
+    def __init__(self, directory: str = ARCHIVE_DIR, bucket: str = ARCHIVE_BUCKET,
+                 persistent_dir: bool = ARCHIVE_DIR_PERSISTENT, sync_seconds: float = ARCHIVE_SYNC_SECONDS):
+        self._directory = directory
+        self._bucket_name, _, prefix = bucket.partition("/")
+        self._prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._bucket = None # google.cloud.storage, en el primer uso
+        self._persistent_dir = persistent_dir
+        self._sync_seconds = sync_seconds
+        self._synced_at: Optional[float] = None
+        self._segments: List[ArchiveSegment] = []
+        self._index: Dict[str, tuple] = {} # game_id -> (segmento, fila en la tabla de partidos)
+        self._lock = threading.Lock()
+        # Los segmentos se abren en el primer uso (o en el warm-up), no al importar
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    @property
+    def durable(self) -> bool:
+        return bool(self._bucket_name) or self._persistent_dir
+
+    def ensure_loaded(self):
+        if self._loaded:
+            if self._bucket_name and time.monotonic() - self._synced_at > self._sync_seconds:
+                # Segmentos que archivaron otras instancias
+                with self._load_lock:
+                    if time.monotonic() - self._synced_at > self._sync_seconds:
+                        self._open_new(self.sync())
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.load()
+
+    def load(self):
+        if self._bucket_name:
+            self.sync()
+        segments = []
+        if os.path.isdir(self._directory):
+            for root, _, files in os.walk(self._directory):
+                for name in sorted(files):
+                    if name.endswith(".vcol"):
+                        segments.append(ArchiveSegment(os.path.join(root, name)))
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._index = {}
+            for segment in segments:
+                self._add(segment)
+            self._loaded = True
+
+    def _open_new(self, paths: List[str]):
+        segments = [ArchiveSegment(path) for path in paths]
+        with self._lock:
+            for segment in segments:
+                self._add(segment)
+
+    # --- Bucket (GCS) ---
+
+    def _remote(self):
+        if self._bucket is None:
+            from google.cloud import storage as gcs
+            self._bucket = gcs.Client().bucket(self._bucket_name)
+        return self._bucket
+
+    def _local_paths(self) -> Dict[str, str]:
+        """Segmentos en disco: nombre relativo (con '/') -> ruta."""
+        paths = {}
+        if os.path.isdir(self._directory):
+            for root, _, files in os.walk(self._directory):
+                for name in files:
+                    if name.endswith(".vcol"):
+                        path = os.path.join(root, name)
+                        paths[os.path.relpath(path, self._directory).replace(os.sep, "/")] = path
+        return paths
+
+    def _upload(self, path: str):
+        name = os.path.relpath(path, self._directory).replace(os.sep, "/")
+        self._remote().blob(self._prefix + name).upload_from_filename(path)
+
+    def sync(self) -> List[str]:
+        """
+        Iguala el disco local con el bucket: sube los segmentos que no están
+        (una corrida cortada entre escribir y subir) y baja los que faltan.
+        Devuelve las rutas bajadas.
+        """
+        local = self._local_paths()
+        remote = set()
+        downloaded = []
+        for blob in self._remote().list_blobs(prefix=self._prefix):
+            name = blob.name[len(self._prefix):]
+            if not name.endswith(".vcol"):
+                continue
+            remote.add(name)
+            if name not in local:
+                path = os.path.join(self._directory, *name.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                blob.download_to_filename(path + ".tmp")
+                os.replace(path + ".tmp", path)
+                local[name] = path
+                downloaded.append(path)
+        for name, path in local.items():
+            if name not in remote:
+                self._upload(path)
+        self._synced_at = time.monotonic()
+        return downloaded
+
+    def _add(self, segment: ArchiveSegment):
+        # Siempre con el lock tomado
+        self._segments.append(segment)
+        for i, game_id in enumerate(segment.game_ids):
+            self._index[game_id] = (segment, i)
+
+    def contains(self, game_id: str) -> bool:
+        self.ensure_loaded()
+        with self._lock:
+            return game_id in self._index
+
+    # --- Consultas ---
+
+    def get_game(self, game_id: str) -> Optional[dict]:
+        """Partido archivado con sus sets y puntos."""
+        self.ensure_loaded()
+        with self._lock:
+            found = self._index.get(game_id)
+        if found is None:
+            return None
+        segment, index = found
+        return segment.game(index, with_points=True)
+
+    def segments(self, categories: List[str]) -> List[ArchiveSegment]:
+        """Los archivos de esas particiones de categoría. No cambian nunca: se pueden cachear por ruta."""
+        self.ensure_loaded()
+        with self._lock:
+            return [segment for segment in self._segments if segment.partition["category"] in categories]
+
+    def list_games(self, category: Optional[str] = None, team_id: Optional[str] = None,
+                   date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                   limit: int = 100) -> List[dict]:
+        """Partidos archivados (sin puntos), más nuevos primero."""
+        month_from = date_from.strftime("%Y-%m") if date_from else None
+        month_to = date_to.strftime("%Y-%m") if date_to else None
+        self.ensure_loaded()
+        with self._lock:
+            segments = list(self._segments)
+
+        games = []
+        for segment in segments:
+            # Poda por partición: ni se miran los partidos de otras categorías o meses
+            partition = segment.partition
+            if category and partition["category"] != category:
+                continue
+            if (month_from and partition["month"] < month_from) or (month_to and partition["month"] > month_to):
+                continue
+            table = segment.games
+            for i in range(len(segment.game_ids)):
+                if team_id and team_id not in (table["team1_id"][i], table["team2_id"][i]):
+                    continue
+                created_on = table["created_at"][i][:10]
+                if (date_from and created_on < date_from.isoformat()) or (date_to and created_on > date_to.isoformat()):
+                    continue
+                games.append(segment.game(i))
+
+        games.sort(key=lambda game: game["created_at"], reverse=True)
+        return games[:limit]
+
+    # --- Archivado ---
+
+    def archive(self, storage: Storage, load_projection: Callable[[str, int], Optional[GameProjection]],
+                older_than_days: float = ARCHIVE_AFTER_DAYS, max_games: int = 500,
+                now: Optional[datetime.datetime] = None) -> dict:
+        """
+        Pasa al archivo los partidos terminados hace más de `older_than_days`
+        (hasta `max_games` por corrida) y los borra del storage.
+        Devuelve {"archived": [ids], "segments": [rutas]}.
+        """
+        if not self.durable:
+            raise ArchiveNotDurableError(
+                "El archivo histórico no es durable: configurar ARCHIVE_BUCKET (o ARCHIVE_DIR en un volumen persistente)"
+            )
+        self.ensure_loaded()
+        if self._bucket_name:
+            # Lo que otra instancia archivó, y lo que una corrida cortada no llegó a subir
+            with self._load_lock:
+                self._open_new(self.sync())
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        cutoff = now - datetime.timedelta(days=older_than_days)
+        candidates = [
+            game for game in storage.list_games(ARCHIVED_STATUSES)
+            if _created_at(game) < cutoff
+        ][-max_games:] # Los más viejos primero (list_games viene del más nuevo al más viejo)
+
+        # Agrupar por partición; los que ya están archivados (corrida cortada) sólo se borran
+        partitions: Dict[tuple, List[tuple]] = {}
+        already_archived = []
+        for game in candidates:
+            if self.contains(game["id"]):
+                already_archived.append(game["id"])
+                continue
+            projection = load_projection(game["id"], game.get("event_seq", 0))
+            if projection is None:
+                continue
+            key = (category_key(game), _created_at(game).strftime("%Y-%m"))
+            partitions.setdefault(key, []).append((game, projection))
+
+        stamp = now.strftime("%Y%m%dT%H%M%S") + "-" + secrets.token_hex(3)
+        segment_paths = []
+        archived = list(already_archived)
+        for (category, month), items in sorted(partitions.items()):
+            path = os.path.join(self._directory, category, month, f"{stamp}.vcol")
+            write_segment(path, {"category": category, "month": month},
+                          [game for game, _ in items], [projection for _, projection in items])
+            if self._bucket_name:
+                self._upload(path)
+            with self._lock:
+                self._add(ArchiveSegment(path))
+            segment_paths.append(path)
+            archived.extend(game["id"] for game, _ in items)
+
+        # Recién con los archivos en disco (y en el bucket) se borra del storage en vivo
+        for game_id in archived:
+            storage.delete_game(game_id)
+        return {"archived": archived, "segments": segment_paths}
@@ -0,0 +1,145 @@
+# auth.py
+"""
+Sesiones firmadas (sin estado en el servidor).
+
+El token de la cookie es `payload.firma`:
+* payload: JSON en base64url con el usuario, el rol y el vencimiento.
+  Los planilleros ("scorer") además llevan la lista de partidos que
+  pueden manejar.
+* firma: HMAC-SHA256 del payload con SESSION_SECRET.
+
+Verificar un token no lee nada del storage, así que cualquier worker puede
+atender a cualquier manager (sólo tienen que compartir SESSION_SECRET). Los
+tokens ya verificados se guardan en un cache chico: en el camino caliente
+(/increment) la verificación es un lookup en un dict más la comparación
+del vencimiento.
+"""
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(3600 * 12))) # 12 horas
+
+ROLE_MANAGER = "manager"
+ROLE_SCORER = "scorer"
+
+
+def _load_secret() -> bytes:
+    secret = os.environ.get("SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    # Sin secreto configurado, uno al azar: las sesiones no sobreviven a un reinicio
+    # y no sirven entre workers. Para Cloud Run hay que definir SESSION_SECRET.
+    print("SESSION_SECRET no está definido: se usa uno aleatorio (sólo para desarrollo).")
+    return secrets.token_bytes(32)
+
+
+def load_accounts() -> Dict[str, str]:
+    """
+    Cuentas de manager desde MANAGER_ACCOUNTS ("usuario:clave,usuario2:clave2").
+    Sin la variable, queda la cuenta de siempre.
+    """
+    raw = os.environ.get("MANAGER_ACCOUNTS")
+    if not raw:
+        return {"manager": "voley123"} # ¡Recuerda cambiar esto!
+    accounts = {}
+    for entry in raw.split(","):
+        username, _, password = entry.strip().partition(":")
+        if username and password:
+            accounts[username] = password
+    return accounts
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class Session:
+    """Quién hizo el pedido (sale del token, no del storage)."""
+
+    __slots__ = ("username", "role", "games", "expires_at")
+
+    def __init__(self, username: str, role: str, games: Optional[List[str]], expires_at: int):
+        self.username = username
+        self.role = role
+        self.games = frozenset(games) if games is not None else None
+        self.expires_at = expires_at
+
+    @property
+    def is_manager(self) -> bool:
+        return self.role == ROLE_MANAGER
+
+    def can_score(self, game_id: str) -> bool:
+        """Los managers manejan cualquier partido; los planilleros, sólo los suyos."""
+        return self.is_manager or (self.games is not None and game_id in self.games)
+
+
+class SessionSigner:
+
+    def __init__(self, secret: Optional[bytes] = None, ttl_seconds: int = SESSION_TTL_SECONDS,
+                 cache_size: int = 4096):
+        self._secret = secret if secret is not None else _load_secret()
+        self._ttl = ttl_seconds
+        self._cache_size = cache_size
+        self._verified: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest()
+        return _b64encode(digest)
+
+    def issue(self, username: str, role: str = ROLE_MANAGER, games: Optional[List[str]] = None,
+              ttl_seconds: Optional[int] = None) -> Tuple[str, int]:
+        """Devuelve (token, vencimiento en epoch)."""
+        expires_at = int(time.time()) + (ttl_seconds or self._ttl)
+        claims = {"sub": username, "role": role, "exp": expires_at,
+                  # Nonce: dos logins en el mismo segundo no dan el mismo token
+                  "n": secrets.token_hex(4)}
+        if games is not None:
+            claims["games"] = list(games)
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}", expires_at
+
+    def verify(self, token: Optional[str]) -> Optional[Session]:
+        """La sesión del token, o None si falta, está mal firmado o venció."""
+        if not token:
+            return None
+        now = time.time()
+
+        with self._lock:
+            session = self._verified.get(token)
+        if session is not None:
+            if session.expires_at > now:
+                return session
+            with self._lock:
+                self._verified.pop(token, None)
+            return None
+
+        payload, _, signature = token.partition(".")
+        if not signature or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+            session = Session(claims["sub"], claims["role"], claims.get("games"), int(claims["exp"]))
+        except (ValueError, KeyError, TypeError):
+            return None
+        if session.expires_at <= now:
+            return None
+
+        with self._lock:
+            self._verified[token] = session
+            while len(self._verified) > self._cache_size:
+                self._verified.popitem(last=False)
+        return session
@@ -0,0 +1,91 @@
+# benchmarks/analytics_bench.py
+"""
+Tiempo de las estadísticas (analytics.py) sobre una temporada sintética:
+
+* frío: todos los partidos se calculan desde cero,
+* caliente: nada cambió, sale todo del cache,
+* incremental: un punto nuevo en un partido en vivo (se recalcula sólo ese set).
+
+    python benchmarks/analytics_bench.py --games 2000 --sets 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from event_log import GameProjection, new_event
+from analytics import MatchAnalytics
+
+
+def synthetic_projection(rng: random.Random, n_sets: int, start: datetime.datetime) -> GameProjection:
+    projection = GameProjection("t1", "t2")
+    seq = 0
+    timestamp = start
+    for set_number in range(1, n_sets + 1):
+        score = [0, 0]
+        while max(score) < 25 or abs(score[0] - score[1]) < 2:
+            winner = 0 if rng.random() < 0.5 else 1
+            score[winner] += 1
+            seq += 1
+            timestamp += datetime.timedelta(seconds=rng.uniform(10, 40))
+            projection.apply(new_event(seq, "point", set_number, ("t1", "t2")[winner], timestamp))
+        seq += 1
+        projection.apply(new_event(seq, "finish_set", set_number, "t1" if score[0] > score[1] else "t2", timestamp))
+    return projection
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--sets", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = datetime.datetime(2025, 3, 1, tzinfo=datetime.timezone.utc)
+    projections = {f"g{i}": synthetic_projection(rng, args.sets, start) for i in range(args.games)}
+    games = [{"id": game_id, "event_seq": p.seq} for game_id, p in projections.items()]
+    points = sum(len(s["points"]) for p in projections.values() for s in p.sets.values())
+
+    analytics = MatchAnalytics(max_games=args.games * 2, tournament_ttl=0)
+    load = lambda game_id, event_seq: projections[game_id]
+
+    t0 = time.perf_counter()
+    analytics.tournament_stats("bench", "Bench", lambda: games, load)
+    cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    analytics.tournament_stats("bench", "Bench", lambda: games, load)
+    warm = time.perf_counter() - t0
+
+    # Un punto más en un partido: el set en juego se recalcula, el resto sale del cache
+    live = projections["g0"]
+    live.apply(new_event(live.seq + 1, "point", live.current_set_number, "t1", start))
+    games[0]["event_seq"] = live.seq
+    t0 = time.perf_counter()
+    analytics.tournament_stats("bench", "Bench", lambda: games, load)
+    incremental = time.perf_counter() - t0
+
+    results = {
+        "games": args.games, "points": points,
+        "cold_ms": round(cold * 1000, 1),
+        "warm_ms": round(warm * 1000, 1),
+        "incremental_ms": round(incremental * 1000, 1),
+    }
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{args.games} partidos, {points} puntos")
+        print(f"  frío          {results['cold_ms']:>8} ms")
+        print(f"  caliente      {results['warm_ms']:>8} ms")
+        print(f"  incremental   {results['incremental_ms']:>8} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
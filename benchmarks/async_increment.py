@@ -0,0 +1,136 @@
+# benchmarks/async_increment.py
+"""
+Requests/seg de POST /increment concurrentes: endpoint async (actual) contra
+el modelo anterior (un `def` sync que corre en el threadpool de uvicorn).
+
+Corre todo en proceso con el motor en memoria. Con --latency-ms > 0 cada
+llamada al storage duerme ese tiempo, simulando el round trip a Firestore.
+
+    python benchmarks/async_increment.py --requests 2000 --concurrency 200 --latency-ms 20
+
+Necesita httpx (pip install httpx).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage as storage_module
+from storage import MemoryStorage
+
+
+class LatencyStorage(MemoryStorage):
+    """MemoryStorage que bloquea el thread como lo haría un cliente remoto."""
+
+    blocking = True
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self._latency = latency
+
+    def get_game_versioned(self, game_id):
+        time.sleep(self._latency)
+        return super().get_game_versioned(game_id)
+
+    def write_game_if_version(self, game_id, version, fn):
+        time.sleep(self._latency)
+        return super().write_game_if_version(game_id, version, fn)
+
+    def run_game_transaction(self, game_id, fn):
+        time.sleep(self._latency)
+        return super().run_game_transaction(game_id, fn)
+
+
+def build_app(latency: float):
+    bench_storage = LatencyStorage(latency) if latency > 0 else MemoryStorage()
+    storage_module.create_storage = lambda backend=None: bench_storage
+
+    import main
+    from models import PointCreate
+
+    def sync_increment(game_id: str, point: PointCreate):
+        # Así era el endpoint antes: `def` + llamadas bloqueantes
+        return main.apply_points(game_id, [point])[0]
+
+    main.app.add_api_route("/bench/sync/{game_id}/increment", sync_increment, methods=["POST"])
+    return main, bench_storage
+
+
+def seed_games(bench_storage, count: int):
+    import datetime
+    bench_storage.put_team("t1", {"name": "Equipo 1"})
+    bench_storage.put_team("t2", {"name": "Equipo 2"})
+    game_ids = []
+    for _ in range(count):
+        game_ids.append(bench_storage.create_game({
+            "team1_id": "t1", "team2_id": "t2", "team1_name": "Equipo 1", "team2_name": "Equipo 2",
+            "status": "live", "created_at": datetime.datetime.now(datetime.timezone.utc),
+            "current_set_number": 1, "current_team1_score": 0, "current_team2_score": 0
+        }, {"set_number": 1, "status": "live", "team1_current_score": 0, "team2_current_score": 0}))
+    return game_ids
+
+
+async def run_load(main, url_template: str, game_ids, total: int, concurrency: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    token, _ = main.sessions.issue("manager")
+    cookies = {main.COOKIE_NAME: token}
+    counter = iter(range(total))
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                game_id = game_ids[i % len(game_ids)]
+                response = await client.post(
+                    url_template.format(game_id=game_id),
+                    json={"set_number": 1, "scoring_team_id": "t1"}
+                )
+                if response.status_code >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {"requests": total, "errors": errors, "seconds": round(elapsed, 3),
+            "req_per_sec": round(total / elapsed, 1)}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--games", type=int, default=200, help="Partidos distintos (evita contención)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latencia simulada por llamada al storage")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    main, bench_storage = build_app(args.latency_ms / 1000)
+    game_ids = seed_games(bench_storage, args.games)
+
+    results = {
+        "before_sync_threadpool": asyncio.run(run_load(
+            main, "/bench/sync/{game_id}/increment", game_ids, args.requests, args.concurrency
+        )),
+        "after_async": asyncio.run(run_load(
+            main, "/manager/games/{game_id}/increment", game_ids, args.requests, args.concurrency
+        )),
+    }
+
+    if args.json:
+        print(json.dumps({"latency_ms": args.latency_ms, "concurrency": args.concurrency, **results}))
+    else:
+        print(f"latencia simulada: {args.latency_ms} ms, concurrencia: {args.concurrency}")
+        for name, result in results.items():
+            print(f"  {name:<24} {result['req_per_sec']:>9} req/s  ({result['errors']} errores)")
+
+
+if __name__ == "__main__":
+    main_cli()
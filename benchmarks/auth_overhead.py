@@ -0,0 +1,79 @@
+# benchmarks/auth_overhead.py
+"""
+Costo por pedido de verificar la sesión (auth.py), en microsegundos:
+
+* verify (cache): token ya visto, el caso normal en /increment.
+* verify (sin cache): primera vez que llega el token (HMAC + JSON).
+* dependencia completa: get_game_user de main.py con un Request armado
+  (leer la cookie + verify + chequeo del partido).
+
+    python benchmarks/auth_overhead.py --iterations 200000
+"""
+import os
+import sys
+import json
+import time
+import contextlib
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.setdefault("SESSION_SECRET", "benchmark")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from auth import SessionSigner, ROLE_SCORER
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - start) / iterations * 1e6, 3)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    signer = SessionSigner(b"benchmark")
+    token, _ = signer.issue("planillero", ROLE_SCORER, ["game-1"])
+    signer.verify(token)
+    uncached = SessionSigner(b"benchmark", cache_size=0)
+
+    from starlette.requests import Request
+    with contextlib.redirect_stdout(sys.stderr):
+        import main
+    main.sessions = signer
+    request = Request({
+        "type": "http", "method": "POST", "path": "/manager/games/game-1/increment",
+        "headers": [(b"cookie", f"{main.COOKIE_NAME}={token}".encode())],
+    })
+
+    def dependency():
+        # Sin pasar por el event loop en cada vuelta: sólo el cuerpo de la dependencia
+        coroutine = main.get_game_user("game-1", request)
+        try:
+            coroutine.send(None)
+        except StopIteration:
+            pass
+
+    results = {
+        "iterations": args.iterations,
+        "verify_cached_us": per_call_us(lambda: signer.verify(token), args.iterations),
+        "verify_uncached_us": per_call_us(lambda: uncached.verify(token), args.iterations),
+        "dependency_us": per_call_us(dependency, args.iterations),
+    }
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{args.iterations} iteraciones")
+        print(f"  verify (cache)          {results['verify_cached_us']:>8} µs")
+        print(f"  verify (sin cache)      {results['verify_uncached_us']:>8} µs")
+        print(f"  dependencia completa    {results['dependency_us']:>8} µs")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,335 @@
+# benchmarks/load_test.py
+"""
+Prueba de carga de la API de planillero: N partidos con su planillero
+tocando puntos a ritmo de rally, M espectadores por SSE y algunos que
+consultan el lobby. Reporta por endpoint: pedidos, errores, req/s y
+latencias p50/p95/p99, más los reintentos de escritura del storage.
+
+Por defecto levanta la app en este mismo proceso (uvicorn en un thread)
+contra el motor en memoria. Con --backend sqlite/firestore usa ese motor
+(para Firestore, exportar FIRESTORE_EMULATOR_HOST apunta al emulador).
+Con --base-url se prueba un servidor ya levantado; ahí no hay conteo de
+reintentos porque el storage está en otro proceso.
+
+    python benchmarks/load_test.py --games 20 --spectators 100 --duration 30
+    python benchmarks/load_test.py --json --output resultados.json
+
+Con --base-url, --points-per-set tiene que coincidir con las reglas del
+servidor (GAME_RULES): el set lo cierra el servidor con el último punto.
+
+Necesita httpx (pip install httpx).
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import contextlib
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage as storage_module
+from storage import MemoryStorage, StaleGameError
+
+from async_increment import LatencyStorage
+
+
+TEAM1, TEAM2 = "bench_a", "bench_b"
+
+
+# --- Métricas ---
+
+def percentile(sorted_values, p: float) -> float:
+    """Percentil por rango más cercano (sorted_values ya ordenado)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list) # endpoint -> [segundos]
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    async def call(self, endpoint: str, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "count": len(values),
+                "errors": self.errors[endpoint],
+                "req_per_sec": round(len(values) / elapsed, 1),
+                "mean_ms": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+                "p50_ms": round(1000 * percentile(values, 50), 2),
+                "p95_ms": round(1000 * percentile(values, 95), 2),
+                "p99_ms": round(1000 * percentile(values, 99), 2),
+                "max_ms": round(1000 * values[-1], 2) if values else 0.0,
+            }
+        return endpoints
+
+
+def instrument_storage(bench_storage, counters):
+    """Cuenta escrituras condicionales rechazadas y reintentos de transacción."""
+    write_game_if_version = bench_storage.write_game_if_version
+    run_game_transaction = bench_storage.run_game_transaction
+
+    def counted_write(game_id, version, fn):
+        try:
+            return write_game_if_version(game_id, version, fn)
+        except StaleGameError:
+            counters["stale_writes"] += 1
+            raise
+
+    def counted_transaction(game_id, fn):
+        counters["transactions"] += 1
+
+        def attempt(transaction):
+            # Firestore vuelve a llamar a fn en cada reintento
+            counters["transaction_attempts"] += 1
+            return fn(transaction)
+
+        return run_game_transaction(game_id, attempt)
+
+    bench_storage.write_game_if_version = counted_write
+    bench_storage.run_game_transaction = counted_transaction
+
+
+# --- Servidor en proceso ---
+
+def start_local_server(backend: str, latency: float, points_per_set: int):
+    # Las reglas del servidor tienen que coincidir con las del planillero simulado
+    os.environ.setdefault("GAME_RULES", json.dumps({"set_points": points_per_set}))
+    if backend == "memory":
+        bench_storage = LatencyStorage(latency) if latency > 0 else MemoryStorage()
+    else:
+        bench_storage = storage_module.create_storage(backend)
+    bench_storage.put_team(TEAM1, {"name": "Bench A"})
+    bench_storage.put_team(TEAM2, {"name": "Bench B"})
+    storage_module.create_storage = lambda backend=None: bench_storage
+
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", bench_storage, server
+
+
+# --- Simulación ---
+
+def set_over(score, set_number: int, points_per_set: int) -> bool:
+    target = 15 if set_number == 5 else points_per_set
+    return max(score) >= target and abs(score[0] - score[1]) >= 2
+
+
+async def scorekeeper(client, recorder: Recorder, game_id: str, args, deadline: float):
+    """Un planillero: juega el partido completo (o hasta que se acabe el tiempo)."""
+    rng = random.Random(game_id)
+    sets_won = [0, 0]
+    set_number = 1
+
+    while max(sets_won) < 3 and time.monotonic() < deadline:
+        score = [0, 0]
+        while not set_over(score, set_number, args.points_per_set):
+            if time.monotonic() >= deadline:
+                return
+            # Tiempo entre puntos: rally + festejo, con variación
+            await asyncio.sleep(args.rally_ms / 1000 * rng.uniform(0.5, 1.5))
+
+            if sum(score) > 0 and rng.random() < args.undo_rate:
+                response = await recorder.call("POST undo_point", client.post(
+                    f"/manager/games/{game_id}/undo_point"
+                ))
+                if response is not None:
+                    new_scores = response.json()["new_scores"]
+                    score = [new_scores["team1_score"], new_scores["team2_score"]]
+                continue
+
+            team = TEAM1 if rng.random() < 0.5 else TEAM2
+            response = await recorder.call("POST increment", client.post(
+                f"/manager/games/{game_id}/increment",
+                json={"set_number": set_number, "scoring_team_id": team}
+            ))
+            if response is not None:
+                point = response.json()
+                score = [point["team1_score_after"], point["team2_score_after"]]
+
+        # El servidor cierra el set (y el partido) solo, con el último punto (ver rules.py)
+        winner = 0 if score[0] > score[1] else 1
+        sets_won[winner] += 1
+        set_number += 1
+
+
+async def spectator(client, recorder: Recorder, game_id: str, deadline: float):
+    """Un espectador por SSE: cuenta los mensajes que le llegan."""
+    start = time.perf_counter()
+    try:
+        async with client.stream("GET", f"/games/{game_id}/stream", timeout=None) as response:
+            if response.status_code != 200:
+                recorder.errors["GET stream"] += 1
+                return
+            first = True
+            lines = response.aiter_lines()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), timeout=remaining)
+                except (asyncio.TimeoutError, StopAsyncIteration):
+                    return
+                if line.startswith("event:"):
+                    if first:
+                        # Hasta el snapshot inicial
+                        recorder.latencies["GET stream (snapshot)"].append(time.perf_counter() - start)
+                        first = False
+                    recorder.counters["sse_messages"] += 1
+    except Exception:
+        recorder.errors["GET stream"] += 1
+
+
+async def lobby_poller(client, recorder: Recorder, deadline: float, interval: float):
+    etag = None
+    while time.monotonic() < deadline:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = await recorder.call("GET lobby", client.get("/lobby", headers=headers))
+        if response is not None:
+            if response.status_code == 304:
+                recorder.counters["lobby_not_modified"] += 1
+            etag = response.headers.get("etag", etag)
+        await asyncio.sleep(interval)
+
+
+async def run_benchmark(base_url: str, args) -> dict:
+    import httpx
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        login = await client.post("/auth/login", json={"username": args.user, "password": args.password})
+        login.raise_for_status()
+
+        # 1. Fixture: todos los partidos en un solo pedido
+        response = await recorder.call("POST games/bulk", client.post("/manager/games/bulk", json={
+            "games": [{"team1_id": TEAM1, "team2_id": TEAM2} for _ in range(args.games)]
+        }))
+        if response is None:
+            raise SystemExit("No se pudieron crear los partidos (¿existen los equipos bench_a y bench_b?)")
+        game_ids = [r["game_id"] for r in response.json()["results"] if r["ok"]]
+
+        # 2. Planilleros + espectadores + lobby, todos a la vez
+        start = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        tasks = [scorekeeper(client, recorder, game_id, args, deadline) for game_id in game_ids]
+        tasks += [spectator(client, recorder, game_ids[i % len(game_ids)], deadline) for i in range(args.spectators)]
+        tasks += [lobby_poller(client, recorder, deadline, args.lobby_interval) for _ in range(args.lobby_pollers)]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": round(elapsed, 3),
+        "endpoints": recorder.report(elapsed),
+        "spectators": {
+            "connections": args.spectators,
+            "sse_messages": recorder.counters["sse_messages"],
+            "lobby_not_modified": recorder.counters["lobby_not_modified"],
+        },
+    }
+
+
+def print_report(results: dict):
+    config = results["config"]
+    print(f"{config['games']} partidos, {config['spectators']} espectadores, "
+          f"{config['lobby_pollers']} lobby, {results['seconds']} s ({config['backend']})")
+    print(f"  {'endpoint':<24} {'pedidos':>8} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, row in results["endpoints"].items():
+        print(f"  {name:<24} {row['count']:>8} {row['errors']:>5} {row['req_per_sec']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}")
+    print(f"  mensajes SSE: {results['spectators']['sse_messages']}, "
+          f"lobby 304: {results['spectators']['lobby_not_modified']}")
+    if "storage" in results:
+        print("  storage: " + ", ".join(f"{k}={v}" for k, v in results["storage"].items()))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=20, help="Partidos simultáneos (un planillero cada uno)")
+    parser.add_argument("--spectators", type=int, default=100, help="Conexiones SSE, repartidas entre los partidos")
+    parser.add_argument("--lobby-pollers", type=int, default=10, help="Clientes que consultan /lobby")
+    parser.add_argument("--lobby-interval", type=float, default=1.0, help="Segundos entre consultas al lobby")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de carga")
+    parser.add_argument("--rally-ms", type=float, default=200.0, help="Tiempo medio entre puntos de un partido")
+    parser.add_argument("--undo-rate", type=float, default=0.03, help="Probabilidad de deshacer en cada toque")
+    parser.add_argument("--points-per-set", type=int, default=25)
+    parser.add_argument("--backend", choices=["memory", "sqlite", "firestore"], default="memory")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada del motor en memoria")
+    parser.add_argument("--base-url", help="Probar un servidor ya levantado en vez de uno en proceso")
+    parser.add_argument("--user", default="manager")
+    parser.add_argument("--password", default="voley123")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    parser.add_argument("--output", help="Además, guardar el JSON en este archivo")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    bench_storage = None
+    counters = defaultdict(int)
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        # Lo que imprima el arranque va a stderr: stdout queda para el reporte
+        with contextlib.redirect_stdout(sys.stderr):
+            base_url, bench_storage, server = start_local_server(args.backend, args.latency_ms / 1000, args.points_per_set)
+        instrument_storage(bench_storage, counters)
+
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("password", "json", "output")},
+        **asyncio.run(run_benchmark(base_url, args)),
+    }
+    if bench_storage is not None:
+        results["storage"] = {
+            "stale_writes": counters["stale_writes"],
+            "transactions": counters["transactions"],
+            "transaction_retries": counters["transaction_attempts"] - counters["transactions"],
+        }
+        server.should_exit = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,117 @@
+# client_ops.py
+"""
+Operaciones del planillero con clave de idempotencia.
+
+Con el Wi-Fi de la cancha, un POST que se corta puede haber llegado igual y
+el reintento anotaba el punto dos veces. Cada dispositivo genera un
+`client_id` y numera sus operaciones (`client_seq`: 1, 2, 3...) en el orden
+en que las hizo el planillero. El game doc guarda, por cliente, el número de
+la última operación aplicada (`client_seqs`), y esa marca se escribe en la
+misma escritura que aplica la operación (transacción o escritura
+condicional): o se aplican las dos cosas o ninguna.
+
+Como un cliente manda sus operaciones siempre en orden, una con
+client_seq <= la marca ya está aplicada y se descarta sin escribir nada.
+Las operaciones sin client_id/client_seq se aplican siempre, como antes.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from storage import GameTransaction, Storage
+
+
+# Lo devuelve run_client_transaction si la operación ya estaba aplicada
+DUPLICATE_OP = object()
+
+_UNREAD = object()
+
+
+def pending_ops(ops: List[Any], client_seqs: Optional[Dict[str, int]]) -> Tuple[List[Any], Dict[str, int]]:
+    """
+    Separa las operaciones que faltan aplicar (en orden) y devuelve también
+    las marcas nuevas por cliente. `ops` son modelos con client_id/client_seq.
+    """
+    client_seqs = client_seqs or {}
+    marks: Dict[str, int] = {}
+    pending = []
+    for op in ops:
+        if op.client_id is None or op.client_seq is None:
+            pending.append(op)
+            continue
+        last_seq = marks.get(op.client_id, client_seqs.get(op.client_id, 0))
+        if op.client_seq <= last_seq:
+            continue
+        marks[op.client_id] = op.client_seq
+        pending.append(op)
+    return pending, marks
+
+
+def merge_client_seqs(client_seqs: Optional[Dict[str, int]], marks: Dict[str, int]) -> Dict[str, int]:
+    merged = dict(client_seqs or {})
+    merged.update(marks)
+    return merged
+
+
+class ClientOpTransaction(GameTransaction):
+    """
+    Envuelve un GameTransaction (o el writer de write_game_if_version) y
+    agrega las marcas de los clientes a la actualización del game doc, así no
+    hace falta una escritura aparte. Además guarda la lectura del game doc:
+    leerlo de nuevo dentro de la transacción no cuesta otra lectura.
+    """
+
+    def __init__(self, transaction: GameTransaction, marks: Optional[Dict[str, int]] = None,
+                 client_seqs: Optional[Dict[str, int]] = None):
+        self._transaction = transaction
+        self._game = _UNREAD
+        self.marks = marks or {}
+        self.client_seqs = client_seqs # Si es None, se toman del game doc leído
+
+    def get_game(self):
+        if self._game is _UNREAD:
+            self._game = self._transaction.get_game()
+        return self._game
+
+    def get_set(self, set_number):
+        return self._transaction.get_set(set_number)
+
+    def update_game(self, fields):
+        if self.marks:
+            if self.client_seqs is None:
+                game_data = self._game if self._game is not _UNREAD else None
+                self.client_seqs = (game_data or {}).get("client_seqs")
+            self.client_seqs = merge_client_seqs(self.client_seqs, self.marks)
+            fields = dict(fields, client_seqs=self.client_seqs)
+        self._transaction.update_game(fields)
+
+    def update_set(self, set_number, fields):
+        self._transaction.update_set(set_number, fields)
+
+    def create_set(self, set_number, data):
+        self._transaction.create_set(set_number, data)
+
+    def delete_set(self, set_number):
+        self._transaction.delete_set(set_number)
+
+    def append_event(self, event):
+        self._transaction.append_event(event)
+
+
+def run_client_transaction(storage: Storage, game_id: str, op: Any,
+                           fn: Callable[[GameTransaction], Any]) -> Any:
+    """
+    storage.run_game_transaction aplicando `op` una sola vez. Devuelve
+    DUPLICATE_OP, sin escribir nada, si el cliente ya la había mandado.
+    """
+    if op is None or op.client_id is None or op.client_seq is None:
+        return storage.run_game_transaction(game_id, fn)
+
+    def in_transaction(transaction):
+        wrapped = ClientOpTransaction(transaction)
+        game_data = wrapped.get_game()
+        pending, marks = pending_ops([op], (game_data or {}).get("client_seqs"))
+        if not pending:
+            return DUPLICATE_OP
+        wrapped.marks = marks
+        return fn(wrapped)
+
+    return storage.run_game_transaction(game_id, in_transaction)
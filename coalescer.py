@@ -0,0 +1,73 @@
+# coalescer.py
+"""
+Ventana de agrupamiento (coalescing) para pedidos concurrentes.
+
+Cuando el planillero toca rápido, varios POST /increment del mismo partido
+llegan casi juntos. El primero que llega abre una ventana de unos pocos
+milisegundos; los que llegan durante la ventana se suman al mismo grupo y
+se aplican todos con una sola escritura. Cada pedido recibe su propio
+resultado.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+class _Group:
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class Coalescer:
+    """
+    `flush_fn(key, items)` es async, recibe los items en orden de llegada y
+    devuelve una lista de resultados del mismo largo.
+    """
+
+    def __init__(self, window_seconds: float,
+                 flush_fn: Callable[[str, List[Any]], Awaitable[List[Any]]],
+                 max_items: int = 50):
+        self._window = window_seconds
+        self._flush_fn = flush_fn
+        self._max_items = max_items
+        self._open: Dict[str, _Group] = {}
+
+    async def submit(self, key: str, item: Any) -> Any:
+        # Todo esto corre en el event loop: no hace falta lock
+        group = self._open.get(key)
+        if group is None:
+            group = self._open[key] = _Group()
+            # La ventana y la escritura van en una tarea aparte (como en MicroCache): si el
+            # pedido que abrió el grupo se corta, los demás igual reciben su resultado
+            task = asyncio.ensure_future(self._flush(key, group))
+            # Que un error sin nadie esperando no quede como "exception was never retrieved"
+            for future in (task, group.future):
+                future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        index = len(group.items)
+        group.items.append(item)
+        if len(group.items) >= self._max_items:
+            # Grupo lleno: los siguientes abren uno nuevo
+            self._open.pop(key, None)
+
+        results = await asyncio.shield(group.future)
+        return results[index]
+
+    async def _flush(self, key: str, group: _Group):
+        try:
+            await asyncio.sleep(self._window)
+            if self._open.get(key) is group:
+                self._open.pop(key)
+            group.future.set_result(await self._flush_fn(key, list(group.items)))
+        except BaseException as e:
+            # Pase lo que pase (también si cancelan la tarea), nadie del grupo se queda
+            # esperando y nadie más se suma a un grupo que no se va a escribir
+            if self._open.get(key) is group:
+                self._open.pop(key)
+            if not group.future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    group.future.cancel()
+                else:
+                    group.future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
@@ -0,0 +1,355 @@
+# event_log.py
+"""
+Log de eventos por partido.
+
+Cada partido tiene un log append-only en `games/{id}/events/{seq}` con los
+eventos: point, undo, finish_set, cancel_set, finish_game, cancel_game,
+reopen_set y reopen_game (deshacer el punto que cerró un set o el partido).
+El log es la fuente de verdad; el game doc es la proyección "en vivo" que
+necesita el lobby (score actual, sets ganados, status) y guarda `event_seq`,
+el último evento aplicado.
+
+`GameProjection` reconstruye el partido completo (todos los sets con sus
+puntos) aplicando los eventos en orden. Cada SNAPSHOT_EVERY eventos se
+guarda un snapshot compactado, así reconstruir cuesta un snapshot más la
+cola de eventos posteriores, y no el partido entero.
+
+Los partidos creados antes del log (sin `event_log` en el game doc) tienen
+su historia en `sets/{n}/points`: `initial_projection` la convierte una vez
+en el snapshot de seq 0, y de ahí en más se reconstruyen como los demás.
+"""
+import os
+import copy
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from storage import Storage
+
+
+SNAPSHOT_EVERY = int(os.environ.get("EVENT_SNAPSHOT_EVERY", "50"))
+
+
+def new_event(seq: int, event_type: str, set_number: Optional[int] = None,
+              team_id: Optional[str] = None,
+              timestamp: Optional[datetime.datetime] = None) -> dict:
+    return {
+        "seq": seq,
+        "type": event_type,
+        "timestamp": timestamp or datetime.datetime.now(datetime.timezone.utc),
+        "set_number": set_number,
+        "team_id": team_id,
+    }
+
+
+def _new_set(set_number: int) -> dict:
+    return {"set_number": set_number, "status": "live", "winner_id": None, "points": []}
+
+
+class GameProjection:
+    """Estado del partido derivado del log de eventos."""
+
+    def __init__(self, team1_id: str, team2_id: str):
+        self.team1_id = team1_id
+        self.team2_id = team2_id
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.timestamp: Optional[datetime.datetime] = None # Del último evento aplicado
+        # Eventos 'point' aplicados (los deshechos también cuentan: es la
+        # posición en el log, ver replay.py). None: snapshot viejo, sin contar
+        self.point_events: Optional[int] = 0
+        self.status = "upcoming"
+        self.winner_id: Optional[str] = None
+        self.current_set_number = 1
+        self.team1_sets_won = 0
+        self.team2_sets_won = 0
+        self.sets: Dict[int, dict] = {1: _new_set(1)}
+
+    # --- Lectura ---
+
+    def set_points(self, set_number: int) -> List[dict]:
+        game_set = self.sets.get(set_number)
+        return game_set["points"] if game_set else []
+
+    def scores(self, set_number: int):
+        points = self.set_points(set_number)
+        if not points:
+            return 0, 0
+        return points[-1]["team1_score_after"], points[-1]["team2_score_after"]
+
+    def closed_by_last_point(self) -> Optional[int]:
+        """
+        El set que cerró el último punto del log, si después sólo vino el
+        cierre (del set y, si terminó, del partido): lo que deshace un undo
+        en el set nuevo, todavía vacío. None si no es el caso.
+        """
+        set_number = self.current_set_number - 1
+        game_set = self.sets.get(set_number)
+        if self.set_points(self.current_set_number) or game_set is None or game_set["status"] != "finished":
+            return None
+        if not game_set["points"]:
+            return None
+        closing_events = 2 if self.status == "finished" else 1
+        return set_number if game_set["points"][-1].get("seq") == self.seq - closing_events else None
+
+    # --- Reducer ---
+
+    def apply(self, event: dict):
+        event_type = event["type"]
+        set_number = event.get("set_number") or self.current_set_number
+
+        if event_type == "point":
+            game_set = self.sets.setdefault(set_number, _new_set(set_number))
+            score_t1, score_t2 = self.scores(set_number)
+            if event["team_id"] == self.team1_id:
+                score_t1 += 1
+            else:
+                score_t2 += 1
+            game_set["points"].append({
+                "seq": event["seq"],
+                "timestamp": event["timestamp"],
+                "scoring_team_id": event["team_id"],
+                "team1_score_after": score_t1,
+                "team2_score_after": score_t2,
+            })
+            game_set["status"] = "live"
+            self.current_set_number = set_number
+            self.status = "live"
+            if self.point_events is not None:
+                self.point_events += 1
+
+        elif event_type == "undo":
+            # O(1): sacamos el último punto del set
+            points = self.set_points(set_number)
+            if points:
+                points.pop()
+
+        elif event_type in ("finish_set", "cancel_set"):
+            game_set = self.sets.setdefault(set_number, _new_set(set_number))
+            if event_type == "finish_set":
+                game_set["status"] = "finished"
+                game_set["winner_id"] = event["team_id"]
+                if event["team_id"] == self.team1_id:
+                    self.team1_sets_won += 1
+                else:
+                    self.team2_sets_won += 1
+            else:
+                game_set["status"] = "cancelled"
+            self.current_set_number = set_number + 1
+            self.sets[set_number + 1] = _new_set(set_number + 1)
+
+        elif event_type == "finish_game":
+            self.status = "finished"
+            self.winner_id = event["team_id"]
+
+        elif event_type == "cancel_game":
+            self.status = "cancelled"
+
+        elif event_type == "reopen_game":
+            self.status = "live"
+            self.winner_id = None
+
+        elif event_type == "reopen_set":
+            # Lo contrario de finish_set: el set vuelve a estar en juego y se va el siguiente (vacío)
+            game_set = self.sets[set_number]
+            if game_set["winner_id"] == self.team1_id:
+                self.team1_sets_won -= 1
+            elif game_set["winner_id"] == self.team2_id:
+                self.team2_sets_won -= 1
+            game_set["status"] = "live"
+            game_set["winner_id"] = None
+            next_set = self.sets.get(set_number + 1)
+            if next_set is not None and not next_set["points"]:
+                del self.sets[set_number + 1]
+            self.current_set_number = set_number
+
+        self.seq = event["seq"]
+        self.timestamp = event["timestamp"]
+
+    # --- Snapshots ---
+
+    def to_dict(self) -> dict:
+        return {
+            "seq": self.seq,
+            "timestamp": self.timestamp,
+            "point_events": self.point_events,
+            "team1_id": self.team1_id,
+            "team2_id": self.team2_id,
+            "status": self.status,
+            "winner_id": self.winner_id,
+            "current_set_number": self.current_set_number,
+            "team1_sets_won": self.team1_sets_won,
+            "team2_sets_won": self.team2_sets_won,
+            # Las claves de Firestore tienen que ser strings
+            "sets": {str(n): copy.deepcopy(s) for n, s in self.sets.items()},
+        }
+
+    @classmethod
+    def from_legacy(cls, game_data: dict, sets: List[dict], points: Dict[int, List[dict]],
+                    events: List[dict]) -> "GameProjection":
+        """
+        El partido viejo antes de su primer evento: los sets cerrados y los
+        puntos de `sets/{n}/points` (por número de set). Los cierres que ya
+        están en el log (`events`) no se toman de los docs: se aplican después.
+        """
+        projection = cls(game_data["team1_id"], game_data["team2_id"])
+        logged_sets = {e.get("set_number") for e in events if e["type"] in ("finish_set", "cancel_set", "reopen_set")}
+        logged_game = any(e["type"] in ("finish_game", "cancel_game", "reopen_game") for e in events)
+        projection.timestamp = game_data.get("created_at")
+
+        for set_doc in sorted(sets, key=lambda s: s["set_number"]):
+            set_number = set_doc["set_number"]
+            game_set = projection.sets.setdefault(set_number, _new_set(set_number))
+            for point in points.get(set_number, []):
+                game_set["points"].append({
+                    "seq": None, # Anterior al log
+                    "timestamp": point["timestamp"],
+                    "scoring_team_id": point["scoring_team_id"],
+                    "team1_score_after": point["team1_score_after"],
+                    "team2_score_after": point["team2_score_after"],
+                })
+                projection.timestamp = point["timestamp"]
+            projection.point_events += len(game_set["points"])
+            projection.current_set_number = set_number
+            if set_doc.get("status") not in ("finished", "cancelled") or set_number in logged_sets:
+                break # El set que se estaba jugando: los siguientes ya son del log
+
+            game_set["status"] = set_doc["status"]
+            if set_doc["status"] == "finished":
+                game_set["winner_id"] = set_doc.get("winner_id")
+                if game_set["winner_id"] == projection.team1_id:
+                    projection.team1_sets_won += 1
+                elif game_set["winner_id"] == projection.team2_id:
+                    projection.team2_sets_won += 1
+            projection.current_set_number = set_number + 1
+            projection.sets.setdefault(set_number + 1, _new_set(set_number + 1))
+
+        if not logged_game and game_data.get("status") in ("finished", "cancelled"):
+            projection.status = game_data["status"]
+            projection.winner_id = game_data.get("winner_id")
+        elif projection.point_events or projection.current_set_number > 1:
+            projection.status = "live"
+        return projection
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GameProjection":
+        projection = cls(data["team1_id"], data["team2_id"])
+        projection.seq = data["seq"]
+        projection.snapshot_seq = data["seq"]
+        projection.timestamp = data.get("timestamp")
+        if isinstance(projection.timestamp, str):
+            projection.timestamp = datetime.datetime.fromisoformat(projection.timestamp)
+        projection.point_events = data.get("point_events")
+        projection.status = data["status"]
+        projection.winner_id = data.get("winner_id")
+        projection.current_set_number = data["current_set_number"]
+        projection.team1_sets_won = data.get("team1_sets_won", 0)
+        projection.team2_sets_won = data.get("team2_sets_won", 0)
+        projection.sets = {}
+        for n, game_set in data["sets"].items():
+            game_set = copy.deepcopy(game_set)
+            for point in game_set["points"]:
+                if isinstance(point["timestamp"], str):
+                    point["timestamp"] = datetime.datetime.fromisoformat(point["timestamp"])
+            projection.sets[int(n)] = game_set
+        return projection
+
+
+def initial_projection(storage: Storage, game_id: str, game_data: dict) -> GameProjection:
+    """
+    El partido antes del primer evento del log: vacío, salvo en los partidos
+    viejos, que traen lo jugado antes del log. Esa historia se lee una sola
+    vez y queda como snapshot en seq 0.
+    """
+    if game_data.get("event_log"):
+        return GameProjection(game_data["team1_id"], game_data["team2_id"])
+    snapshot = storage.get_latest_snapshot(game_id, max_seq=0)
+    if snapshot is not None:
+        return GameProjection.from_dict(snapshot)
+
+    sets = storage.list_sets(game_id)
+    points = {s["set_number"]: storage.list_legacy_points(game_id, s["set_number"]) for s in sets}
+    projection = GameProjection.from_legacy(game_data, sets, points, storage.list_events(game_id))
+    storage.put_snapshot(game_id, 0, projection.to_dict())
+    return projection
+
+
+class ProjectionStore:
+    """
+    Proyecciones en memoria, al día con el log. Si la proyección cacheada ya
+    está en el `event_seq` del game doc, no se lee nada (undo en O(1)).
+    """
+
+    def __init__(self, storage: Storage, snapshot_every: int = SNAPSHOT_EVERY, max_games: int = 256):
+        self._storage = storage
+        self._snapshot_every = snapshot_every
+        self._max_games = max_games
+        self._projections: "OrderedDict[str, GameProjection]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, game_id: str, upto_seq: Optional[int] = None) -> Optional[GameProjection]:
+        """
+        Proyección del partido. Con `upto_seq` (el event_seq del game doc) se
+        evita consultar el log si ya estamos al día.
+        """
+        with self._lock:
+            projection = self._projections.get(game_id)
+            if projection is not None and upto_seq is not None:
+                if projection.seq == upto_seq:
+                    self._projections.move_to_end(game_id)
+                    return projection
+                if projection.seq > upto_seq:
+                    # Vamos adelantados respecto de quien pregunta: reconstruimos
+                    projection = None
+
+        if projection is None:
+            snapshot = self._storage.get_latest_snapshot(game_id, max_seq=upto_seq)
+            if snapshot is not None:
+                projection = GameProjection.from_dict(snapshot)
+            else:
+                game_data = self._storage.get_game(game_id)
+                if game_data is None:
+                    return None
+                projection = initial_projection(self._storage, game_id, game_data)
+
+        with self._lock:
+            for event in self._storage.list_events(game_id, after_seq=projection.seq):
+                if upto_seq is not None and event["seq"] > upto_seq:
+                    break
+                projection.apply(event)
+            self._maybe_snapshot(game_id, projection)
+            cached = self._projections.get(game_id)
+            # Una reconstrucción hasta un upto_seq viejo no pisa una proyección más nueva
+            if cached is None or cached.seq <= projection.seq:
+                self._put(game_id, projection)
+        return projection
+
+    def record(self, game_id: str, events: List[dict]):
+        """Write-through: aplica eventos recién escritos si la proyección está al día."""
+        with self._lock:
+            projection = self._projections.get(game_id)
+            if projection is None:
+                return
+            if projection.seq != events[0]["seq"] - 1:
+                # Nos perdimos eventos (otro proceso): que se reconstruya al pedirla
+                del self._projections[game_id]
+                return
+            for event in events:
+                projection.apply(event)
+            self._maybe_snapshot(game_id, projection)
+
+    def invalidate(self, game_id: str):
+        with self._lock:
+            self._projections.pop(game_id, None)
+
+    def _maybe_snapshot(self, game_id: str, projection: GameProjection):
+        if projection.seq - projection.snapshot_seq >= self._snapshot_every:
+            self._storage.put_snapshot(game_id, projection.seq, projection.to_dict())
+            projection.snapshot_seq = projection.seq
+
+    def _put(self, game_id: str, projection: GameProjection):
+        self._projections[game_id] = projection
+        self._projections.move_to_end(game_id)
+        while len(self._projections) > self._max_games:
+            self._projections.popitem(last=False)
@@ -0,0 +1,60 @@
+# game_cache.py
+"""
+Cache en memoria del estado en vivo de cada partido.
+
+increment_score sólo necesita saber los IDs de los equipos, el set actual y
+el score; con esto evitamos leer el game doc y el set doc en cada punto.
+El cache es write-through: después de cada punto guardamos el estado nuevo
+junto con la versión que devolvió el storage. Si otro proceso escribió el
+partido, la escritura condicional falla (StaleGameError), el llamador
+invalida la entrada y se vuelve a leer.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from models import LiveGameState
+from storage import Storage
+
+
+class GameStateCache:
+
+    def __init__(self, storage: Storage, max_games: int = 512):
+        self._storage = storage
+        self._max_games = max_games
+        self._states: "OrderedDict[str, LiveGameState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, game_id: str) -> Optional[LiveGameState]:
+        """Devuelve el estado cacheado; si no está, lo lee del storage (1 lectura)."""
+        with self._lock:
+            state = self._states.get(game_id)
+            if state is not None:
+                self._states.move_to_end(game_id)
+                return state
+
+        game_data, version = self._storage.get_game_versioned(game_id)
+        if game_data is None:
+            return None
+
+        state = LiveGameState(**game_data)
+        state.revision = game_data.get("version", 0)
+        state.version = version
+        self.put(game_id, state)
+        return state
+
+    def put(self, game_id: str, state: LiveGameState):
+        with self._lock:
+            self._states[game_id] = state
+            self._states.move_to_end(game_id)
+            # LRU: en un torneo hay pocos partidos en vivo a la vez
+            while len(self._states) > self._max_games:
+                self._states.popitem(last=False)
+
+    def invalidate(self, game_id: str):
+        with self._lock:
+            self._states.pop(game_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
@@ -0,0 +1,143 @@
+# game_writer.py
+"""
+Un solo escritor por partido.
+
+Dos toques casi juntos (o dos dispositivos del planillero) sobre el mismo
+partido competían por el mismo game doc: escrituras condicionales que
+fallaban (StaleGameError) y transacciones de Firestore que se reintentaban.
+Ahora cada partido tiene un escritor: una tarea asyncio con un buzón
+ordenado. Todas las escrituras del partido pasan por ahí y se aplican de a
+una, en orden de llegada, así que dentro del proceso nunca se pisan.
+
+Mientras una escritura está en vuelo, los puntos que llegan se juntan en el
+buzón y se aplican todos en la siguiente escritura (sin ventana de espera:
+cuanto más lento el storage, más grande la tanda). El escritor termina solo
+después de un rato sin trabajo.
+
+Con varios procesos, cada partido tiene que ir siempre al mismo: con
+GAME_WORKERS (las URLs de los procesos, en orden) y WORKER_INDEX (el de
+este), game_worker() elige el dueño con un hash estable del game_id y los
+pedidos que llegan a otro proceso se redirigen (307) al dueño. Detrás de un
+balanceador, lo mismo se logra con un hash por game_id (ver README).
+"""
+import os
+import zlib
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+GAME_WORKERS = [url.rstrip("/") for url in os.environ.get("GAME_WORKERS", "").split(",") if url.strip()]
+WORKER_INDEX = int(os.environ.get("WORKER_INDEX", "0"))
+
+
+def game_worker(game_id: str, workers: int = None) -> int:
+    """Índice del proceso dueño del partido (estable entre procesos y reinicios)."""
+    workers = len(GAME_WORKERS) if workers is None else workers
+    if workers <= 1:
+        return 0
+    return zlib.crc32(game_id.encode("utf-8")) % workers
+
+
+def game_owner_url(game_id: str) -> Optional[str]:
+    """URL base del dueño del partido si no es este proceso; None si es este."""
+    if len(GAME_WORKERS) <= 1:
+        return None
+    index = game_worker(game_id)
+    return None if index == WORKER_INDEX else GAME_WORKERS[index]
+
+
+class _Message:
+
+    __slots__ = ("point", "job", "future")
+
+    def __init__(self, point: Any = None, job: Callable[[], Awaitable[Any]] = None):
+        self.point = point
+        self.job = job
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class _Writer:
+
+    __slots__ = ("mailbox", "wakeup", "task")
+
+    def __init__(self):
+        self.mailbox: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class GameWriters:
+    """
+    `flush_points(game_id, points)` es async, recibe una tanda de puntos
+    seguidos del buzón y devuelve un resultado por punto (como el Coalescer).
+    """
+
+    def __init__(self, flush_points: Callable[[str, List[Any]], Awaitable[List[Any]]],
+                 max_points: int = 50, idle_seconds: float = 30.0):
+        self._flush_points = flush_points
+        self._max_points = max_points
+        self._idle = idle_seconds
+        self._writers: Dict[str, _Writer] = {}
+
+    def pending(self) -> int:
+        """Mensajes esperando en todos los buzones."""
+        return sum(len(writer.mailbox) for writer in self._writers.values())
+
+    async def submit(self, game_id: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Corre `job()` (una corrutina que escribe el partido) en su turno."""
+        return await self._send(game_id, _Message(job=job))
+
+    async def submit_point(self, game_id: str, point: Any) -> Any:
+        """Un punto: se agrupa con los puntos que estén esperando detrás."""
+        return await self._send(game_id, _Message(point=point))
+
+    async def _send(self, game_id: str, message: _Message) -> Any:
+        # Todo corre en el event loop: no hace falta lock
+        writer = self._writers.get(game_id)
+        # Un escritor de otro event loop (p.ej. otro TestClient) ya no corre
+        if writer is None or writer.task.done() or writer.task.get_loop() is not asyncio.get_running_loop():
+            writer = _Writer()
+            self._writers[game_id] = writer
+            writer.task = asyncio.create_task(self._run(game_id, writer))
+        writer.mailbox.append(message)
+        writer.wakeup.set()
+        # Si el pedido se cancela, la escritura igual se hace (ya está en el buzón)
+        return await asyncio.shield(message.future)
+
+    async def _run(self, game_id: str, writer: _Writer):
+        while True:
+            if not writer.mailbox:
+                writer.wakeup.clear()
+                try:
+                    await asyncio.wait_for(writer.wakeup.wait(), self._idle)
+                except asyncio.TimeoutError:
+                    if not writer.mailbox:
+                        self._writers.pop(game_id, None)
+                        return
+                continue
+
+            message = writer.mailbox.popleft()
+            if message.job is not None:
+                await self._deliver([message], message.job)
+                continue
+
+            # Puntos seguidos: una sola escritura para todos
+            batch = [message]
+            while writer.mailbox and writer.mailbox[0].point is not None and len(batch) < self._max_points:
+                batch.append(writer.mailbox.popleft())
+            points = [m.point for m in batch]
+            await self._deliver(batch, lambda: self._flush_points(game_id, points), many=True)
+
+    @staticmethod
+    async def _deliver(messages: List[_Message], job: Callable[[], Awaitable[Any]], many: bool = False):
+        try:
+            result = await job()
+        except Exception as e:
+            for message in messages:
+                if not message.future.done():
+                    message.future.set_exception(e)
+            return
+        for i, message in enumerate(messages):
+            if not message.future.done():
+                message.future.set_result(result[i] if many else result)
@@ -0,0 +1,96 @@
+# listing.py
+"""
+Paginación por cursor y proyección de campos para los listados del manager.
+
+* Cursor: posición opaca (base64 de un JSON) con los valores de orden del
+  último elemento de la página. La página siguiente arranca justo después
+  (keyset), así que pedir la página 50 cuesta lo mismo que pedir la 1 y no
+  se saltean ni repiten elementos si se agregan nuevos mientras tanto.
+* `?fields=id,team1_name,status`: sólo esos campos (el storage los pide así
+  a la base cuando puede). `id` va siempre.
+
+La respuesta sigue siendo una lista JSON, como antes; el cursor de la
+página siguiente viaja en el header `X-Next-Cursor` (y en `Link`), y no
+está si era la última página.
+"""
+import json
+import base64
+import datetime
+from typing import Any, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+MAX_PAGE_SIZE = 1000
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"No se puede serializar {type(value)}")
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), default=_json_default, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """Valores de orden del cursor (lista de `size` elementos). 400 si no es válido."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    return values
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """`?fields=` como lista (sin duplicados, con 'id'). None: todos los campos."""
+    if not fields:
+        return None
+    allowed = set(allowed)
+    requested = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field or field in requested:
+            continue
+        if field not in allowed:
+            raise HTTPException(status_code=400, detail=f"Campo desconocido: {field}")
+        requested.append(field)
+    if "id" not in requested:
+        requested.insert(0, "id")
+    return requested
+
+
+def project(doc: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return doc
+    return {field: doc.get(field) for field in fields}
+
+
+def page_response(request: Request, items: List[dict], next_cursor: Optional[str]) -> Response:
+    body = json.dumps(items, default=_json_default, separators=(",", ":")).encode("utf-8")
+    headers = {}
+    if next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def keyset_page(items: List[dict], limit: Optional[int], key) -> tuple:
+    """
+    Recorta a `limit` una lista pedida con `limit + 1` elementos. Devuelve
+    (página, cursor siguiente o None). Sin `limit`, la lista es entera.
+    """
+    if limit is None or len(items) <= limit:
+        return items, None
+    page = items[:limit]
+    return page, encode_cursor(key(page[-1]))
@@ -0,0 +1,223 @@
+# live_stream.py
+"""
+Marcador en vivo por Server-Sent Events.
+
+En vez de que cada espectador abra su propio listener de Firestore, el
+servidor guarda el último estado de cada partido que alguien está mirando y
+reparte los cambios a todas las conexiones:
+
+* El primer mensaje de cada conexión es un `snapshot` (el game doc completo).
+* Después llegan `delta`s compactos, sólo con los campos que cambiaron
+  (ver COMPACT_FIELDS). Cada mensaje se codifica una sola vez y se comparte.
+* Con frames binarios (ver wire.py) el snapshot va en un frame SNAPSHOT y
+  cada delta en un frame STATE de 14 bytes con el marcador completo.
+* Cada conexión tiene una cola chica. Si un espectador lento la llena, se
+  descartan sus deltas pendientes y recibe un snapshot nuevo (backpressure).
+
+Los cambios llegan por dos lados: el propio camino de escritura de main.py
+(`publish`) y, si el storage lo soporta, un listener upstream por partido
+(`Storage.watch_game`) para enterarse de lo que escriben otros workers.
+La versión del partido evita mandar dos veces el mismo cambio.
+"""
+import json
+import asyncio
+import threading
+from typing import Dict, Optional, Set
+
+import wire
+from models import GameListResponse
+from storage import StorageRunner
+
+
+# Nombre largo en el game doc -> clave corta en los deltas
+COMPACT_FIELDS = {
+    "current_set_number": "s",
+    "current_team1_score": "a",
+    "current_team2_score": "b",
+    "team1_sets_won": "sa",
+    "team2_sets_won": "sb",
+    "status": "st",
+    "winner_id": "w",
+    "version": "v",
+}
+
+RESYNC = object() # Marca en la cola: "mandale un snapshot completo"
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    """Una conexión de espectador."""
+
+    def __init__(self, queue_size: int, binary: bool = False):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.binary = binary # Frames binarios en vez de SSE (ver wire.py)
+
+
+class _GameChannel:
+
+    def __init__(self, game_id: str):
+        self.game_id = game_id
+        self.state: Optional[dict] = None
+        self.snapshot_message: Optional[tuple] = None # (SSE, frame)
+        self.subscribers: Set[Subscriber] = set()
+        self.unwatch = None
+
+    def snapshot(self) -> tuple:
+        if self.snapshot_message is None:
+            game = GameListResponse(**self.state, id=self.game_id)
+            self.snapshot_message = (sse_event("snapshot", game.model_dump_json()), game.to_frame())
+        return self.snapshot_message
+
+
+class LiveHub:
+
+    def __init__(self, runner: StorageRunner, queue_size: int = 16):
+        self._runner = runner
+        self._storage = runner.storage
+        self._queue_size = queue_size
+        self._channels: Dict[str, _GameChannel] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscriber_count(self, game_id: Optional[str] = None) -> int:
+        with self._lock:
+            if game_id is not None:
+                channel = self._channels.get(game_id)
+                return len(channel.subscribers) if channel else 0
+            return sum(len(c.subscribers) for c in self._channels.values())
+
+    # --- Publicación (thread-safe: se llama desde el loop o desde el pool del storage) ---
+
+    def publish(self, game_id: str, fields: dict):
+        """
+        Mezcla `fields` en el estado del partido y reparte el delta.
+        Si nadie está mirando el partido, no hace nada.
+        """
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None or channel.state is None:
+                return
+
+            version = fields.get("version")
+            if version is not None and version <= channel.state.get("version", 0):
+                # Ya lo mandamos (escritura propia + listener upstream)
+                return
+
+            delta = {}
+            for field, value in fields.items():
+                if channel.state.get(field) != value:
+                    channel.state[field] = value
+                    if field in COMPACT_FIELDS:
+                        delta[COMPACT_FIELDS[field]] = value
+            if not delta:
+                return
+
+            channel.snapshot_message = None
+            # Los dos formatos se codifican una sola vez por cambio, para todas las conexiones
+            message = (sse_event("delta", json.dumps(delta, separators=(",", ":"))), wire.state_frame(channel.state))
+            loop = self._loop
+
+        if loop is not None:
+            loop.call_soon_threadsafe(self._fanout, game_id, message)
+
+    def refresh(self, game_id: str):
+        """Relee el partido del storage y publica, sólo si alguien lo está mirando."""
+        if self.subscriber_count(game_id) == 0:
+            return
+        game_data = self._storage.get_game(game_id)
+        if game_data is not None:
+            self.publish(game_id, game_data)
+
+    def _fanout(self, game_id: str, message: tuple):
+        # Corre en el event loop
+        with self._lock:
+            channel = self._channels.get(game_id)
+            subscribers = list(channel.subscribers) if channel else []
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Espectador lento: tiramos lo pendiente y le mandamos un snapshot
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(RESYNC)
+
+    # --- Suscripciones (event loop) ---
+
+    async def subscribe(self, game_id: str, binary: bool = False) -> Optional[Subscriber]:
+        """Devuelve None si el partido no existe."""
+        self._loop = asyncio.get_running_loop()
+
+        with self._lock:
+            channel = self._channels.get(game_id)
+            needs_state = channel is None or channel.state is None
+
+        if needs_state:
+            # Sólo el primer espectador de cada partido paga la lectura
+            game_data = await self._runner.run(self._storage.get_game, game_id)
+            if game_data is None:
+                return None
+
+        subscriber = Subscriber(self._queue_size, binary)
+        with self._lock:
+            channel = self._channels.setdefault(game_id, _GameChannel(game_id))
+            if channel.state is None:
+                channel.state = game_data
+            first = not channel.subscribers
+            channel.subscribers.add(subscriber)
+            subscriber.queue.put_nowait(channel.snapshot())
+
+        if first:
+            # Aparte (y con shield): si el pedido se corta mientras se abre, el listener
+            # igual termina de abrirse y `_watching` decide si queda o se suelta
+            watch = asyncio.ensure_future(self._runner.run(
+                self._storage.watch_game, game_id, lambda data: self.publish(game_id, data)
+            ))
+            watch.add_done_callback(lambda done: self._watching(game_id, channel, done))
+            try:
+                await asyncio.shield(watch)
+            except BaseException:
+                # Sin suscriptor devuelto nadie llamaría a unsubscribe: el canal quedaría colgado
+                self.unsubscribe(game_id, subscriber)
+                raise
+
+        return subscriber
+
+    def _watching(self, game_id: str, channel: _GameChannel, done: asyncio.Future):
+        # Corre en el event loop cuando terminó de abrirse el listener upstream
+        if done.cancelled() or done.exception() is not None:
+            return
+        unwatch = done.result()
+        with self._lock:
+            released = self._channels.get(game_id) is not channel
+            if not released:
+                channel.unwatch = unwatch
+        if released and unwatch is not None:
+            # Se fueron todos mientras se abría: nadie más lo va a soltar
+            unwatch()
+
+    def unsubscribe(self, game_id: str, subscriber: Subscriber):
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if channel.subscribers:
+                return
+            # Último espectador: soltamos el canal y el listener upstream
+            del self._channels[game_id]
+            unwatch = channel.unwatch
+        if unwatch is not None:
+            unwatch()
+
+    async def next_message(self, game_id: str, subscriber: Subscriber):
+        """El próximo mensaje en el formato de la conexión (str SSE o bytes)."""
+        message = await subscriber.queue.get()
+        if message is RESYNC:
+            with self._lock:
+                channel = self._channels.get(game_id)
+                message = channel.snapshot() if channel else ("", b"")
+        return message[1] if subscriber.binary else message[0]
@@ -0,0 +1,171 @@
+# lobby.py
+"""
+Resumen del lobby (vista materializada).
+
+El lobby y la lista del manager necesitan pocos campos de cada partido
+(equipos, banderas, categoría, score y status). En vez de consultar la
+colección `games` en cada pedido, el proceso guarda un resumen chico con
+esos campos y lo actualiza en cada escritura de score o de status.
+
+El resumen tiene una versión que sube con cada cambio. El JSON de cada
+vista se codifica una sola vez por versión y se sirve con un ETag, así un
+cliente que ya lo tiene recibe un 304 sin cuerpo.
+
+Con varios workers cada uno tiene su propio resumen: además de sus propias
+escrituras, se reconstruye desde el storage cada LOBBY_RESYNC_SECONDS.
+"""
+import os
+import json
+import time
+import secrets
+import datetime
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from storage import Storage
+
+
+LOBBY_RESYNC_SECONDS = float(os.environ.get("LOBBY_RESYNC_SECONDS", "30"))
+
+# Los únicos campos del game doc que viajan al lobby
+LOBBY_FIELDS = (
+    "team1_id", "team2_id", "team1_name", "team2_name", "team1_flag", "team2_flag",
+    "category_name", "status", "created_at", "winner_id", "current_set_number",
+    "current_team1_score", "current_team2_score", "team1_sets_won", "team2_sets_won",
+)
+
+# Sin estos no podemos agregar un partido que todavía no está en el resumen
+REQUIRED_FIELDS = ("team1_id", "team2_id", "team1_name", "team2_name", "status", "created_at")
+
+ACTIVE_STATUSES = ["live", "upcoming"]
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"No se puede serializar {type(value)}")
+
+
+class LobbySummary:
+
+    def __init__(self, storage: Storage, finished_limit: int = 10,
+                 resync_seconds: float = LOBBY_RESYNC_SECONDS):
+        self._storage = storage
+        self._finished_limit = finished_limit
+        self._resync_seconds = resync_seconds
+        self._games: Dict[str, dict] = {}
+        self._built_at: Optional[float] = None
+        # El prefijo cambia en cada arranque: un ETag viejo nunca coincide por casualidad
+        self._etag_prefix = secrets.token_hex(4)
+        self._version = 0
+        self._rendered: Dict[str, Tuple[str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    # --- Lectura ---
+
+    def render(self, view: str) -> Tuple[str, bytes]:
+        """
+        Devuelve (etag, cuerpo JSON) de la vista:
+        * "public": {"live": [...], "upcoming": [...], "finished": [...]}
+        * "active": lista de partidos en vivo y próximos (panel del manager)
+        """
+        if self._needs_rebuild():
+            self.rebuild()
+
+        with self._lock:
+            rendered = self._rendered.get(view)
+            if rendered is None:
+                etag = f'"{self._etag_prefix}-{self._version}"'
+                body = json.dumps(self._build_view(view), default=_json_default,
+                                  separators=(",", ":")).encode("utf-8")
+                rendered = (etag, body)
+                self._rendered[view] = rendered
+            return rendered
+
+    def _build_view(self, view: str):
+        games = sorted(self._games.values(), key=lambda g: g["created_at"], reverse=True)
+        if view == "active":
+            return [g for g in games if g["status"] in ACTIVE_STATUSES]
+        return {
+            "live": [g for g in games if g["status"] == "live"],
+            "upcoming": [g for g in games if g["status"] == "upcoming"],
+            "finished": [g for g in games if g["status"] == "finished"],
+        }
+
+    # --- Mantenimiento ---
+
+    def _needs_rebuild(self) -> bool:
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at > self._resync_seconds
+
+    def rebuild(self):
+        """Relee el resumen completo del storage (dos consultas)."""
+        active = self._storage.list_games(ACTIVE_STATUSES)
+        finished = self._storage.list_games(["finished"], limit=self._finished_limit)
+
+        games = {}
+        for game_data in active + finished:
+            games[game_data["id"]] = self._entry(game_data["id"], game_data)
+
+        with self._lock:
+            if games != self._games:
+                self._games = games
+                self._changed()
+            self._built_at = time.monotonic()
+
+    def update(self, game_id: str, fields: dict):
+        """
+        Mezcla `fields` (game doc completo o sólo lo que cambió) en el
+        resumen. Thread-safe; no lee el storage.
+        """
+        with self._lock:
+            if self._built_at is None:
+                return # Todavía nadie pidió el lobby: se arma completo al pedirlo
+
+            entry = self._games.get(game_id)
+            if entry is None:
+                if not all(field in fields for field in REQUIRED_FIELDS):
+                    return # Partido que no conocemos y datos parciales: lo trae el resync
+                entry = {"id": game_id}
+
+            new_entry = dict(entry)
+            new_entry.update((f, fields[f]) for f in LOBBY_FIELDS if f in fields)
+            if new_entry == entry and game_id in self._games:
+                return
+
+            if new_entry["status"] in ACTIVE_STATUSES or new_entry["status"] == "finished":
+                self._games[game_id] = new_entry
+            else:
+                # Anulados no se muestran
+                self._games.pop(game_id, None)
+            self._trim_finished()
+            self._changed()
+
+    def remove(self, game_id: str):
+        with self._lock:
+            if self._games.pop(game_id, None) is not None:
+                self._changed()
+
+    def _trim_finished(self):
+        finished = sorted(
+            (g for g in self._games.values() if g["status"] == "finished"),
+            key=lambda g: g["created_at"], reverse=True
+        )
+        for game in finished[self._finished_limit:]:
+            del self._games[game["id"]]
+
+    def _changed(self):
+        # Siempre con el lock tomado
+        self._version += 1
+        self._rendered.clear()
+
+    @staticmethod
+    def _entry(game_id: str, game_data: dict) -> dict:
+        entry = {"id": game_id}
+        for field in LOBBY_FIELDS:
+            entry[field] = game_data.get(field)
+        return entry
@@ -1,265 +1,648 @@
+# Primero: mide cuánto tarda todo lo que viene después (ver startup.py)
+from startup import startup_report
+
 import os
+import time
+import asyncio
+import hashlib
 import secrets
 import datetime
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
-from typing import List, Optional
-
-# --- Firebase Admin Setup ---
-import firebase_admin
-from firebase_admin import credentials, firestore
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse
+from typing import Dict, List, Optional, Tuple
+from pydantic import TypeAdapter, ValidationError
+
+# --- Storage (Firestore, memoria o SQLite) ---
+from storage import create_storage, StaleGameError, StorageRunner
+from game_cache import GameStateCache
+from coalescer import Coalescer
+from live_stream import LiveHub, sse_event
+from event_log import ProjectionStore, new_event
+from lobby import LobbySummary
+from reference_cache import ReferenceCache
+from metrics import InstrumentedStorage, MetricsMiddleware, metrics
+from auth import SessionSigner, load_accounts, ROLE_MANAGER, ROLE_SCORER
+from static_bundle import StaticBundle, PRIVATE_PAGE_CACHE
+from analytics import MatchAnalytics
+from archive import ArchiveStore, ArchiveNotDurableError, ARCHIVE_AFTER_DAYS, category_key
+from standings import Standings
+from micro_cache import MicroCache
+from replay import GameReplay, replay_state
+from rules import closing_point, game_rules, rules_for_category
+from game_writer import GameWriters, game_owner_url
+from listing import MAX_PAGE_SIZE, decode_cursor, keyset_page, page_response, parse_fields, project
+from wire import FRAME_MEDIA_TYPE, PING_FRAME, score_frame, wants_frames
+from write_behind import WRITE_BEHIND, WRITE_BEHIND_FLUSH_MS, WriteBehindStorage
+from client_ops import ClientOpTransaction, DUPLICATE_OP, merge_client_seqs, pending_ops, run_client_transaction
 
 # --- Importar Modelos ---
 # Importamos todo desde nuestro nuevo archivo models.py
 from models import (
-    Team, Category, GameCreate, GameDocument, SetDocument, PointCreate, PointDocument,
-    GameListResponse, SetFinish, GameFinish, SetCancel,
-    LoginRequest
+    Team, Category, GameCreate, GameDocument, GameListResponse, GameDetail, FixtureCreate, FixtureItemResult, FixtureResponse, SetDocument, PointCreate, PointDocument,
+    SetFinish, GameFinish, SetCancel,
+    PointBatchCreate, PointBatchResponse, GameEvent, ReplayState, LobbyGame, LobbyResponse,
+    GameStats, TournamentStats, StandingsResponse, TeamStanding, ArchivedGame, ArchiveRunResponse, LoginRequest, ScorerTokenResponse, ClientOp, SyncOperation, SyncRequest, SyncOperationResult, SyncResponse
 )
 
-try:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred)
-    print("Firebase inicializado con serviceAccountKey.json (Modo Local)")
-except FileNotFoundError:
-    firebase_admin.initialize_app()
-    print("Firebase inicializado con credenciales de GCP (Modo Cloud Run)")
+startup_report.mark("imports")
+
+# El motor se elige con STORAGE_BACKEND (ver storage.py). Por defecto, Firestore.
+# Con WRITE_BEHIND=1, los puntos del camino rápido van primero a un journal local (ver write_behind.py).
+# Envuelto para contar lecturas/escrituras por pedido (ver metrics.py)
+write_behind = WriteBehindStorage(create_storage()) if WRITE_BEHIND else None
+storage = InstrumentedStorage(write_behind or create_storage())
+startup_report.mark("storage")
+
+# Los endpoints son async: las llamadas bloqueantes al storage pasan por acá
+STORAGE_CONCURRENCY = int(os.environ.get("STORAGE_CONCURRENCY", "64"))
+storage_runner = StorageRunner(storage, max_concurrency=STORAGE_CONCURRENCY)
+
+# Estado en vivo de cada partido, para no releer game/set en cada punto
+game_cache = GameStateCache(storage)
+
+# Espectadores conectados por SSE (ver live_stream.py)
+live_hub = LiveHub(storage_runner)
+
+# Partidos reconstruidos desde el log de eventos (ver event_log.py)
+projections = ProjectionStore(storage)
+
+# Resumen del lobby, servido con ETag (ver lobby.py)
+lobby = LobbySummary(storage)
+
+# Equipos y categorías en memoria, con TTL (ver reference_cache.py)
+reference_cache = ReferenceCache(storage)
 
-db = firestore.client()
+# Estadísticas de partido y de torneo, cacheadas por event_seq (ver analytics.py)
+analytics = MatchAnalytics()
+
+# Partidos terminados pasados a archivos columnares (ver archive.py)
+archive = ArchiveStore()
+
+
+def game_category_id(game: dict) -> Optional[str]:
+    if game.get("category_id"):
+        return game["category_id"]
+    # Los partidos viejos no guardan category_id: se reconocen por el nombre
+    for category in reference_cache.list_categories():
+        if game.get("category_name") and category.get("name") == game.get("category_name"):
+            return category["id"]
+    return None
+
+
+# Tabla de posiciones por categoría, actualizada con cada escritura (ver standings.py)
+standings = Standings(storage, archive, game_category_id)
+
+# Repetición y "¿cómo iba a tal hora?" sobre el log de eventos (ver replay.py)
+replay = GameReplay(storage)
+
+# Lecturas públicas: una carga por clave cada MICRO_CACHE_MS, para todos (ver micro_cache.py)
+micro_cache = MicroCache()
+
+
+def game_changed(game_id: str, events: List[dict] = ()):
+    """
+    Después de escribir un partido por el camino lento: cache, proyección,
+    lobby y espectadores. Una sola lectura del game doc para todos.
+    """
+    game_cache.invalidate(game_id)
+    if events:
+        projections.record(game_id, list(events))
+    game_data = storage.get_game(game_id)
+    if game_data is None:
+        lobby.remove(game_id)
+        spectator_views_changed(game_id)
+        return
+    lobby.update(game_id, game_data)
+    standings.update(game_id, game_data)
+    spectator_views_changed(game_id)
+    live_hub.publish(game_id, game_data)
+
+
+def game_published(game_id: str, fields: dict):
+    """Cambios del camino rápido (ya sabemos qué cambió, no hace falta leer)."""
+    lobby.update(game_id, fields)
+    if not standings.update(game_id, fields) and fields.get("status") == "finished":
+        # Terminó un partido que la tabla no conocía: una lectura, una vez por partido
+        game_data = storage.get_game(game_id)
+        if game_data is not None:
+            standings.update(game_id, game_data)
+    spectator_views_changed(game_id)
+    live_hub.publish(game_id, fields)
+
+
+def spectator_views_changed(game_id: str):
+    # Quien pida el partido justo después de un cambio no espera el TTL del micro-cache
+    micro_cache.invalidate(f"game:{game_id}")
+    micro_cache.invalidate(f"points:{game_id}")
+
+
+def etag_response(request: Request, etag: str, body: bytes) -> Response:
+    """GET condicional: 304 sin cuerpo si el cliente ya tiene esta versión."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # --- App y Seguridad ---
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 security = HTTPBasic()
 
-ADMIN_USER = "manager"
-ADMIN_PASS = "voley123" # ¡Recuerda cambiar esto!
+# Si está definido, /metrics pide "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+# Warm-up en segundo plano al arrancar (0 para desactivarlo, ver startup.py)
+STARTUP_WARM_UP = os.environ.get("STARTUP_WARM_UP", "1") not in ("", "0")
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # No se espera: la app acepta pedidos ya; lo que no llegó a calentarse se
+    # hace en el primer uso
+    global _warm_up_task
+    startup_report.ready()
+    if STARTUP_WARM_UP:
+        _warm_up_task = asyncio.create_task(warm_up())
+    if write_behind is not None:
+        # Lo que quedó en el journal de la corrida anterior sale en el primer flush
+        asyncio.create_task(flush_write_behind())
+
+
+async def flush_write_behind():
+    """Manda al storage lo que está en el journal, cada WRITE_BEHIND_FLUSH_MS."""
+    while True:
+        try:
+            await storage_runner.run(write_behind.flush, True)
+        except Exception as e:
+            # Queda en el journal: se reintenta, esperando cada vez más (ver write_behind.py)
+            print(f"Write-behind: falló el flush: {e}")
+        await asyncio.sleep(WRITE_BEHIND_FLUSH_MS / 1000)
+
+
+@app.on_event("shutdown")
+async def flush_on_shutdown():
+    if write_behind is not None:
+        await storage_runner.run(write_behind.flush)
+
+
+async def warm_up():
+    # El storage por su runner (el motor en memoria no admite otros threads)
+    steps = (
+        ("warmup.storage", storage_runner.run, storage.connect),
+        ("warmup.reference_cache", storage_runner.run, reference_cache.load),
+        ("warmup.archive", asyncio.to_thread, archive.ensure_loaded),
+        ("warmup.static", asyncio.to_thread, static_bundle.precompress),
+    )
+    for name, run, step in steps:
+        try:
+            with startup_report.phase(name):
+                await run(step)
+        except Exception as e:
+            # Si falla (p.ej. sin red), se hace en el primer pedido
+            print(f"Warm-up: falló {name}: {e}")
+    startup_report.log("Warm-up terminado")
+
+# Cuentas de manager (MANAGER_ACCOUNTS) y sesiones firmadas (ver auth.py)
+MANAGER_ACCOUNTS = load_accounts()
+sessions = SessionSigner()
 COOKIE_NAME = "voley_session"
 
 
-def get_current_user(request: Request):
-    session_token = request.cookies.get(COOKIE_NAME)
-    if not session_token or session_token != "authenticated_token_xyz":
+def set_session_cookie(response: Response, token: str, expires_at: int):
+    # httponly=True es vital: impide que el JS lea la cookie (seguridad XSS)
+    response.set_cookie(
+        key=COOKIE_NAME,
+        value=token,
+        httponly=True,
+        samesite="lax",
+        max_age=max(0, expires_at - int(time.time()))
+    )
+
+
+async def get_current_user(request: Request):
+    """Sólo managers. Devuelve el usuario."""
+    session = sessions.verify(request.cookies.get(COOKIE_NAME))
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="No autenticado"
         )
-    return "manager"
+    if not session.is_manager:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sólo para managers.")
+    return session.username
 
 
-def verify_page_access(request: Request):
-    session_token = request.cookies.get(COOKIE_NAME)
-    if not session_token or session_token != "authenticated_token_xyz":
-        # Si falla, lanzamos una excepción especial que capturaremos
-        # o simplemente retornamos False y manejamos en la ruta
+async def get_game_user(game_id: str, request: Request):
+    """Managers o el planillero de este partido. Devuelve el usuario."""
+    session = sessions.verify(request.cookies.get(COOKIE_NAME))
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado"
+        )
+    if not session.can_score(game_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tenés acceso a este partido.")
+
+    # Las escrituras de un partido las hace siempre el mismo proceso (ver game_writer.py)
+    if request.method != "GET":
+        owner_url = game_owner_url(game_id)
+        if owner_url is not None:
+            location = owner_url + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+            raise HTTPException(status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+                                detail="El partido lo escribe otro proceso.", headers={"Location": location})
+    return session.username
+
+
+def verify_page_access(request: Request, game_id: Optional[str] = None):
+    session = sessions.verify(request.cookies.get(COOKIE_NAME))
+    if session is None:
+        # Si falla, retornamos False y manejamos en la ruta
         return False
-    return True
+    if game_id is None:
+        return session.is_manager
+    return session.can_score(game_id)
 
 
 @app.post("/auth/login")
-def login(creds: LoginRequest, response: Response):
-    correct_user = secrets.compare_digest(creds.username, ADMIN_USER)
-    correct_pass = secrets.compare_digest(creds.password, ADMIN_PASS)
+async def login(creds: LoginRequest, response: Response):
+    # Comparamos siempre contra alguna clave, exista o no el usuario (mismo tiempo de respuesta)
+    expected_pass = MANAGER_ACCOUNTS.get(creds.username)
+    correct_pass = secrets.compare_digest(creds.password.encode(), (expected_pass or secrets.token_hex(16)).encode())
     
-    if not (correct_user and correct_pass):
+    if expected_pass is None or not correct_pass:
         raise HTTPException(status_code=400, detail="Credenciales incorrectas")
     
-    # Crear la cookie
-    # httponly=True es vital: impide que el JS lea la cookie (seguridad XSS)
-    response.set_cookie(
-        key=COOKIE_NAME, 
-        value="authenticated_token_xyz", # En un app real, usa un token firmado JWT
-        httponly=True,
-        max_age=3600 * 12 # 12 horas de duración
-    )
+    # Crear la cookie con el token firmado
+    token, expires_at = sessions.issue(creds.username, ROLE_MANAGER)
+    set_session_cookie(response, token, expires_at)
     return {"message": "Login exitoso"}
 
 
+@app.get("/auth/scorer", include_in_schema=False)
+async def scorer_login(token: str):
+    """Link que comparte el manager con un planillero: deja la cookie y abre su partido."""
+    session = sessions.verify(token)
+    if session is None or session.role != ROLE_SCORER or not session.games:
+        return RedirectResponse(url="/login")
+    response = RedirectResponse(url=f"/manager/game?id={sorted(session.games)[0]}")
+    set_session_cookie(response, token, session.expires_at)
+    return response
+
+
 @app.post("/auth/logout")
-def logout(response: Response):
+async def logout(response: Response):
     response.delete_cookie(COOKIE_NAME)
     return {"message": "Logout exitoso"}
 
 # --- API Endpoints: Manager (Protegidos) ---
 
+@app.post("/manager/games/{game_id}/scorer_token", response_model=ScorerTokenResponse)
+async def create_scorer_token(game_id: str, hours: int = 12, username: str = Depends(get_current_user)):
+    """Token de planillero sólo para este partido (para pasarle el link a quien lleva la planilla)."""
+    if await storage_runner.run(storage.get_game, game_id) is None:
+        raise HTTPException(status_code=404, detail="El partido no existe.")
+    token, expires_at = sessions.issue(f"{username}/scorer", ROLE_SCORER, [game_id],
+                                       ttl_seconds=min(max(hours, 1), 48) * 3600)
+    return ScorerTokenResponse(token=token, expires_at=expires_at, login_url=f"/auth/scorer?token={token}")
+
 @app.get("/manager/test")
-def read_manager_test(username: str = Depends(get_current_user)):
+async def read_manager_test(username: str = Depends(get_current_user)):
     return {"message": "Estás autenticado via Cookie!"}
 
 
 @app.get("/manager/categories", response_model=List[Category])
-def get_categories(username: str = Depends(get_current_user)):
-    """Trae la lista de categorías ordenadas."""
+async def get_categories(request: Request, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         username: str = Depends(get_current_user)):
+    """
+    Trae la lista de categorías ordenadas. Con `limit`, de a páginas (el
+    cursor de la siguiente viene en X-Next-Cursor, ver listing.py).
+    """
     # Asegúrate de crear la colección 'categories' en Firestore
-    cats_ref = db.collection("categories").order_by("order").stream()
-    categories = []
-    for cat in cats_ref:
-        cat_data = cat.to_dict()
-        cat_data["id"] = cat.id
-        categories.append(cat_data)
-    return categories
+    wanted = parse_fields(fields, Category.model_fields)
+    after = decode_cursor(cursor, 2)
+    categories = await storage_runner.run(
+        reference_cache.page_categories, after, limit + 1 if limit is not None else None
+    )
+    page, next_cursor = keyset_page(categories, limit, lambda c: (c.get("order", 0), c["id"]))
+    return page_response(request, [project(c, wanted) for c in page], next_cursor)
 
 
 @app.get("/manager/teams", response_model=List[Team])
-def get_teams_list(category_id: Optional[str] = None, username: str = Depends(get_current_user)):
+async def get_teams_list(request: Request, category_id: Optional[str] = None,
+                         limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         username: str = Depends(get_current_user)):
     """
-    Trae equipos. Si se pasa category_id, filtra.
+    Trae equipos (ordenados por id). Si se pasa category_id, filtra. Con
+    `limit`, de a páginas; con `fields`, sólo esos campos.
     """
-    teams_ref = db.collection("teams")
-    
-    if category_id:
-        # Filtramos por el campo category_id
-        teams_ref = teams_ref.where(filter=firestore.FieldFilter("category_id", "==", category_id))
+    wanted = parse_fields(fields, Team.model_fields)
+    after = decode_cursor(cursor, 1)
+    teams = await storage_runner.run(
+        reference_cache.page_teams, category_id, after[0] if after else None,
+        limit + 1 if limit is not None else None
+    )
+    page, next_cursor = keyset_page(teams, limit, lambda t: (t["id"],))
+    return page_response(request, [project(t, wanted) for t in page], next_cursor)
+
+
+@app.post("/manager/reference/invalidate")
+async def invalidate_reference_cache(username: str = Depends(get_current_user)):
+    """Descarta equipos y categorías cacheados (después de editarlos en Firestore)."""
+    reference_cache.invalidate()
+    return {"status": "ok", "message": "Cache de equipos y categorías invalidado."}
+
+
+def run_archive(older_than_days: float) -> dict:
+    result = archive.archive(
+        storage, lambda game_id, event_seq: projections.get(game_id, upto_seq=event_seq),
+        older_than_days=older_than_days
+    )
+    # Los partidos ya no están en el storage: que nadie los sirva desde memoria
+    for game_id in result["archived"]:
+        game_cache.invalidate(game_id)
+        projections.invalidate(game_id)
+        lobby.remove(game_id)
+        spectator_views_changed(game_id)
+    return result
+
+
+@app.post("/manager/archive/run", response_model=ArchiveRunResponse)
+async def run_archive_job(older_than_days: float = ARCHIVE_AFTER_DAYS, username: str = Depends(get_current_user)):
+    """
+    Pasa al archivo histórico los partidos finalizados/anulados creados hace
+    más de `older_than_days` días y los borra de la colección en vivo.
+    Pensado para correrlo desde un cron (Cloud Scheduler).
+    """
+    try:
+        result = await storage_runner.run(run_archive, older_than_days)
+    except ArchiveNotDurableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Error al archivar partidos: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
+    return ArchiveRunResponse(archived=len(result["archived"]), game_ids=result["archived"],
+                              segments=result["segments"])
+
+
+def new_game_documents(game: GameCreate, t1_data: dict, t2_data: dict, cat_data: Optional[dict],
+                       created_at: datetime.datetime):
+    """Documentos iniciales de un partido (game doc + set 1)."""
+    # Nombre de categoría (si se envió)
+    cat_name = "Amistoso" # Default
+    if cat_data is not None:
+        cat_name = cat_data.get("name", "Torneo")
+
+    # Crear documento con los nuevos campos (Flags y Sets Won)
+    new_game_data = GameDocument(
+        team1_id=game.team1_id,
+        team2_id=game.team2_id,
+        team1_name=t1_data.get("name", "Equipo 1"),
+        team2_name=t2_data.get("name", "Equipo 2"),
         
-    docs = teams_ref.stream()
-    teams = []
-    for team in docs:
-        team_data = team.to_dict()
-        team_data["id"] = team.id
-        teams.append(team_data)
-    
-    return teams
+        # Guardamos las flags aquí para no buscarlas cada vez en el watcher
+        team1_flag=t1_data.get("flag"), 
+        team2_flag=t2_data.get("flag"),
+        category_id=game.category_id if cat_data is not None else None,
+        category_name=cat_name,
+        rules=rules_for_category(cat_data),
+
+        status="upcoming",
+        created_at=created_at,
+        event_log=True,
+        
+        current_set_number=1,
+        current_team1_score=0,
+        current_team2_score=0,
+        
+        # Inicializamos contadores de sets
+        team1_sets_won=0,
+        team2_sets_won=0
+    )
+
+    # Crear set 1 (Igual que antes)
+    first_set_data = SetDocument(
+        set_number=1,
+        status="live",
+        team1_current_score=0,
+        team2_current_score=0,
+        winner_id=None
+    )
+    return new_game_data, first_set_data
 
 
 @app.post("/manager/games", response_model=GameDocument)
-def create_game(game: GameCreate, username: str = Depends(get_current_user)):
+async def create_game(game: GameCreate, username: str = Depends(get_current_user)):
     if game.team1_id == game.team2_id:
         raise HTTPException(status_code=400, detail="Un equipo no puede jugar contra sí mismo.")
 
     try:
-        # 1. Buscar datos de equipos
-        team1_ref = db.collection("teams").document(game.team1_id).get()
-        team2_ref = db.collection("teams").document(game.team2_id).get()
+        # 1. Buscar datos de equipos y categoría (desde el cache; si falta algo, una lectura en lote)
+        teams = await storage_runner.run(reference_cache.get_teams, [game.team1_id, game.team2_id])
+        t1_data, t2_data = teams.get(game.team1_id), teams.get(game.team2_id)
+        cat_data = None
+        if game.category_id:
+            cat_data = await storage_runner.run(reference_cache.get_category, game.category_id)
 
-        if not team1_ref.exists or not team2_ref.exists:
+        if t1_data is None or t2_data is None:
             raise HTTPException(status_code=404, detail="Equipos no encontrados.")
 
-        t1_data = team1_ref.to_dict()
-        t2_data = team2_ref.to_dict()
-
-        # 2. Buscar nombre de categoría (si se envió)
-        cat_name = "Amistoso" # Default
-        if game.category_id:
-            cat_ref = db.collection("categories").document(game.category_id).get()
-            if cat_ref.exists:
-                cat_name = cat_ref.to_dict().get("name", "Torneo")
-
-        # 3. Crear documento con los nuevos campos (Flags y Sets Won)
-        new_game_data = GameDocument(
-            team1_id=game.team1_id,
-            team2_id=game.team2_id,
-            team1_name=t1_data.get("name", "Equipo 1"),
-            team2_name=t2_data.get("name", "Equipo 2"),
-            
-            # Guardamos las flags aquí para no buscarlas cada vez en el watcher
-            team1_flag=t1_data.get("flag"), 
-            team2_flag=t2_data.get("flag"),
-            category_name=cat_name,
-
-            status="upcoming",
-            created_at=datetime.datetime.now(datetime.timezone.utc),
-            
-            current_set_number=1,
-            current_team1_score=0,
-            current_team2_score=0,
-            
-            # Inicializamos contadores de sets
-            team1_sets_won=0,
-            team2_sets_won=0
-        )
-
-        update_time, game_ref = db.collection("games").add(new_game_data.model_dump())
-
-        # Crear set 1 (Igual que antes)
-        first_set_data = SetDocument(
-            set_number=1,
-            status="live",
-            team1_current_score=0,
-            team2_current_score=0,
-            winner_id=None
-        )
-        db.collection("games").document(game_ref.id).collection("sets").document("1").set(
-            first_set_data.model_dump()
+        # 2. Armar los documentos y crearlos
+        new_game_data, first_set_data = new_game_documents(
+            game, t1_data, t2_data, cat_data, datetime.datetime.now(datetime.timezone.utc)
         )
+        game_id = await storage_runner.run(storage.create_game, new_game_data.model_dump(), first_set_data.model_dump())
+        lobby.update(game_id, new_game_data.model_dump())
+        standings.update(game_id, new_game_data.model_dump())
 
         return new_game_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error create_game: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/manager/games/list", response_model=List[GameListResponse]) # <--- 2. USA EL NUEVO RESPONSE_MODEL
-def get_games_list(username: str = Depends(get_current_user)):
+# Partidos por escritura en lote (Firestore: 2 escrituras por partido, máximo 500 por batch)
+FIXTURE_CHUNK_SIZE = 200
+
+
+@app.post("/manager/games/bulk", response_model=FixtureResponse)
+async def create_fixture(fixture: FixtureCreate, username: str = Depends(get_current_user)):
+    """
+    Crea un fixture completo (todos contra todos, llaves...). Los equipos se
+    validan con una sola lectura y los partidos se escriben en lotes. Cada
+    partido tiene su propio resultado: uno inválido no frena a los demás.
+    """
+    results = [FixtureItemResult(index=i, ok=False) for i in range(len(fixture.games))]
+
+    # 1. Todos los equipos y categorías de una vez (cache + una lectura en lote por los faltantes)
+    team_ids = list({tid for game in fixture.games for tid in (game.team1_id, game.team2_id)})
+    teams = await storage_runner.run(reference_cache.get_teams, team_ids)
+    categories = {}
+    for category_id in {game.category_id for game in fixture.games if game.category_id}:
+        categories[category_id] = await storage_runner.run(reference_cache.get_category, category_id)
+
+    # 2. Validar y armar los documentos
+    # created_at escalonado: el lobby muestra los partidos en el orden del fixture
+    now = datetime.datetime.now(datetime.timezone.utc)
+    pending = [] # (index, game_doc, set_doc)
+    for i, game in enumerate(fixture.games):
+        if game.team1_id == game.team2_id:
+            results[i].detail = "Un equipo no puede jugar contra sí mismo."
+            continue
+        if game.team1_id not in teams or game.team2_id not in teams:
+            results[i].detail = "Equipos no encontrados."
+            continue
+        created_at = now - datetime.timedelta(microseconds=i)
+        pending.append((i, *new_game_documents(
+            game, teams[game.team1_id], teams[game.team2_id], categories.get(game.category_id), created_at
+        )))
+
+    # 3. Escribir en lotes (en paralelo); si un lote falla, fallan sólo sus partidos
+    async def write_chunk(chunk):
+        try:
+            game_ids = await storage_runner.run(
+                storage.create_games, [(g.model_dump(), s.model_dump()) for _, g, s in chunk]
+            )
+        except Exception as e:
+            print(f"Error create_fixture: {e}")
+            for i, _, _ in chunk:
+                results[i].detail = f"Error al guardar: {e}"
+            return
+        for (i, game_doc, _), game_id in zip(chunk, game_ids):
+            results[i].ok = True
+            results[i].game_id = game_id
+            lobby.update(game_id, game_doc.model_dump())
+            standings.update(game_id, game_doc.model_dump())
+
+    await asyncio.gather(*(
+        write_chunk(pending[start:start + FIXTURE_CHUNK_SIZE])
+        for start in range(0, len(pending), FIXTURE_CHUNK_SIZE)
+    ))
+
+    created = sum(1 for r in results if r.ok)
+    return FixtureResponse(created=created, failed=len(results) - created, results=results)
+
+
+# Página por defecto de /manager/games/list cuando se filtra o pagina
+GAMES_PAGE_SIZE = 100
+
+
+@app.get("/manager/games/list", response_model=List[LobbyGame])
+async def get_games_list(request: Request, statuses: Optional[str] = Query(None, alias="status"), category_id: Optional[str] = None,
+                         from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None,
+                         limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         username: str = Depends(get_current_user)):
     """
     Trae una lista de partidos que están 'upcoming' o 'live'
-    para que el manager pueda gestionarlos.
+    para que el manager pueda gestionarlos. Sale del resumen del lobby.
+
+    Con filtros (status separados por coma, category_id, from_date/to_date
+    inclusive), `limit`, `cursor` o `fields` la consulta va al storage, de a
+    páginas, del más nuevo al más viejo (ver listing.py).
     """
     try:
-        games_ref = db.collection("games").where(
-            filter=firestore.FieldFilter("status", "in", ["upcoming", "live"])
-        ).order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-
-        games = []
-        for game in games_ref:
-            game_data = game.to_dict()
-            game_data["id"] = game.id 
-            
-            # 3. USA EL NUEVO MODELO AL PARSEAR
-            games.append(GameListResponse(**game_data)) 
-        
-        return games
+        if not any((statuses, category_id, from_date, to_date, limit, cursor, fields)):
+            etag, body = await storage_runner.run(lobby.render, "active")
+            return etag_response(request, etag, body)
+
+        wanted = parse_fields(fields, GameListResponse.model_fields)
+        after = decode_cursor(cursor, 2)
+        if after is not None:
+            try:
+                after = (datetime.datetime.fromisoformat(after[0]), str(after[1]))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Cursor inválido.")
+        limit = limit or GAMES_PAGE_SIZE
+        games = await storage_runner.run(
+            storage.query_games,
+            [s.strip() for s in statuses.split(",") if s.strip()] if statuses else None,
+            category_id,
+            utc_day_start(from_date) if from_date else None,
+            utc_day_start(to_date + datetime.timedelta(days=1)) if to_date else None,
+            after, limit + 1, wanted
+        )
+        page, next_cursor = keyset_page(games, limit, lambda g: (g["created_at"], g["id"]))
+        return page_response(request, [project(g, wanted) for g in page], next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al listar partidos: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 
+def utc_day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
 @app.get("/manager/games/{game_id}", response_model=GameDocument)
-def get_single_game(game_id: str, username: str = Depends(get_current_user)):
+async def get_single_game(game_id: str, username: str = Depends(get_game_user)):
     """Trae los detalles de un partido específico para el controlador."""
-    game_ref = db.collection("games").document(game_id)
-    snapshot = game_ref.get()
+    game_data = await storage_runner.run(storage.get_game, game_id)
     
-    if not snapshot.exists:
+    if game_data is None:
         raise HTTPException(status_code=404, detail="Partido no encontrado")
     
     # Retornamos los datos. Pydantic hará el resto.
-    return snapshot.to_dict()
+    return game_data
 
 
 @app.post("/manager/games/{game_id}/finish_set", response_model=SetDocument)
-def finish_set(game_id: str, set_data: SetFinish, username: str = Depends(get_current_user)):
-    
-    game_ref = db.collection("games").document(game_id)
-    set_ref = game_ref.collection("sets").document(str(set_data.set_number))
+async def finish_set(game_id: str, set_data: SetFinish, username: str = Depends(get_game_user)):
+
+    events = []
 
     try:
-        @firestore.transactional
         def finish_set_in_transaction(transaction):
-            game_snapshot = game_ref.get(transaction=transaction)
-            set_snapshot = set_ref.get(transaction=transaction)
+            events.clear() # La transacción puede reintentarse
+            game_data = transaction.get_game()
+            current_set = transaction.get_set(set_data.set_number)
 
-            if not game_snapshot.exists or not set_snapshot.exists:
+            if game_data is None or current_set is None:
                 return None
 
-            game_data = game_snapshot.to_dict()
-
             if set_data.winner_team_id not in [game_data["team1_id"], game_data["team2_id"]]:
                 return None 
 
-            # 1. Actualizar el set (Igual que antes)
-            transaction.update(set_ref, {
+            # Ya cerrado (p.ej. solo, por las reglas, al anotar el último punto): no se cuenta dos veces
+            if current_set.get("status") == "finished":
+                if current_set.get("winner_id") != set_data.winner_team_id:
+                    return None
+                next_set = transaction.get_set(set_data.set_number + 1)
+                return SetDocument(**next_set) if next_set else SetDocument(**current_set)
+
+            # 0. Registrar el evento en el log
+            event = new_event(game_data.get("event_seq", 0) + 1, "finish_set",
+                              set_data.set_number, set_data.winner_team_id)
+            transaction.append_event(event)
+            events.append(event)
+
+            # 1. Actualizar el set, guardando el score final (los puntos no tocan el set doc)
+            final_scores = final_set_scores(game_data, set_data.set_number)
+            transaction.update_set(set_data.set_number, {
                 "status": "finished",
-                "winner_id": set_data.winner_team_id
+                "winner_id": set_data.winner_team_id,
+                **final_scores
             })
 
-            # 2. Lógica NUEVA: Incrementar sets_won
+            # 2. Lógica NUEVA: Incrementar sets_won (y sumar los puntos del set, para la tabla)
+            final_scores = dict(current_set, **final_scores)
             updates = {
                 "current_set_number": set_data.set_number + 1,
                 "current_team1_score": 0,
-                "current_team2_score": 0
+                "current_team2_score": 0,
+                "team1_points": game_data.get("team1_points", 0) + final_scores.get("team1_current_score", 0),
+                "team2_points": game_data.get("team2_points", 0) + final_scores.get("team2_current_score", 0),
+                "event_seq": event["seq"]
             }
             
             # Leemos los valores actuales (o 0 si es legacy)
@@ -271,11 +654,10 @@ def finish_set(game_id: str, set_data: SetFinish, username: str = Depends(get_cu
             else:
                 updates["team2_sets_won"] = current_sets_t2 + 1
             
-            transaction.update(game_ref, updates)
+            transaction.update_game(updates)
 
             # 3. Crear siguiente set (Igual que antes)
             next_set_number = set_data.set_number + 1
-            next_set_ref = game_ref.collection("sets").document(str(next_set_number))
             
             new_set_doc = SetDocument(
                 set_number=next_set_number,
@@ -284,145 +666,451 @@ def finish_set(game_id: str, set_data: SetFinish, username: str = Depends(get_cu
                 team2_current_score=0,
                 winner_id=None
             )
-            transaction.set(next_set_ref, new_set_doc.model_dump())
+            transaction.create_set(next_set_number, new_set_doc.model_dump())
             
             return new_set_doc 
 
         # ... (resto del manejo de transacción igual) ...
         
-        transaction_result = finish_set_in_transaction(db.transaction())
+        transaction_result = await write_game(
+            game_id, run_client_transaction, storage, game_id, set_data, finish_set_in_transaction, events=events
+        )
+        if transaction_result is DUPLICATE_OP:
+            raise HTTPException(status_code=409, detail=DUPLICATE_OP_DETAIL)
         
         if transaction_result is None:
              raise HTTPException(status_code=400, detail="Error al finalizar set.")
         
         return transaction_result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error finish_set: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/manager/games/{game_id}/finish_game", response_model=GameDocument)
-def finish_game(game_id: str, game_data: GameFinish, username: str = Depends(get_current_user)):
+async def finish_game(game_id: str, game_data: GameFinish, username: str = Depends(get_game_user)):
     """
     Marca un partido como finalizado.
     """
-    game_ref = db.collection("games").document(game_id)
+    events = []
 
     try:
-        # 1. Leer el partido
-        game_snapshot = game_ref.get()
-        if not game_snapshot.exists:
-            raise HTTPException(status_code=404, detail="El partido no existe.")
-        
-        game_dict = game_snapshot.to_dict()
+        def finish_game_in_transaction(transaction):
+            events.clear()
 
-        # 2. Validar ganador
-        if game_data.winner_team_id not in [game_dict["team1_id"], game_dict["team2_id"]]:
-            raise HTTPException(status_code=400, detail="El ID del equipo ganador no es válido.")
+            # 1. Leer el partido
+            game_dict = transaction.get_game()
+            if game_dict is None:
+                return (None, "El partido no existe.")
 
-        # 3. Actualizar el documento
-        game_ref.update({
-            "status": "finished",
-            "winner_id": game_data.winner_team_id
-        })
-        
-        # 4. Devolver el estado final del partido
-        # Para evitar otra lectura, actualizamos el dict que ya teníamos
-        game_dict["status"] = "finished"
-        game_dict["winner_id"] = game_data.winner_team_id
-        return game_dict
+            # 2. Validar ganador
+            if game_data.winner_team_id not in [game_dict["team1_id"], game_dict["team2_id"]]:
+                return (None, "El ID del equipo ganador no es válido.")
+            if game_dict.get("status") == "finished":
+                if game_dict.get("winner_id") != game_data.winner_team_id:
+                    return (None, "El partido ya está finalizado con otro ganador.")
+                return (game_dict, "El partido ya estaba finalizado.")
+
+            # 3. Registrar el evento y actualizar el documento
+            event = new_event(game_dict.get("event_seq", 0) + 1, "finish_game",
+                              team_id=game_data.winner_team_id)
+            transaction.append_event(event)
+            events.append(event)
+
+            updates = {
+                "status": "finished",
+                "winner_id": game_data.winner_team_id,
+                "event_seq": event["seq"]
+            }
+            transaction.update_game(updates)
+
+            # 4. Devolver el estado final del partido
+            # Para evitar otra lectura, actualizamos el dict que ya teníamos
+            game_dict.update(updates)
+            return (game_dict, "Partido finalizado.")
+
+        outcome = await write_game(
+            game_id, run_client_transaction, storage, game_id, game_data, finish_game_in_transaction, events=events
+        )
+        if outcome is DUPLICATE_OP:
+            raise HTTPException(status_code=409, detail=DUPLICATE_OP_DETAIL)
+        result, message = outcome
+
+        if result is None:
+            status_code = 404 if "no existe" in message else 400
+            raise HTTPException(status_code=status_code, detail=message)
 
+        return result
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al finalizar partido: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 
-@app.post("/manager/games/{game_id}/increment", status_code=status.HTTP_201_CREATED, response_model=PointDocument)
-def increment_score(game_id: str, point: PointCreate, username: str = Depends(get_current_user)):
+# Respuesta (409) a un reintento de una operación que ya se aplicó (ver client_ops.py)
+DUPLICATE_OP_DETAIL = "La operación ya estaba aplicada."
+
+# Partidos que ya no admiten puntos
+CLOSED_STATUSES = ("finished", "cancelled")
+
+
+async def frame_response(game_id: str, encode, status_code: int = status.HTTP_200_OK) -> Response:
     """
-    Incrementa el score de un equipo en un set específico usando una transacción.
+    Respuesta en frames binarios (ver wire.py). `encode` recibe el id del
+    team1, para traducir equipos a índices; sale del cache del partido.
+    `status_code`, el mismo que la respuesta JSON del endpoint.
     """
-    
-    # 1. Definir las referencias a los documentos
-    game_ref = db.collection("games").document(game_id)
-    set_ref = game_ref.collection("sets").document(str(point.set_number))
-    # Es la referencia a la *colección* donde guardaremos el historial
-    points_collection_ref = set_ref.collection("points")
+    state = await storage_runner.run(game_cache.get, game_id)
+    team1_id = state.team1_id if state is not None else ""
+    return Response(content=encode(team1_id), status_code=status_code, media_type=FRAME_MEDIA_TYPE,
+                    headers={"Vary": "Accept"})
 
-    try:
-        # 2. @firestore.transactional es un decorador que "envuelve" la función
-        # en una transacción. Si la función falla, la transacción hace rollback.
-        @firestore.transactional
-        def update_score_in_transaction(transaction):
-            
-            # 3. Leer los documentos *dentro* de la transacción
-            game_snapshot = game_ref.get(transaction=transaction)
-            set_snapshot = set_ref.get(transaction=transaction)
 
-            if not game_snapshot.exists or not set_snapshot.exists:
-                # No podemos lanzar HTTPException desde aquí, así que retornamos None
-                # para indicar que falló y lo manejamos afuera.
-                return None
+def score_points(team1_id: str, team2_id: str, score_t1: int, score_t2: int,
+                 points: List[PointCreate]) -> Optional[List[PointDocument]]:
+    """
+    Aplica los puntos en orden sobre el score actual y arma los PointDocument.
+    Devuelve None si algún equipo no pertenece al partido.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    new_point_docs = []
+    for i, point in enumerate(points):
+        if point.scoring_team_id == team1_id:
+            score_t1 += 1
+        elif point.scoring_team_id == team2_id:
+            score_t2 += 1
+        else:
+            # El ID del equipo que anotó no pertenece a este partido
+            return None
+
+        new_point_docs.append(PointDocument(
+            # Timestamps estrictamente crecientes dentro de la tanda
+            timestamp=now + datetime.timedelta(microseconds=i),
+            scoring_team_id=point.scoring_team_id,
+            team1_score_after=score_t1,
+            team2_score_after=score_t2
+        ))
+    return new_point_docs
+
+
+def final_set_scores(game_data: dict, set_number: int) -> dict:
+    """
+    Score final para guardar en el set doc al cerrarlo. Durante el set el score
+    vive sólo en el game doc (y en el log), así que lo copiamos de ahí.
+    """
+    if set_number != game_data.get("current_set_number", 1):
+        return {}
+    return {
+        "team1_current_score": game_data.get("current_team1_score", 0),
+        "team2_current_score": game_data.get("current_team2_score", 0)
+    }
 
-            game_data = game_snapshot.to_dict()
-            set_data = set_snapshot.to_dict()
 
-            # 4. Calcular el nuevo score
-            current_score_t1 = set_data.get("team1_current_score", 0)
-            current_score_t2 = set_data.get("team2_current_score", 0)
-            
-            new_score_t1 = current_score_t1
-            new_score_t2 = current_score_t2
+def points_close(rules, team1_id: str, team2_id: str, team1_sets_won: int, team2_sets_won: int,
+                 team1_points: int, team2_points: int, new_point_docs: List[PointDocument]):
+    """
+    Evalúa las reglas del partido (ver rules.py) sobre una tanda de puntos.
+    Devuelve (válida, cierre): una tanda con puntos después del que cierra
+    el set no es válida (esos puntos son de otro set). El cierre trae los
+    IDs del ganador del set y, si corresponde, del partido, y los puntos de
+    los sets cerrados con el que se cierra.
+    """
+    index, close = closing_point(
+        game_rules(rules), team1_sets_won, team2_sets_won,
+        [(doc.team1_score_after, doc.team2_score_after) for doc in new_point_docs]
+    )
+    if close is None:
+        return True, None
+    if index != len(new_point_docs) - 1:
+        return False, None
+    team_ids = {1: team1_id, 2: team2_id}
+    last_point = new_point_docs[-1]
+    return True, dict(close, winner_id=team_ids[close["winner"]],
+                      match_winner_id=team_ids.get(close["match_winner"]),
+                      team1_points=team1_points + last_point.team1_score_after,
+                      team2_points=team2_points + last_point.team2_score_after)
+
+
+def write_points(transaction, set_number: int, last_seq: int,
+                 new_point_docs: List[PointDocument], close: Optional[dict] = None) -> List[dict]:
+    """
+    Escrituras de una tanda de puntos: un evento por punto en el log y una
+    sola actualización del game doc. Si el último punto cierra el set
+    (`close`, ver points_close), en la misma escritura se cierra el set, se
+    crea el siguiente y, si terminó, el partido. Devuelve los eventos escritos.
+    """
+    last_point = new_point_docs[-1]
+
+    # A. Agregar un evento 'point' por punto al log
+    events = []
+    for i, new_point_doc in enumerate(new_point_docs):
+        event = new_event(last_seq + i + 1, "point", set_number,
+                          new_point_doc.scoring_team_id, new_point_doc.timestamp)
+        transaction.append_event(event)
+        events.append(event)
+
+    # B. Actualizar el score denormalizado en el documento 'game' (para el lobby)
+    updates = {
+        "current_set_number": set_number,
+        "current_team1_score": last_point.team1_score_after,
+        "current_team2_score": last_point.team2_score_after,
+        "status": "live", # Aseguramos que el partido esté 'live'
+    }
+
+    # C. Cierre automático: lo mismo que finish_set (+ finish_game), sin otra transacción
+    if close is not None:
+        event = new_event(events[-1]["seq"] + 1, "finish_set", set_number, close["winner_id"])
+        transaction.append_event(event)
+        events.append(event)
+        transaction.update_set(set_number, {
+            "status": "finished",
+            "winner_id": close["winner_id"],
+            "team1_current_score": last_point.team1_score_after,
+            "team2_current_score": last_point.team2_score_after
+        })
+        transaction.create_set(set_number + 1, SetDocument(
+            set_number=set_number + 1, status="live",
+            team1_current_score=0, team2_current_score=0, winner_id=None
+        ).model_dump())
+        updates.update({
+            "current_set_number": set_number + 1,
+            "current_team1_score": 0,
+            "current_team2_score": 0,
+            "team1_sets_won": close["team1_sets_won"],
+            "team2_sets_won": close["team2_sets_won"],
+            "team1_points": close["team1_points"],
+            "team2_points": close["team2_points"]
+        })
+        if close["match_winner_id"] is not None:
+            event = new_event(events[-1]["seq"] + 1, "finish_game", team_id=close["match_winner_id"])
+            transaction.append_event(event)
+            events.append(event)
+            updates.update({"status": "finished", "winner_id": close["match_winner_id"]})
 
-            if point.scoring_team_id == game_data.get("team1_id"):
-                new_score_t1 += 1
-            elif point.scoring_team_id == game_data.get("team2_id"):
-                new_score_t2 += 1
-            else:
-                # El ID del equipo que anotó no pertenece a este partido
-                return None
+    updates["event_seq"] = events[-1]["seq"]
+    transaction.update_game(updates)
+    return events
 
-            # 5. Preparar el nuevo documento de historial de punto
-            new_point_doc = PointDocument(
-                timestamp=datetime.datetime.now(datetime.timezone.utc),
-                scoring_team_id=point.scoring_team_id,
-                team1_score_after=new_score_t1,
-                team2_score_after=new_score_t2
-            )
 
-            # 6. Ejecutar las escrituras (aún dentro de la transacción)
-            
-            # A. Escribir el nuevo punto en la subcolección 'points'
-            # (Creamos una referencia a un documento nuevo)
-            new_point_ref = points_collection_ref.document()
-            transaction.set(new_point_ref, new_point_doc.model_dump())
-
-            # B. Actualizar el score denormalizado en el documento 'set'
-            transaction.update(set_ref, {
-                "team1_current_score": new_score_t1,
-                "team2_current_score": new_score_t2,
-                "status": "live" # Aseguramos que el set esté 'live' si se puntúa
-            })
+def apply_points_from_cache(game_id: str, points: List[PointCreate]) -> Optional[List[PointDocument]]:
+    """
+    Camino rápido: usa el estado cacheado y hace una sola escritura
+    condicional, sin lecturas. Devuelve None si hay que ir por la
+    transacción completa (partido no cacheado, otro set, equipo inválido...)
+    y [] si todos los puntos ya estaban aplicados.
+    """
+    set_number = points[0].set_number
 
-            # C. Actualizar el score denormalizado en el documento 'game' (para el lobby)
-            transaction.update(game_ref, {
-                "current_set_number": point.set_number,
-                "current_team1_score": new_score_t1,
-                "current_team2_score": new_score_t2,
-                "status": "live" # Aseguramos que el partido esté 'live'
+    for _ in range(2):
+        state = game_cache.get(game_id)
+        if state is None or state.current_set_number != set_number or state.status in CLOSED_STATUSES:
+            return None
+
+        # Los reintentos de un cliente que ya se aplicaron se descartan (ver client_ops.py)
+        pending, marks = pending_ops(points, state.client_seqs)
+        if not pending:
+            return []
+
+        new_point_docs = score_points(
+            state.team1_id, state.team2_id,
+            state.current_team1_score, state.current_team2_score, pending
+        )
+        if new_point_docs is None:
+            return None
+        valid, close = points_close(state.rules, state.team1_id, state.team2_id,
+                                    state.team1_sets_won, state.team2_sets_won,
+                                    state.team1_points, state.team2_points, new_point_docs)
+        if not valid:
+            return None
+
+        events = []
+        try:
+            new_version = storage.write_game_if_version(
+                game_id, state.version,
+                lambda writer: events.extend(write_points(
+                    ClientOpTransaction(writer, marks, state.client_seqs),
+                    set_number, state.event_seq, new_point_docs, close
+                ))
+            )
+        except StaleGameError:
+            # Alguien más escribió el partido: releemos y probamos de nuevo
+            game_cache.invalidate(game_id)
+            continue
+
+        changes = {
+            "status": "live",
+            "current_team1_score": new_point_docs[-1].team1_score_after,
+            "current_team2_score": new_point_docs[-1].team2_score_after,
+        }
+        if close is not None:
+            changes.update({
+                "current_set_number": set_number + 1,
+                "current_team1_score": 0,
+                "current_team2_score": 0,
+                "team1_sets_won": close["team1_sets_won"],
+                "team2_sets_won": close["team2_sets_won"],
+                "team1_points": close["team1_points"],
+                "team2_points": close["team2_points"]
             })
+            if close["match_winner_id"] is not None:
+                changes.update({"status": "finished", "winner_id": close["match_winner_id"]})
+
+        new_state = state.model_copy(update=dict(
+            changes,
+            revision=state.revision + 1,
+            event_seq=events[-1]["seq"],
+            client_seqs=merge_client_seqs(state.client_seqs, marks),
+            version=new_version
+        ))
+        game_cache.put(game_id, new_state)
+        projections.record(game_id, events)
+        game_published(game_id, dict(changes, version=new_state.revision))
+        return new_point_docs
+
+    return None
+
+
+def apply_points(game_id: str, points: List[PointCreate]) -> Optional[List[PointDocument]]:
+    """
+    Anota una tanda ordenada de puntos de un mismo set, todo o nada.
+    Devuelve None si el partido, el set o algún equipo no son válidos.
+    Los puntos con client_id/client_seq que ya se habían aplicado se saltean:
+    se devuelven sólo los documentos de los nuevos ([] si no queda ninguno).
+    """
+    set_number = points[0].set_number
+    if any(point.set_number != set_number for point in points):
+        return None
+
+    # 0. Camino rápido: estado cacheado + una sola escritura
+    cached_result = apply_points_from_cache(game_id, points)
+    if cached_result is not None:
+        return cached_result
+
+    events = []
+
+    # 1. La función recibe un GameTransaction (ver storage.py). Si falla,
+    # ninguna de las escrituras se aplica (rollback).
+    def update_score_in_transaction(transaction):
+        events.clear() # La transacción puede reintentarse
+
+        # 2. Leer el partido *dentro* de la transacción
+        game_data = transaction.get_game()
+        if game_data is None:
+            return None
+
+        # Antes que el set: un reintento de un punto del set anterior es un duplicado, no un error
+        pending, marks = pending_ops(points, game_data.get("client_seqs"))
+        if not pending:
+            return []
+
+        if game_data.get("current_set_number", 1) != set_number or game_data.get("status") in CLOSED_STATUSES:
+            # No podemos lanzar HTTPException desde aquí, así que retornamos None
+            # para indicar que falló y lo manejamos afuera.
+            return None
+
+        # 3. Calcular el nuevo score y preparar los documentos de historial
+        new_point_docs = score_points(
+            game_data.get("team1_id"), game_data.get("team2_id"),
+            game_data.get("current_team1_score", 0), game_data.get("current_team2_score", 0),
+            pending
+        )
+        if new_point_docs is None:
+            return None
+
+        # 4. Reglas: ¿el último punto cierra el set o el partido?
+        valid, close = points_close(
+            game_data.get("rules"), game_data.get("team1_id"), game_data.get("team2_id"),
+            game_data.get("team1_sets_won", 0), game_data.get("team2_sets_won", 0),
+            game_data.get("team1_points", 0), game_data.get("team2_points", 0), new_point_docs
+        )
+        if not valid:
+            return None
+
+        # 5. Ejecutar las escrituras (aún dentro de la transacción), con la marca de los clientes
+        events.extend(write_points(
+            ClientOpTransaction(transaction, marks, game_data.get("client_seqs")),
+            set_number, game_data.get("event_seq", 0), new_point_docs, close
+        ))
+
+        # 6. Retornar los documentos de los puntos creados
+        return new_point_docs
+
+    # --- Fin de la función de transacción ---
 
-            # 7. Retornar el documento del punto creado
-            return new_point_doc
+    transaction_result = storage.run_game_transaction(game_id, update_score_in_transaction)
+    game_changed(game_id, events)
+    return transaction_result
 
-        # --- Fin de la función de transacción ---
 
-        # 8. Ejecutar la transacción
-        # Pasamos la transacción de la base de datos a nuestra función decorada
-        transaction_result = update_score_in_transaction(db.transaction())
+async def apply_point_batch(game_id: str, points: List[PointCreate]) -> List[Optional[PointDocument]]:
+    """Aplica una tanda de puntos agrupados, uno resultado por punto. Si la tanda falla, va de a uno."""
+    new_point_docs = await storage_runner.run(apply_points, game_id, points)
+    if new_point_docs is not None:
+        return new_point_docs
 
-        # 9. Manejar el resultado
+    results = []
+    for point in points:
+        single = await storage_runner.run(apply_points, game_id, [point])
+        results.append(single[0] if single else None)
+    return results
+
+
+# Un escritor por partido: las escrituras de un partido se aplican de a una (ver game_writer.py)
+game_writers = GameWriters(apply_point_batch)
+
+
+async def write_game(game_id: str, fn, *args, events: Optional[List[dict]] = None):
+    """
+    storage_runner.run(fn, *args) en el turno del escritor del partido. Si se
+    pasa `events` (la lista que llena la transacción), el cambio se avisa
+    (game_changed) antes de soltar el turno: la escritura siguiente ya
+    encuentra el cache al día.
+    """
+    async def job():
+        result = await storage_runner.run(fn, *args)
+        if events:
+            await storage_runner.run(game_changed, game_id, events)
+        return result
+    return await game_writers.submit(game_id, job)
+
+
+async def flush_coalesced_points(game_id: str, points: List[PointCreate]) -> List[Optional[PointDocument]]:
+    """Aplica los puntos agrupados por el Coalescer, en el turno del escritor del partido."""
+    return await game_writers.submit(game_id, lambda: apply_point_batch(game_id, points))
+
+
+# Ventana de agrupamiento para /increment (0 = desactivada). Ver coalescer.py
+INCREMENT_COALESCE_MS = float(os.environ.get("INCREMENT_COALESCE_MS", "0"))
+increment_coalescer = (
+    Coalescer(INCREMENT_COALESCE_MS / 1000, flush_coalesced_points)
+    if INCREMENT_COALESCE_MS > 0 else None
+)
+
+
+@app.post("/manager/games/{game_id}/increment", status_code=status.HTTP_201_CREATED, response_model=PointDocument)
+async def increment_score(game_id: str, point: PointCreate, request: Request, username: str = Depends(get_game_user)):
+    """
+    Incrementa el score de un equipo en un set específico usando una transacción.
+    """
+
+    try:
+        # Los puntos con clave de idempotencia no se agrupan: el reintento tiene que poder ver si ya se aplicó
+        if increment_coalescer is not None and point.client_id is None:
+            transaction_result = await increment_coalescer.submit(game_id, point)
+        elif point.client_id is None:
+            transaction_result = await game_writers.submit_point(game_id, point)
+        else:
+            new_point_docs = await write_game(game_id, apply_points, game_id, [point])
+            if new_point_docs == []:
+                raise HTTPException(status_code=409, detail="El punto ya estaba anotado.")
+            transaction_result = new_point_docs[0] if new_point_docs else None
+
+        # Manejar el resultado
         if transaction_result is None:
             raise HTTPException(
                 status_code=400, 
@@ -430,74 +1118,151 @@ def increment_score(game_id: str, point: PointCreate, username: str = Depends(ge
             )
 
         # ¡Éxito! Retornamos el documento del punto que se creó
+        if wants_frames(request.headers.get("accept")):
+            return await frame_response(game_id, lambda team1_id: transaction_result.to_frame(point.set_number, team1_id),
+                                        status_code=status.HTTP_201_CREATED)
         return transaction_result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al incrementar score: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 
+@app.post("/manager/games/{game_id}/increment_batch", status_code=status.HTTP_201_CREATED, response_model=PointBatchResponse)
+async def increment_score_batch(game_id: str, batch: PointBatchCreate, request: Request,
+                                username: str = Depends(get_game_user)):
+    """
+    Anota una ráfaga de puntos (en orden) en una sola transacción.
+    Todos los puntos tienen que ser del mismo set.
+    """
+    if not batch.points:
+        raise HTTPException(status_code=400, detail="La tanda de puntos está vacía.")
+
+    try:
+        new_point_docs = await write_game(game_id, apply_points, game_id, batch.points)
+
+        if new_point_docs is None:
+            raise HTTPException(
+                status_code=400,
+                detail="No se pudieron anotar los puntos. El ID de algún equipo, el partido o el set no son válidos."
+            )
+        if not new_point_docs:
+            raise HTTPException(status_code=409, detail="Los puntos ya estaban anotados.")
+
+        response = PointBatchResponse(
+            set_number=batch.points[0].set_number,
+            team1_score=new_point_docs[-1].team1_score_after,
+            team2_score=new_point_docs[-1].team2_score_after,
+            points=new_point_docs
+        )
+        if wants_frames(request.headers.get("accept")):
+            return await frame_response(game_id, response.to_frame, status_code=status.HTTP_201_CREATED)
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error al incrementar score (batch): {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
+
+
 @app.post("/manager/games/{game_id}/undo_point", status_code=status.HTTP_200_OK)
-def undo_last_point(game_id: str, username: str = Depends(get_current_user)):
+async def undo_last_point(game_id: str, op: Optional[ClientOp] = None, request: Request = None,
+                          username: str = Depends(get_game_user)):
     """
-    Deshace el último punto anotado en el set actual.
+    Deshace el último punto anotado en el set actual. Si ese punto cerró el
+    set (y quizás el partido), el set vuelve a estar en juego.
     """
     
+    outcome = None
     result = None
     message = "Error desconocido."
+    events = []
     try:
-        @firestore.transactional
         def undo_in_transaction(transaction):
+            events.clear()
+
             # 1. Obtener el set actual
-            game_ref = db.collection("games").document(game_id)
-            game_snapshot = game_ref.get(transaction=transaction)
-            if not game_snapshot.exists:
+            game_data = transaction.get_game()
+            if game_data is None:
                 return (None, "El partido no existe.")
             
-            game_data = game_snapshot.to_dict()
             current_set_num = game_data.get("current_set_number", 1)
-            
-            set_ref = game_ref.collection("sets").document(str(current_set_num))
-            points_collection_ref = set_ref.collection("points")
+            event_seq = game_data.get("event_seq", 0)
 
-            # 2. Buscar los últimos 2 puntos
-            last_two_points_query = points_collection_ref.order_by(
-                "timestamp", direction=firestore.Query.DESCENDING
-            ).limit(2)
-            last_two_points = list(last_two_points_query.get(transaction=transaction))
+            # 2. Los puntos del set salen de la proyección del log. Si ya está
+            # al día con el game doc no se lee nada más.
+            projection = projections.get(game_id, upto_seq=event_seq)
+            set_points = projection.set_points(current_set_num) if projection else []
+
+            # El set nuevo está vacío porque el punto anterior cerró el set: se reabre
+            reopened_set = projection.closed_by_last_point() if projection and not set_points else None
+            if reopened_set is not None:
+                current_set_num = reopened_set
+                set_points = projection.set_points(reopened_set)
 
             # 3. Determinar el estado anterior
-            new_score_t1 = 0
-            new_score_t2 = 0
-            
-            if len(last_two_points) == 0:
+            if len(set_points) == 0:
                 return (None, "No hay puntos en este set para deshacer.")
-            
-            elif len(last_two_points) == 1:
-                point_to_delete_ref = last_two_points[0].reference
-            
-            else:
-                point_to_delete_ref = last_two_points[0].reference
-                anteultimo_point_data = last_two_points[1].to_dict()
-                new_score_t1 = anteultimo_point_data.get("team1_score_after", 0)
-                new_score_t2 = anteultimo_point_data.get("team2_score_after", 0)
-
-            # 4. Ejecutar las escrituras
-            transaction.delete(point_to_delete_ref)
-            transaction.update(set_ref, {
-                "team1_current_score": new_score_t1,
-                "team2_current_score": new_score_t2
-            })
-            transaction.update(game_ref, {
+
+            new_score_t1, new_score_t2 = 0, 0
+            if len(set_points) > 1:
+                new_score_t1 = set_points[-2]["team1_score_after"]
+                new_score_t2 = set_points[-2]["team2_score_after"]
+
+            updates = {
                 "current_team1_score": new_score_t1,
-                "current_team2_score": new_score_t2
-            })
+                "current_team2_score": new_score_t2,
+            }
+            if reopened_set is not None:
+                # Lo contrario del cierre (ver write_points): partido, set, siguiente set y contadores
+                if game_data.get("status") == "finished":
+                    event = new_event(event_seq + 1, "reopen_game")
+                    transaction.append_event(event)
+                    events.append(event)
+                    event_seq = event["seq"]
+                    updates.update({"status": "live", "winner_id": None})
+                winner_id = projection.sets[reopened_set]["winner_id"]
+                event = new_event(event_seq + 1, "reopen_set", reopened_set, winner_id)
+                transaction.append_event(event)
+                events.append(event)
+                event_seq = event["seq"]
+
+                closed_t1, closed_t2 = projection.scores(reopened_set)
+                team_key = "team1_sets_won" if winner_id == game_data["team1_id"] else "team2_sets_won"
+                updates.update({
+                    "current_set_number": reopened_set,
+                    team_key: game_data.get(team_key, 0) - 1,
+                    "team1_points": game_data.get("team1_points", 0) - closed_t1,
+                    "team2_points": game_data.get("team2_points", 0) - closed_t2,
+                })
+                transaction.update_set(reopened_set, {
+                    "status": "live",
+                    "winner_id": None,
+                    "team1_current_score": new_score_t1,
+                    "team2_current_score": new_score_t2
+                })
+                transaction.delete_set(reopened_set + 1)
+
+            # 4. Ejecutar las escrituras: un evento 'undo' (el log no se borra nunca)
+            event = new_event(event_seq + 1, "undo", current_set_num)
+            transaction.append_event(event)
+            events.append(event)
+            updates["event_seq"] = event["seq"]
+            transaction.update_game(updates)
             
-            return ({"team1_score": new_score_t1, "team2_score": new_score_t2}, "Punto deshecho.")
+            return ({"set_number": current_set_num, "team1_score": new_score_t1, "team2_score": new_score_t2},
+                    "Punto deshecho.")
 
         # --- Fin de la transacción ---
         
-        result, message = undo_in_transaction(db.transaction())
+        outcome = await write_game(
+            game_id, run_client_transaction, storage, game_id, op, undo_in_transaction, events=events
+        )
+        if outcome is not DUPLICATE_OP:
+            result, message = outcome
         
     except Exception as e:
         # Esto SÍ es un error interno
@@ -505,43 +1270,53 @@ def undo_last_point(game_id: str, username: str = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
     # Manejamos los 'None' (errores lógicos) FUERA del try/except
+    if outcome is DUPLICATE_OP:
+        raise HTTPException(status_code=409, detail=DUPLICATE_OP_DETAIL)
     if result is None:
         # Usamos 400 (Bad Request) o 404 (Not Found) según el 'message'
         status_code = 404 if "no existe" in message else 400
         raise HTTPException(status_code=status_code, detail=message)
 
+    if request is not None and wants_frames(request.headers.get("accept")):
+        return await frame_response(game_id, lambda team1_id: score_frame(
+            result["set_number"], result["team1_score"], result["team2_score"]
+        ))
     return {"status": "ok", "message": message, "new_scores": result}
 
 
 @app.post("/manager/games/{game_id}/cancel_set", response_model=SetDocument)
-def cancel_set(game_id: str, set_data: SetCancel, username: str = Depends(get_current_user)):
+async def cancel_set(game_id: str, set_data: SetCancel, username: str = Depends(get_game_user)):
     """
     Marca un set como 'cancelled' y automáticamente crea el siguiente,
     actualizando el game doc.
     """
-    
-    game_ref = db.collection("games").document(game_id)
-    set_ref = game_ref.collection("sets").document(str(set_data.set_number))
+
+    events = []
 
     try:
-        @firestore.transactional
         def cancel_set_in_transaction(transaction):
+            events.clear()
             
-            game_snapshot = game_ref.get(transaction=transaction)
-            set_snapshot = set_ref.get(transaction=transaction)
+            game_data = transaction.get_game()
+            current_set = transaction.get_set(set_data.set_number)
 
-            if not game_snapshot.exists or not set_snapshot.exists:
+            if game_data is None or current_set is None:
                 return (None, "El partido o el set no existen.")
 
+            # 0. Registrar el evento en el log
+            event = new_event(game_data.get("event_seq", 0) + 1, "cancel_set", set_data.set_number)
+            transaction.append_event(event)
+            events.append(event)
+
             # 1. Actualizar el set actual a 'cancelled'
-            transaction.update(set_ref, {
-                "status": "cancelled"
+            transaction.update_set(set_data.set_number, {
+                "status": "cancelled",
                 # No necesitamos un 'winner_id'
+                **final_set_scores(game_data, set_data.set_number)
             })
 
             # 2. Crear el *siguiente* set (igual que en finish_set)
             next_set_number = set_data.set_number + 1
-            next_set_ref = game_ref.collection("sets").document(str(next_set_number))
             
             new_set_doc = SetDocument(
                 set_number=next_set_number,
@@ -550,13 +1325,14 @@ def cancel_set(game_id: str, set_data: SetCancel, username: str = Depends(get_cu
                 team2_current_score=0,
                 winner_id=None
             )
-            transaction.set(next_set_ref, new_set_doc.model_dump())
+            transaction.create_set(next_set_number, new_set_doc.model_dump())
             
             # 3. Actualizar el documento 'game' principal
-            transaction.update(game_ref, {
+            transaction.update_game({
                 "current_set_number": next_set_number,
                 "current_team1_score": 0,
-                "current_team2_score": 0
+                "current_team2_score": 0,
+                "event_seq": event["seq"]
             })
             
             # Devolvemos el *nuevo* set creado
@@ -564,7 +1340,12 @@ def cancel_set(game_id: str, set_data: SetCancel, username: str = Depends(get_cu
         
         # --- Fin de la transacción ---
         
-        result, message = cancel_set_in_transaction(db.transaction())
+        outcome = await write_game(
+            game_id, run_client_transaction, storage, game_id, set_data, cancel_set_in_transaction, events=events
+        )
+        if outcome is DUPLICATE_OP:
+            raise HTTPException(status_code=409, detail=DUPLICATE_OP_DETAIL)
+        result, message = outcome
 
         if result is None:
             raise HTTPException(status_code=404, detail=message)
@@ -572,58 +1353,493 @@ def cancel_set(game_id: str, set_data: SetCancel, username: str = Depends(get_cu
         # Devolvemos el SetDocument del *nuevo* set creado
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al cancelar set: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 
 @app.post("/manager/games/{game_id}/cancel", status_code=status.HTTP_200_OK)
-def cancel_game(game_id: str, username: str = Depends(get_current_user)):
+async def cancel_game(game_id: str, op: Optional[ClientOp] = None, username: str = Depends(get_game_user)):
     """
     Anula un partido cambiándole el estado a 'cancelled'.
     """
-    try:
-        game_ref = db.collection("games").document(game_id)
-        game_snapshot = game_ref.get()
+    events = []
 
-        if not game_snapshot.exists:
+    try:
+        def cancel_game_in_transaction(transaction):
+            events.clear()
+            game_data = transaction.get_game()
+            if game_data is None:
+                return False
+
+            event = new_event(game_data.get("event_seq", 0) + 1, "cancel_game")
+            transaction.append_event(event)
+            events.append(event)
+            transaction.update_game({"status": "cancelled", "event_seq": event["seq"]})
+            return True
+
+        found = await write_game(game_id, run_client_transaction, storage, game_id, op, cancel_game_in_transaction,
+                                 events=events)
+        if found is DUPLICATE_OP:
+            raise HTTPException(status_code=409, detail=DUPLICATE_OP_DETAIL)
+
+        if not found:
             raise HTTPException(status_code=404, detail="El partido no existe.")
         
-        game_ref.update({"status": "cancelled"})
-        
         return {"status": "ok", "message": "Partido anulado."}
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al anular partido: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 
+async def sync_points(game_id: str, client_id: str, operations: List[SyncOperation]) -> List[SyncOperationResult]:
+    """Puntos seguidos de la cola, del mismo set: una sola escritura para todos."""
+    return await game_writers.submit(game_id, lambda: apply_sync_points(game_id, client_id, operations))
+
+
+async def apply_sync_points(game_id: str, client_id: str, operations: List[SyncOperation]) -> List[SyncOperationResult]:
+    """sync_points, ya en el turno del escritor del partido."""
+    points = [
+        PointCreate(set_number=operation.set_number, scoring_team_id=operation.team_id,
+                    client_id=client_id, client_seq=operation.client_seq)
+        for operation in operations
+    ]
+    state = await storage_runner.run(game_cache.get, game_id)
+    pending, _ = pending_ops(points, state.client_seqs if state else {})
+    pending_seqs = {point.client_seq for point in pending}
+
+    new_point_docs = await storage_runner.run(apply_points, game_id, points)
+    if new_point_docs is not None:
+        return [
+            SyncOperationResult(client_seq=point.client_seq,
+                                status="applied" if point.client_seq in pending_seqs else "duplicate")
+            for point in points
+        ]
+
+    # La tanda falló: de a uno, para saber cuál es el punto inválido
+    results = []
+    for point in points:
+        single = await storage_runner.run(apply_points, game_id, [point])
+        if single is None:
+            results.append(SyncOperationResult(
+                client_seq=point.client_seq, status="rejected",
+                detail="El equipo, el partido o el set no son válidos."
+            ))
+        else:
+            results.append(SyncOperationResult(client_seq=point.client_seq,
+                                               status="applied" if single else "duplicate"))
+    return results
+
+
+async def sync_operation(game_id: str, client_id: str, operation: SyncOperation, username: str) -> SyncOperationResult:
+    """Cualquier otra operación: se aplica con el mismo endpoint que usa la planilla online."""
+    op = ClientOp(client_id=client_id, client_seq=operation.client_seq)
+    try:
+        if operation.type == "undo":
+            await undo_last_point(game_id, op, username=username)
+        elif operation.type == "finish_set":
+            await finish_set(game_id, SetFinish(set_number=operation.set_number, winner_team_id=operation.team_id,
+                                                **op.model_dump()), username=username)
+        elif operation.type == "cancel_set":
+            await cancel_set(game_id, SetCancel(set_number=operation.set_number, **op.model_dump()), username=username)
+        elif operation.type == "finish_game":
+            await finish_game(game_id, GameFinish(winner_team_id=operation.team_id, **op.model_dump()), username=username)
+        elif operation.type == "cancel_game":
+            await cancel_game(game_id, op, username=username)
+        else:
+            return SyncOperationResult(client_seq=operation.client_seq, status="rejected",
+                                       detail=f"Tipo de operación desconocido: {operation.type}")
+    except ValidationError:
+        return SyncOperationResult(client_seq=operation.client_seq, status="rejected",
+                                   detail="Faltan datos de la operación (set_number o team_id).")
+    except HTTPException as e:
+        if e.status_code == 409:
+            return SyncOperationResult(client_seq=operation.client_seq, status="duplicate")
+        if e.status_code >= 500:
+            # Error del storage: cortamos acá. Lo aplicado ya quedó marcado y el
+            # cliente reenvía la cola más tarde sin duplicar nada.
+            raise
+        return SyncOperationResult(client_seq=operation.client_seq, status="rejected", detail=str(e.detail))
+    return SyncOperationResult(client_seq=operation.client_seq, status="applied")
+
+
+@app.post("/manager/games/{game_id}/sync", response_model=SyncResponse)
+async def sync_operations(game_id: str, sync: SyncRequest, username: str = Depends(get_game_user)):
+    """
+    Aplica, en orden, la cola de operaciones que el planillero juntó sin conexión.
+    Se puede reenviar la misma cola las veces que haga falta: lo que ya se
+    había aplicado vuelve como 'duplicate' y no se escribe de nuevo.
+    """
+    operations = sorted(sync.operations, key=lambda operation: operation.client_seq)
+    results: List[SyncOperationResult] = []
+
+    try:
+        i = 0
+        while i < len(operations):
+            operation = operations[i]
+            if operation.type != "point":
+                results.append(await sync_operation(game_id, sync.client_id, operation, username))
+                i += 1
+                continue
+
+            if operation.set_number is None or operation.team_id is None:
+                results.append(SyncOperationResult(client_seq=operation.client_seq, status="rejected",
+                                                   detail="Al punto le falta set_number o team_id."))
+                i += 1
+                continue
+
+            # Ráfaga de puntos del mismo set
+            j = i + 1
+            while (j < len(operations) and operations[j].type == "point"
+                   and operations[j].set_number == operation.set_number and operations[j].team_id is not None):
+                j += 1
+            results.extend(await sync_points(game_id, sync.client_id, operations[i:j]))
+            i = j
+
+        game_data = await storage_runner.run(storage.get_game, game_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error al sincronizar operaciones: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
+
+    return SyncResponse(
+        applied=sum(1 for r in results if r.status == "applied"),
+        duplicates=sum(1 for r in results if r.status == "duplicate"),
+        rejected=sum(1 for r in results if r.status == "rejected"),
+        results=results,
+        game=GameDocument(**game_data) if game_data else None
+    )
+
+
+@app.get("/manager/games/{game_id}/events", response_model=List[GameEvent])
+async def get_game_events(game_id: str, after_seq: int = 0, username: str = Depends(get_game_user)):
+    """Log completo de eventos del partido (para reclamos y para reproducirlo)."""
+    return await storage_runner.run(storage.list_events, game_id, after_seq)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Métricas en formato Prometheus (ver metrics.py)."""
+    if METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+    body = metrics.render() + startup_report.render()
+    if write_behind is not None:
+        body += write_behind.render()
+    body += micro_cache.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+# --- API Endpoints: Públicos (Espectadores) ---
+
+POINT_LIST = TypeAdapter(List[PointDocument])
+
+
+def json_etag(body: bytes) -> Tuple[str, bytes]:
+    return f'"{hashlib.sha256(body).hexdigest()[:20]}"', body
+
+
+def load_game_detail(game_id: str) -> Optional[Tuple[str, bytes]]:
+    """(etag, cuerpo JSON) del partido con sus sets, o None si no existe."""
+    game_data = storage.get_game(game_id)
+    if game_data is None:
+        return None
+    sets = storage.list_sets(game_id)
+    for game_set in sets:
+        # El set en juego no guarda el score punto a punto: está en el game doc
+        if game_set.get("set_number") == game_data.get("current_set_number") and game_set.get("status") == "live":
+            game_set["team1_current_score"] = game_data.get("current_team1_score", 0)
+            game_set["team2_current_score"] = game_data.get("current_team2_score", 0)
+    detail = GameDetail(**dict(game_data, id=game_id, sets=sets))
+    return json_etag(detail.model_dump_json().encode("utf-8"))
+
+
+def load_game_points(game_id: str) -> Optional[Dict[int, Tuple[str, bytes]]]:
+    """Historial de puntos de cada set, del más nuevo al más viejo, ya codificado. None si no existe."""
+    projection = projections.get(game_id)
+    if projection is None:
+        return None
+    return {
+        set_number: json_etag(POINT_LIST.dump_json(POINT_LIST.validate_python(
+            list(reversed(projection.set_points(set_number)))
+        )))
+        for set_number in projection.sets
+    }
+
+
+@app.get("/lobby", response_model=LobbyResponse)
+async def get_lobby(request: Request):
+    """Partidos en vivo, próximos y últimos finalizados. Soporta If-None-Match."""
+    etag, body = await storage_runner.run(lobby.render, "public")
+    return etag_response(request, etag, body)
+
+@app.get("/games/{game_id}", response_model=GameDetail)
+async def get_game_detail(game_id: str, request: Request):
+    """El partido con todos sus sets (para la vista del espectador). Soporta If-None-Match."""
+    detail = await micro_cache.get(f"game:{game_id}", lambda: storage_runner.run(load_game_detail, game_id))
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+    return etag_response(request, *detail)
+
+@app.get("/games/{game_id}/sets/{set_number}/points", response_model=List[PointDocument])
+async def get_set_points(game_id: str, set_number: int, request: Request):
+    """Historial de puntos de un set, del más nuevo al más viejo (sale del log)."""
+    points = await micro_cache.get(f"points:{game_id}", lambda: storage_runner.run(load_game_points, game_id))
+    if points is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+    return etag_response(request, *points.get(set_number, json_etag(b"[]")))
+
+
+def compute_game_stats(game_id: str) -> Optional[GameStats]:
+    # El event_seq sale del estado cacheado: si la proyección ya está al día no se lee el log
+    state = game_cache.get(game_id)
+    if state is None:
+        return None
+    projection = projections.get(game_id, upto_seq=state.event_seq)
+    if projection is None:
+        return None
+    return analytics.game_stats(game_id, projection)
+
+
+def compute_category_stats(category_id: str) -> Optional[TournamentStats]:
+    category = reference_cache.get_category(category_id)
+    if category is None:
+        return None
+    category_name = category.get("name", "")
+
+    def list_category_games():
+        # El filtro va en la consulta, y de cada partido sólo hace falta el event_seq
+        games = query_all_games(statuses=["live", "finished"], category_id=category_id, fields=["event_seq"])
+        if category_name:
+            # Los partidos viejos no guardan category_id: se reconocen por el nombre
+            games += [
+                game for game in query_all_games(statuses=["live", "finished"], category_name=category_name,
+                                                 fields=["event_seq", "category_id"])
+                if game.get("category_id") is None
+            ]
+        # Uno que se está archivando puede estar en los dos lados: cuenta el del archivo
+        return [game for game in games if not archive.contains(game["id"])]
+
+    def list_category_segments():
+        # Los viejos se archivan en la partición con el nombre de la categoría (ver archive.category_key)
+        partitions = {category_id}
+        if category_name:
+            partitions.add(category_key({"category_name": category_name}))
+        return archive.segments(list(partitions))
+
+    return analytics.tournament_stats(
+        category_id, category_name, list_category_games,
+        lambda game_id, event_seq: projections.get(game_id, upto_seq=event_seq),
+        list_category_segments
+    )
+
+
+def query_all_games(**filters) -> List[dict]:
+    """Todas las páginas de una consulta de partidos (de a MAX_PAGE_SIZE, por keyset)."""
+    games, after = [], None
+    while True:
+        page = storage.query_games(after=after, limit=MAX_PAGE_SIZE, **filters)
+        games.extend(page)
+        if len(page) < MAX_PAGE_SIZE:
+            return games
+        after = (page[-1]["created_at"], page[-1]["id"])
+
+
+@app.get("/categories/{category_id}/standings", response_model=StandingsResponse)
+async def get_category_standings(category_id: str, request: Request):
+    """Tabla de posiciones de la categoría (ver standings.py). Soporta If-None-Match."""
+    category = await storage_runner.run(reference_cache.get_category, category_id)
+    if category is None:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    etag, body = await storage_runner.run(standings.render, category_id, category.get("name", ""))
+    return etag_response(request, etag, body)
+
+
+@app.get("/categories/{category_id}/standings/{team_id}", response_model=TeamStanding)
+async def get_team_standing(category_id: str, team_id: str):
+    """Un equipo en la tabla, con sus resultados."""
+    team = await storage_runner.run(standings.team, category_id, team_id)
+    if team is None:
+        raise HTTPException(status_code=404, detail="El equipo no tiene partidos terminados en la categoría")
+    return team
+
+
+@app.get("/games/{game_id}/stats", response_model=GameStats)
+async def get_game_stats(game_id: str):
+    """Rachas, side-out, cambios de líder, ritmo y duración del partido y de cada set."""
+    stats = await storage_runner.run(compute_game_stats, game_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+    return stats
+
+@app.get("/archive/games", response_model=List[ArchivedGame])
+async def list_archived_games(category: Optional[str] = None, team_id: Optional[str] = None,
+                              from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None,
+                              limit: int = Query(100, ge=1, le=1000)):
+    """Partidos del archivo histórico (sin puntos), más nuevos primero."""
+    return await storage_runner.run(archive.list_games, category, team_id, from_date, to_date, limit)
+
+
+@app.get("/archive/games/{game_id}", response_model=ArchivedGame)
+async def get_archived_game(game_id: str):
+    """Un partido archivado, con los puntos de cada set."""
+    game = await storage_runner.run(archive.get_game, game_id)
+    if game is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado en el archivo")
+    return game
+
+@app.get("/categories/{category_id}/stats", response_model=TournamentStats)
+async def get_category_stats(category_id: str):
+    """Estadísticas del torneo (una categoría): totales y ranking de equipos."""
+    stats = await storage_runner.run(compute_category_stats, category_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    return stats
+
+
+SSE_PING_SECONDS = 15
+
+@app.get("/games/{game_id}/stream")
+async def stream_game(game_id: str, request: Request):
+    """
+    Marcador en vivo por Server-Sent Events: un 'snapshot' al conectar y
+    después 'delta's compactos (ver live_stream.COMPACT_FIELDS). Con
+    `Accept: application/vnd.voley.frame`, frames binarios (ver wire.py).
+    """
+    binary = wants_frames(request.headers.get("accept"))
+    subscriber = await live_hub.subscribe(game_id, binary)
+    if subscriber is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+
+    async def events():
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(
+                        live_hub.next_message(game_id, subscriber), timeout=SSE_PING_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Comentario SSE (o frame PING) para que proxies no corten la conexión
+                    yield PING_FRAME if binary else ": ping\n\n"
+        finally:
+            live_hub.unsubscribe(game_id, subscriber)
+
+    return StreamingResponse(events(), media_type=FRAME_MEDIA_TYPE if binary else "text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+# --- Repetición (ver replay.py) ---
+
+# En la repetición por SSE, la pausa más larga entre dos eventos (tiempos muertos, entre sets)
+MAX_REPLAY_GAP_SECONDS = 5.0
+
+@app.get("/games/{game_id}/replay", response_model=ReplayState)
+async def get_game_replay(game_id: str, seq: Optional[int] = Query(None, ge=0),
+                          point: Optional[int] = Query(None, ge=0),
+                          at: Optional[datetime.datetime] = None):
+    """
+    El partido en un momento dado: en el evento `seq`, justo después del
+    punto número `point` (contando los del log, también los deshechos) o a
+    la hora `at`. Sin parámetros, al final del log.
+    """
+    if sum(value is not None for value in (seq, point, at)) > 1:
+        raise HTTPException(status_code=400, detail="Usá sólo uno de seq, point o at.")
+    found = await storage_runner.run(replay.seek, game_id, seq, point, at)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+    return replay_state(*found)
+
+
+@app.get("/games/{game_id}/replay/stream")
+async def stream_game_replay(game_id: str, from_seq: int = Query(0, ge=0), to_seq: Optional[int] = Query(None, ge=0),
+                             speed: float = Query(1.0, gt=0, le=1000)):
+    """
+    Repetición por Server-Sent Events: un 'snapshot' con el partido en
+    `from_seq` y un 'event' por cada evento del log hasta `to_seq` (cada uno
+    con el partido después de aplicarlo), al ritmo en que se jugaron
+    dividido `speed`. Termina con un 'end'.
+    """
+    game = await storage_runner.run(storage.get_game, game_id)
+    if game is None:
+        raise HTTPException(status_code=404, detail="Partido no encontrado")
+    end_seq = game.get("event_seq", 0)
+    to_seq = end_seq if to_seq is None else min(to_seq, end_seq)
+    projection, last_event = await storage_runner.run(replay.seek, game_id, min(from_seq, to_seq))
+
+    async def events():
+        yield sse_event("snapshot", ReplayState(**replay_state(projection, last_event)).model_dump_json())
+        previous = projection.timestamp
+        while projection.seq < to_seq:
+            # De a tramos: una repetición larga no carga el log entero
+            chunk = await storage_runner.run(replay.events, game_id, projection.seq, to_seq)
+            if not chunk:
+                break
+            for event in chunk:
+                if previous is not None:
+                    gap = (event["timestamp"] - previous).total_seconds() / speed
+                    if gap > 0:
+                        await asyncio.sleep(min(gap, MAX_REPLAY_GAP_SECONDS))
+                previous = event["timestamp"]
+                projection.apply(event)
+                yield sse_event("event", ReplayState(**replay_state(projection, event)).model_dump_json())
+        yield sse_event("end", str(projection.seq))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
 # --- Servido de Frontend Estático ---
 
+# Todo static/ se carga en memoria al arrancar, ya comprimido (ver static_bundle.py)
+startup_report.mark("app")
+static_bundle = StaticBundle("static")
+startup_report.mark("static")
+
 @app.get("/", include_in_schema=False)
-async def get_index_html():
-    return FileResponse("static/index.html")
+async def get_index_html(request: Request):
+    return static_bundle.page_response(request, "index.html")
 
 @app.get("/game", include_in_schema=False)
-async def get_watcher_game_html():
-    return FileResponse("static/watcher_game.html")
+async def get_watcher_game_html(request: Request):
+    return static_bundle.page_response(request, "watcher_game.html")
 
 @app.get("/login", include_in_schema=False)
-async def get_login_html():
-    return FileResponse("static/login.html")
+async def get_login_html(request: Request):
+    return static_bundle.page_response(request, "login.html")
 
 # Esta ruta está PROTEGIDA con redirección
 @app.get("/manager", include_in_schema=False)
 async def get_manager_html(request: Request):
     if not verify_page_access(request):
+        # Un planillero vuelve a su partido en vez de al login
+        session = sessions.verify(request.cookies.get(COOKIE_NAME))
+        if session is not None and session.games:
+            return RedirectResponse(url=f"/manager/game?id={sorted(session.games)[0]}")
         return RedirectResponse(url="/login")
-    return FileResponse("static/manager.html")
+    return static_bundle.page_response(request, "manager.html", PRIVATE_PAGE_CACHE)
 
 # Esta ruta está PROTEGIDA con redirección
 @app.get("/manager/game", include_in_schema=False)
-async def get_manager_game_html(request: Request):
-    if not verify_page_access(request):
+async def get_manager_game_html(request: Request, id: Optional[str] = None):
+    if not verify_page_access(request, id):
         return RedirectResponse(url="/login")
-    return FileResponse("static/manager_game.html")
-
-app.mount("/static", StaticFiles(directory="static"), name="static")
\ No newline at end of file
+    return static_bundle.page_response(request, "manager_game.html", PRIVATE_PAGE_CACHE)
+
+@app.get("/static/{name}", include_in_schema=False)
+async def get_static_asset(name: str, request: Request):
+    response = static_bundle.asset_response(request, name)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
\ No newline at end of file
@@ -0,0 +1,375 @@
+# metrics.py
+"""
+Métricas por pedido: latencia, lecturas/escrituras/transacciones del
+storage, reintentos de transacción y tamaño de los payloads.
+
+* `MetricsMiddleware` (ASGI) mide cada pedido y lo agrupa por ruta
+  (`/manager/games/{game_id}/increment`, no por ID).
+* `InstrumentedStorage` envuelve al storage y cuenta cada operación. Lo
+  que se cuenta es lo que factura Firestore: una lectura por documento
+  devuelto, una escritura por documento escrito. Si la operación corre
+  dentro de un pedido, se le suma a ese pedido (contextvars; StorageRunner
+  copia el contexto al thread del pool).
+* `GET /metrics` expone todo en el formato de texto de Prometheus.
+* Con METRICS_LOG=1, además, una línea JSON por pedido en el logger
+  `voley.requests`.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from storage import Storage, GameTransaction
+
+
+METRICS_LOG = os.environ.get("METRICS_LOG", "") not in ("", "0")
+
+# Límites de los buckets del histograma de latencia (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("voley.requests")
+if METRICS_LOG and not logger.handlers:
+    # Una línea JSON por pedido, tal cual (Cloud Logging la parsea como jsonPayload)
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+class RequestStats:
+    """Lo que gastó un pedido en el storage."""
+
+    __slots__ = ("reads", "writes", "transactions", "retries")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.transactions = 0
+        self.retries = 0
+
+
+_current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+class _Counter:
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        self.values[labels] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {value:g}"
+
+
+class _Histogram:
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.counts: Dict[Tuple[str, ...], list] = {}
+        self.sums: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[labels] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {self.sums[labels]:g}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+class Metrics:
+    """Registro en memoria del proceso. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        route = ("method", "route")
+        self.requests = _Counter("voley_http_requests_total", "Pedidos HTTP.", route + ("status",))
+        self.latency = _Histogram("voley_http_request_duration_seconds", "Latencia de los pedidos.", route)
+        self.request_bytes = _Counter("voley_http_request_bytes_total", "Bytes recibidos en el cuerpo.", route)
+        self.response_bytes = _Counter("voley_http_response_bytes_total", "Bytes enviados en el cuerpo.", route)
+        self.reads = _Counter("voley_storage_reads_total", "Documentos leídos, por ruta.", route)
+        self.writes = _Counter("voley_storage_writes_total", "Documentos escritos, por ruta.", route)
+        self.transactions = _Counter("voley_storage_transactions_total", "Transacciones, por ruta.", route)
+        self.retries = _Counter("voley_storage_transaction_retries_total", "Reintentos de transacción, por ruta.", route)
+        self.operations = _Counter("voley_storage_operations_total", "Llamadas al storage.", ("operation",))
+        self.operation_latency = _Histogram("voley_storage_operation_duration_seconds",
+                                            "Latencia de las llamadas al storage.", ("operation",))
+        self._all = (self.requests, self.latency, self.request_bytes, self.response_bytes,
+                     self.reads, self.writes, self.transactions, self.retries,
+                     self.operations, self.operation_latency)
+
+    def record_request(self, method: str, route: str, status: int, seconds: float,
+                       request_bytes: int, response_bytes: int, stats: RequestStats):
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc(labels + (str(status),))
+            self.latency.observe(labels, seconds)
+            self.request_bytes.inc(labels, request_bytes)
+            self.response_bytes.inc(labels, response_bytes)
+            self.reads.inc(labels, stats.reads)
+            self.writes.inc(labels, stats.writes)
+            self.transactions.inc(labels, stats.transactions)
+            self.retries.inc(labels, stats.retries)
+
+    def record_operation(self, operation: str, seconds: float, reads: int = 0, writes: int = 0,
+                         transactions: int = 0, retries: int = 0):
+        with self._lock:
+            self.operations.inc((operation,))
+            self.operation_latency.observe((operation,), seconds)
+            if _current_request.get() is None:
+                # Fuera de un pedido (listeners, arranque): se anota aparte
+                labels = ("", "(background)")
+                self.reads.inc(labels, reads)
+                self.writes.inc(labels, writes)
+                self.transactions.inc(labels, transactions)
+                self.retries.inc(labels, retries)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [line for metric in self._all for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """ASGI puro (no BaseHTTPMiddleware) para no romper el streaming de SSE."""
+
+    def __init__(self, app, registry: Metrics = metrics, log_requests: bool = METRICS_LOG):
+        self.app = app
+        self.registry = registry
+        self.log_requests = log_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        start = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        response_status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                response_status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            _current_request.reset(token)
+            seconds = time.perf_counter() - start
+            # El router deja la ruta que matcheó en el scope; sin ruta (404), no agrupamos por path
+            route = getattr(scope.get("route"), "path", None) or "(sin ruta)"
+            self.registry.record_request(scope["method"], route, response_status[0], seconds,
+                                         sizes["request"], sizes["response"], stats)
+            if self.log_requests:
+                logger.info(json.dumps({
+                    "method": scope["method"], "route": route, "path": scope["path"],
+                    "status": response_status[0], "ms": round(seconds * 1000, 2),
+                    "reads": stats.reads, "writes": stats.writes,
+                    "transactions": stats.transactions, "retries": stats.retries,
+                    "request_bytes": sizes["request"], "response_bytes": sizes["response"],
+                }))
+
+
+# --- Storage ---
+
+# Operación -> cómo se cuentan lecturas/escrituras (ver InstrumentedStorage)
+_READ_ONE = ("get_category", "get_team", "get_game", "get_game_versioned", "get_latest_snapshot")
+_READ_MANY = ("list_categories", "list_teams", "get_teams", "list_games", "query_games", "list_sets", "list_events",
+              "list_snapshot_marks")
+_WRITE_ONE = ("put_category", "put_team", "update_game", "put_snapshot")
+
+
+def _count_docs(result) -> int:
+    if isinstance(result, (list, dict)):
+        return max(1, len(result)) # Firestore cobra una lectura aunque la consulta venga vacía
+    return 1
+
+
+class _CountingTransaction(GameTransaction):
+    """Cuenta lo que hace `fn` dentro de una transacción (o de una escritura condicional)."""
+
+    def __init__(self, inner, counts: Dict[str, int]):
+        self._inner = inner
+        self._counts = counts
+
+    def get_game(self):
+        self._counts["reads"] += 1
+        return self._inner.get_game()
+
+    def get_set(self, set_number):
+        self._counts["reads"] += 1
+        return self._inner.get_set(set_number)
+
+    def update_game(self, fields):
+        self._counts["writes"] += 1
+        return self._inner.update_game(fields)
+
+    def update_set(self, set_number, fields):
+        self._counts["writes"] += 1
+        return self._inner.update_set(set_number, fields)
+
+    def create_set(self, set_number, data):
+        self._counts["writes"] += 1
+        return self._inner.create_set(set_number, data)
+
+    def delete_set(self, set_number):
+        self._counts["writes"] += 1
+        return self._inner.delete_set(set_number)
+
+    def append_event(self, event):
+        self._counts["writes"] += 1
+        return self._inner.append_event(event)
+
+
+class InstrumentedStorage(Storage):
+    """
+    Envuelve un storage y cuenta cada operación. Lo demás (atributos propios
+    del motor, p.ej. `db`) pasa directo al storage envuelto.
+    """
+
+    def __init__(self, inner: Storage, registry: Metrics = metrics):
+        self._inner = inner
+        self._registry = registry
+        self.blocking = inner.blocking
+        for name in _READ_ONE + _READ_MANY + _WRITE_ONE:
+            setattr(self, name, self._wrap(name))
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def connect(self):
+        self._inner.connect()
+
+    def _record(self, operation: str, start: float, reads=0, writes=0, transactions=0, retries=0):
+        stats = _current_request.get()
+        if stats is not None:
+            stats.reads += reads
+            stats.writes += writes
+            stats.transactions += transactions
+            stats.retries += retries
+        self._registry.record_operation(operation, time.perf_counter() - start,
+                                        reads, writes, transactions, retries)
+
+    def _wrap(self, name: str) -> Callable:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            # Se busca en cada llamada: alguien pudo reemplazar el método del motor (benchmarks)
+            result = getattr(self._inner, name)(*args, **kwargs)
+            if name in _READ_ONE:
+                self._record(name, start, reads=1)
+            elif name in _READ_MANY:
+                self._record(name, start, reads=_count_docs(result))
+            else:
+                self._record(name, start, writes=1)
+            return result
+        wrapper.__name__ = name
+        return wrapper
+
+    def create_game(self, game_data, first_set):
+        start = time.perf_counter()
+        result = self._inner.create_game(game_data, first_set)
+        self._record("create_game", start, writes=2)
+        return result
+
+    def create_games(self, games):
+        start = time.perf_counter()
+        result = self._inner.create_games(games)
+        self._record("create_games", start, writes=2 * len(games))
+        return result
+
+    def delete_game(self, game_id):
+        start = time.perf_counter()
+        deleted = self._inner.delete_game(game_id)
+        # En Firestore hay que listar las subcolecciones para borrarlas: una lectura por documento
+        self._record("delete_game", start, reads=deleted, writes=deleted)
+        return deleted
+
+    def watch_game(self, game_id, callback):
+        def counting_callback(data):
+            # Cada cambio que manda el listener es una lectura facturada
+            self._registry.record_operation("watch_game", 0.0, reads=1)
+            callback(data)
+        return self._inner.watch_game(game_id, counting_callback)
+
+    def run_game_transaction(self, game_id, fn):
+        counts = {"reads": 0, "writes": 0, "attempts": 0}
+
+        def counted_fn(transaction):
+            # Firestore vuelve a llamar a fn en cada reintento
+            counts["attempts"] += 1
+            counts["writes"] = 0 # Sólo cuentan las escrituras del intento que se confirma
+            return fn(_CountingTransaction(transaction, counts))
+
+        start = time.perf_counter()
+        try:
+            return self._inner.run_game_transaction(game_id, counted_fn)
+        finally:
+            self._record("run_game_transaction", start, reads=counts["reads"], writes=counts["writes"],
+                         transactions=1, retries=max(0, counts["attempts"] - 1))
+
+    def write_game_if_version(self, game_id, version, fn):
+        counts = {"reads": 0, "writes": 0}
+        start = time.perf_counter()
+        try:
+            return self._inner.write_game_if_version(
+                game_id, version, lambda writer: fn(_CountingTransaction(writer, counts))
+            )
+        finally:
+            self._record("write_game_if_version", start, writes=counts["writes"])
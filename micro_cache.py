@@ -0,0 +1,112 @@
+# micro_cache.py
+"""
+Micro-cache compartido para las lecturas públicas (espectadores).
+
+Con mil celulares mirando un partido, mil GET casi juntos eran mil lecturas
+al storage. Acá cada respuesta (etag, cuerpo JSON ya codificado) vale
+MICRO_CACHE_MS (250 ms por defecto) para todos, y mientras una se está
+cargando los pedidos que llegan esperan esa misma carga en vez de lanzar
+otra (request coalescing). Así, por clave, hay como mucho una lectura al
+storage cada MICRO_CACHE_MS (más las que siguen a una escritura), sin
+importar cuánta gente mire.
+
+`invalidate(key)` descarta una entrada (se llama en cada escritura del
+partido, así quien pide justo después de un cambio no espera el TTL). Una
+carga que estaba en vuelo cuando se invalidó la clave se entrega a quienes
+la esperaban, pero no se guarda.
+
+Vive en el event loop (sin lock). `invalidate` se puede llamar desde
+cualquier thread: desde el pool del storage se pasa al loop con
+`call_soon_threadsafe`, como LiveHub.publish. Las escrituras del camino
+lento devuelven su resultado al loop por el mismo camino y después, así que
+el pedido que escribió ya encuentra la clave invalidada.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+MICRO_CACHE_MS = float(os.environ.get("MICRO_CACHE_MS", "250"))
+
+
+class MicroCache:
+
+    def __init__(self, ttl_seconds: float = MICRO_CACHE_MS / 1000, max_entries: int = 4096):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # clave -> (cargado en, valor)
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {} # Sólo de las claves con una carga en vuelo
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.hits = 0
+        self.coalesced = 0
+        self.loads = 0
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """El valor de `key`: del cache, de la carga en vuelo, o `await load()`."""
+        self._loop = asyncio.get_running_loop()
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self._ttl:
+            self.hits += 1
+            return entry[1]
+
+        future = self._loading.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            # En una tarea aparte: si el pedido que la lanzó se corta, los demás la siguen esperando
+            # La generación se toma al registrar la carga: una invalidación antes de que arranque también cuenta
+            generation = self._generations.get(key, 0)
+            future = self._loading[key] = asyncio.ensure_future(self._load(key, load, generation))
+            # Que un error sin nadie esperando no quede como "exception was never retrieved"
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(future)
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        self.loads += 1
+        try:
+            value = await load()
+        finally:
+            self._loading.pop(key, None)
+            invalidated = self._generations.pop(key, 0) != generation
+        # Los errores no se guardan: el próximo pedido vuelve a intentar
+        if not invalidated:
+            self._put(key, value)
+        return value
+
+    def invalidate(self, key: str):
+        loop = self._loop
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if loop is not None and not on_loop:
+            try:
+                loop.call_soon_threadsafe(self._invalidate, key)
+                return
+            except RuntimeError:
+                pass # Loop cerrado: ya no hay cargas en vuelo que cuidar
+        self._invalidate(key)
+
+    def _invalidate(self, key: str):
+        # Corre en el event loop
+        self._entries.pop(key, None)
+        # Sin una carga en vuelo no hay nada que marcar: no queda nada por clave
+        if key in self._loading:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _put(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def render(self) -> str:
+        """Métricas en formato Prometheus (se suman a /metrics)."""
+        lines = ["# HELP voley_micro_cache_requests_total Pedidos públicos por resultado del micro-cache.",
+                 "# TYPE voley_micro_cache_requests_total counter"]
+        for result, count in (("hit", self.hits), ("coalesced", self.coalesced), ("load", self.loads)):
+            lines.append(f'voley_micro_cache_requests_total{{result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
@@ -1,7 +1,9 @@
 # models.py
 import datetime
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, List, Optional
+
+import wire
 
 # --- Modelos de Base de Datos ---
 
@@ -9,6 +11,15 @@ class Category(BaseModel): # <--- NUEVO
     id: str
     name: str
     order: int = 0 # Para ordenar en el selector (ej: 1 para A, 2 para B)
+    rules: Optional[Dict[str, Any]] = None # Reglas propias (parciales, ver rules.py)
+
+class GameRules(BaseModel):
+    """Reglas con las que se cierran solos los sets y el partido (ver rules.py)"""
+    set_points: int = Field(25, ge=1)
+    tiebreak_points: int = Field(15, ge=1)  # Set decisivo
+    win_by: int = Field(2, ge=1)
+    best_of: int = Field(5, ge=1)
+    auto_close: bool = True
 
 class Team(BaseModel):
     id: str
@@ -32,14 +43,26 @@ class GameDocument(BaseModel):
     current_team2_score: int = 0
     team1_sets_won: int = 0             # Contador de sets ganados
     team2_sets_won: int = 0             # Contador de sets ganados
+    team1_points: int = 0               # Puntos de los sets cerrados (ver standings.py)
+    team2_points: int = 0
 
+    category_id: Optional[str] = None
     category_name: Optional[str] = None # Denormalizado para mostrar en el lobby
     team1_flag: Optional[str] = None    # Denormalizado
     team2_flag: Optional[str] = None    # Denormalizado
 
+    version: int = 0                    # Se incrementa en cada escritura (ver storage.py)
+    event_seq: int = 0                  # Último evento aplicado del log (ver event_log.py)
+    event_log: bool = False             # Creado con el log (False: partido viejo, con sets/{n}/points)
+    rules: Optional[GameRules] = None   # Reglas del partido (None: partido viejo, usa las globales)
+
 class GameListResponse(GameDocument):
     id: str
 
+    def to_frame(self) -> bytes:
+        """Frame SNAPSHOT: el partido completo, en JSON (ver wire.py)"""
+        return wire.snapshot_frame(self.model_dump_json().encode("utf-8"))
+
 class SetDocument(BaseModel):
     """Modelo para el sub-documento 'sets/{set_number}'"""
     set_number: int
@@ -48,13 +71,218 @@ class SetDocument(BaseModel):
     team2_current_score: int
     winner_id: Optional[str] = None
 
+class GameDetail(GameListResponse):
+    """Respuesta de GET /games/{game_id} (pública): el partido con sus sets"""
+    sets: List[SetDocument]
+
 class PointDocument(BaseModel):
-    """Modelo para el sub-documento 'points/{point_id}'"""
+    """Un punto del historial (derivado del log de eventos)"""
     timestamp: datetime.datetime
     scoring_team_id: str # El ID del equipo que anotó
     team1_score_after: int # Score resultante
     team2_score_after: int # Score resultante
 
+    def to_frame(self, set_number: int, team1_id: str) -> bytes:
+        """Frame POINT (15 bytes, ver wire.py)"""
+        return wire.point_frame(set_number, 0 if self.scoring_team_id == team1_id else 1,
+                                self.team1_score_after, self.team2_score_after, self.timestamp)
+
+class GameEvent(BaseModel):
+    """Modelo para el sub-documento 'events/{seq}' (log append-only, ver event_log.py)"""
+    seq: int
+    type: str # "point", "undo", "finish_set", "cancel_set", "finish_game", "cancel_game", "reopen_set", "reopen_game"
+    timestamp: datetime.datetime
+    set_number: Optional[int] = None
+    team_id: Optional[str] = None # Equipo que anotó / ganó
+
+class ReplaySet(BaseModel):
+    set_number: int
+    status: str # "live", "finished", "cancelled"
+    winner_id: Optional[str] = None
+    team1_score: int
+    team2_score: int
+
+class ReplayState(BaseModel):
+    """El partido en un momento del log (ver replay.py)"""
+    seq: int                            # Último evento aplicado (0: antes del primero)
+    timestamp: Optional[datetime.datetime] = None
+    point: Optional[int] = None         # Eventos 'point' hasta acá (los deshechos también)
+    status: str
+    winner_id: Optional[str] = None
+    current_set_number: int
+    current_team1_score: int
+    current_team2_score: int
+    team1_sets_won: int
+    team2_sets_won: int
+    sets: List[ReplaySet]
+    last_event: Optional[GameEvent] = None
+
+class LobbyGame(BaseModel):
+    """Una tarjeta del lobby: sólo lo que se muestra (ver lobby.py)"""
+    id: str
+    team1_id: str
+    team2_id: str
+    team1_name: str
+    team2_name: str
+    team1_flag: Optional[str] = None
+    team2_flag: Optional[str] = None
+    category_name: Optional[str] = None
+    status: str
+    created_at: datetime.datetime
+    winner_id: Optional[str] = None
+    current_set_number: int = 1
+    current_team1_score: int = 0
+    current_team2_score: int = 0
+    team1_sets_won: int = 0
+    team2_sets_won: int = 0
+
+class LobbyResponse(BaseModel):
+    live: List[LobbyGame]
+    upcoming: List[LobbyGame]
+    finished: List[LobbyGame] # Los últimos 10
+
+
+class StandingRow(BaseModel):
+    """Un equipo en la tabla de posiciones (ver standings.py)"""
+    position: int
+    team_id: str
+    team_name: Optional[str] = None
+    team_flag: Optional[str] = None
+    played: int
+    wins: int
+    losses: int
+    table_points: int                   # 3 por ganar; 2 y 1 si se jugó el set decisivo
+    sets_won: int
+    sets_lost: int
+    set_ratio: Optional[float] = None   # None: no perdió ningún set
+    points_won: int
+    points_lost: int
+    point_ratio: Optional[float] = None
+
+class StandingsResponse(BaseModel):
+    """Respuesta de GET /categories/{category_id}/standings"""
+    category_id: str
+    category_name: str
+    teams: List[StandingRow]
+
+class TeamResult(BaseModel):
+    game_id: str
+    created_at: Optional[datetime.datetime] = None
+    rival_id: str
+    rival_name: Optional[str] = None
+    won: bool
+    sets_won: int
+    sets_lost: int
+    points_won: int
+    points_lost: int
+
+class TeamStanding(StandingRow):
+    """Respuesta de GET /categories/{category_id}/standings/{team_id}"""
+    results: List[TeamResult]           # Del más nuevo al más viejo
+
+
+class TeamStats(BaseModel):
+    """Estadísticas de un equipo (ver analytics.py)"""
+    team_id: str
+    points: int = 0
+    longest_run: int = 0                # Puntos seguidos
+    side_outs: int = 0                  # Rallies ganados recibiendo
+    side_out_opportunities: int = 0     # Rallies jugados recibiendo
+    side_out_rate: Optional[float] = None
+    break_points: int = 0               # Rallies ganados sacando
+
+class StatsSummary(BaseModel):
+    points: int
+    team1: TeamStats
+    team2: TeamStats
+    lead_changes: int
+    ties: int                           # Empates después de un punto (sin contar 0-0)
+    duration_seconds: float             # Del primer al último punto
+    avg_point_seconds: Optional[float] = None # Ritmo: segundos entre puntos
+    max_point_seconds: Optional[float] = None
+
+class SetStats(StatsSummary):
+    set_number: int
+    status: str
+
+class GameStats(BaseModel):
+    """Respuesta de GET /games/{game_id}/stats"""
+    game_id: str
+    status: str
+    event_seq: int                      # Último evento incluido
+    totals: StatsSummary
+    sets: List[SetStats]
+
+class TournamentTeamStats(TeamStats):
+    games: int = 0
+
+class TournamentStats(BaseModel):
+    """Respuesta de GET /categories/{category_id}/stats"""
+    category_id: str
+    category_name: str
+    games: int
+    sets: int
+    points: int
+    lead_changes: int
+    avg_set_seconds: Optional[float] = None
+    avg_point_seconds: Optional[float] = None
+    teams: List[TournamentTeamStats]    # Ordenados por puntos
+
+
+class ArchivedSet(BaseModel):
+    set_number: int
+    status: str
+    winner_id: Optional[str] = None
+    team1_score: int = 0                # Score final
+    team2_score: int = 0
+    points: Optional[List[PointDocument]] = None # Sólo en el detalle del partido
+
+class ArchivedGame(BaseModel):
+    """Partido del archivo histórico (ver archive.py)"""
+    id: str
+    team1_id: str
+    team2_id: str
+    team1_name: str
+    team2_name: str
+    team1_flag: Optional[str] = None
+    team2_flag: Optional[str] = None
+    category_id: Optional[str] = None
+    category_name: Optional[str] = None
+    status: str
+    winner_id: Optional[str] = None
+    created_at: datetime.datetime
+    team1_sets_won: int = 0
+    team2_sets_won: int = 0
+    sets: List[ArchivedSet]
+
+class ArchiveRunResponse(BaseModel):
+    """Respuesta de POST /manager/archive/run"""
+    archived: int
+    game_ids: List[str]
+    segments: List[str]                 # Archivos escritos en esta corrida
+
+
+# --- Modelos de Estado en Memoria ---
+
+class LiveGameState(BaseModel):
+    """Lo mínimo que necesita increment_score, cacheado por partido (ver game_cache.py)"""
+    team1_id: str
+    team2_id: str
+    status: str
+    current_set_number: int = 1
+    current_team1_score: int = 0
+    current_team2_score: int = 0
+    team1_sets_won: int = 0
+    team2_sets_won: int = 0
+    team1_points: int = 0
+    team2_points: int = 0
+    winner_id: Optional[str] = None
+    event_seq: int = 0
+    client_seqs: Dict[str, int] = {}    # Última operación aplicada de cada cliente (ver client_ops.py)
+    rules: Optional[GameRules] = None
+    revision: int = 0                   # El campo 'version' del game doc
+    version: Any = None                 # Token opaco del storage (int local, update_time en Firestore)
+
 
 # --- Modelos de Request (API) ---
 
@@ -63,6 +291,12 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class ScorerTokenResponse(BaseModel):
+    """Respuesta de POST /manager/games/{game_id}/scorer_token"""
+    token: str
+    expires_at: int # Epoch en segundos
+    login_url: str  # Abre el partido con la sesión de planillero
+
 class GameCreate(BaseModel):
     """Modelo para la request POST /manager/games"""
     team1_id: str
@@ -70,23 +304,87 @@ class GameCreate(BaseModel):
 
     category_id: Optional[str] = None
 
-class SetFinish(BaseModel):
+class FixtureCreate(BaseModel):
+    """Modelo para la request POST /manager/games/bulk (un fixture completo)"""
+    games: List[GameCreate] = Field(..., max_length=2000)
+
+class FixtureItemResult(BaseModel):
+    index: int                      # Posición en la lista enviada
+    ok: bool
+    game_id: Optional[str] = None
+    detail: Optional[str] = None    # Motivo, si falló
+
+class FixtureResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[FixtureItemResult]
+
+class ClientOp(BaseModel):
+    """
+    Clave de idempotencia opcional de las operaciones del planillero (ver client_ops.py).
+    También es el body (opcional) de undo_point y cancel.
+    """
+    client_id: Optional[str] = Field(None, max_length=64)
+    client_seq: Optional[int] = Field(None, ge=1)
+
+class SetFinish(ClientOp):
     """Modelo para la request POST /manager/games/{game_id}/finish_set"""
     set_number: int
     winner_team_id: str
 
-class SetCancel(BaseModel): # <--- (AÑADE ESTA CLASE)
+class SetCancel(ClientOp): # <--- (AÑADE ESTA CLASE)
     """Modelo para la request POST /manager/games/{game_id}/cancel_set"""
     set_number: int
 
-class GameFinish(BaseModel):
+class GameFinish(ClientOp):
     """Modelo para la request POST /manager/games/{game_id}/finish_game"""
     winner_team_id: str
 
-class PointCreate(BaseModel):
+class PointCreate(ClientOp):
     """
     Modelo para la request POST /manager/games/{game_id}/increment
     Este es el que faltaba.
     """
     set_number: int
-    scoring_team_id: str # El ID del equipo que anotó (ej: "los_condores")
\ No newline at end of file
+    scoring_team_id: str # El ID del equipo que anotó (ej: "los_condores")
+
+class PointBatchCreate(BaseModel):
+    """Modelo para la request POST /manager/games/{game_id}/increment_batch"""
+    points: List[PointCreate] # En el orden en que se jugaron
+
+class PointBatchResponse(BaseModel):
+    """Scores finales después de aplicar una tanda de puntos"""
+    set_number: int
+    team1_score: int
+    team2_score: int
+    points: List[PointDocument]
+
+    def to_frame(self, team1_id: str) -> bytes:
+        """Un frame SCORE con el resultado y un POINT por punto (ver wire.py)"""
+        return wire.score_frame(self.set_number, self.team1_score, self.team2_score) + b"".join(
+            point.to_frame(self.set_number, team1_id) for point in self.points
+        )
+
+class SyncOperation(BaseModel):
+    """Una operación de la cola offline del planillero"""
+    client_seq: int = Field(..., ge=1)
+    type: str # "point", "undo", "finish_set", "cancel_set", "finish_game", "cancel_game"
+    set_number: Optional[int] = None
+    team_id: Optional[str] = None # Equipo que anotó / ganó
+
+class SyncRequest(BaseModel):
+    """Modelo para la request POST /manager/games/{game_id}/sync"""
+    client_id: str = Field(..., min_length=1, max_length=64)
+    operations: List[SyncOperation] = Field(..., max_length=2000)
+
+class SyncOperationResult(BaseModel):
+    client_seq: int
+    status: str # "applied", "duplicate" (ya estaba aplicada), "rejected"
+    detail: Optional[str] = None
+
+class SyncResponse(BaseModel):
+    applied: int
+    duplicates: int
+    rejected: int
+    results: List[SyncOperationResult]
+    game: Optional[GameDocument] = None # Estado después de la cola, para que el cliente se alinee
@@ -0,0 +1,138 @@
+# reference_cache.py
+"""
+Cache de datos de referencia: equipos y categorías.
+
+Cambian sólo entre torneos, así que se cargan completos (una consulta por
+colección) y se sirven desde memoria, indexados por id y por category_id.
+La carga vence a los REFERENCE_TTL_SECONDS; también se puede invalidar a
+mano (POST /manager/reference/invalidate) después de editar equipos en la
+consola de Firestore.
+
+Si se pide un equipo o una categoría que no está (p.ej. cargada después
+del último refresco), se lee del storage (los equipos faltantes, con una
+sola lectura en lote) y queda en el cache.
+"""
+import os
+import time
+import bisect
+import threading
+from typing import Dict, List, Optional
+
+from storage import Storage
+
+
+REFERENCE_TTL_SECONDS = float(os.environ.get("REFERENCE_TTL_SECONDS", "600"))
+
+
+class ReferenceCache:
+
+    def __init__(self, storage: Storage, ttl_seconds: float = REFERENCE_TTL_SECONDS):
+        self._storage = storage
+        self._ttl = ttl_seconds
+        self._categories: List[dict] = [] # Ordenadas por 'order', como las devuelve el storage
+        self._categories_by_id: Dict[str, dict] = {}
+        self._teams: Dict[str, dict] = {}
+        self._team_ids: List[str] = [] # Ordenados, para paginar (ver listing.py)
+        self._team_ids_by_category: Dict[str, List[str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Carga (o recarga) las dos colecciones completas."""
+        # Por ('order', id): el cursor de page_categories necesita un orden total
+        categories = sorted(self._storage.list_categories(), key=lambda c: (c.get("order", 0), c["id"]))
+        teams = self._storage.list_teams()
+        with self._lock:
+            self._categories = categories
+            self._categories_by_id = {c["id"]: c for c in categories}
+            self._teams = {}
+            self._team_ids = []
+            self._team_ids_by_category = {}
+            for team in teams:
+                self._add_team(team)
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self._ttl:
+            self.load()
+
+    def _add_team(self, team: dict):
+        # Siempre con el lock tomado
+        self._teams[team["id"]] = team
+        bisect.insort(self._team_ids, team["id"])
+        bisect.insort(self._team_ids_by_category.setdefault(team.get("category_id"), []), team["id"])
+
+    def _add_category(self, category: dict):
+        # Siempre con el lock tomado. Lista nueva: page_categories la recorre sin lock
+        categories = list(self._categories)
+        keys = [(c.get("order", 0), c["id"]) for c in categories]
+        categories.insert(bisect.bisect(keys, (category.get("order", 0), category["id"])), category)
+        self._categories = categories
+        self._categories_by_id[category["id"]] = category
+
+    # --- Categorías ---
+
+    def list_categories(self) -> List[dict]:
+        self._ensure_loaded()
+        return [dict(c) for c in self._categories]
+
+    def get_category(self, category_id: str) -> Optional[dict]:
+        """Categoría por id. Si no está (creada después del último refresco), se lee del storage."""
+        self._ensure_loaded()
+        with self._lock:
+            category = self._categories_by_id.get(category_id)
+        if category is None:
+            data = self._storage.get_category(category_id)
+            if data is None:
+                return None
+            category = dict(data, id=category_id)
+            with self._lock:
+                if category_id not in self._categories_by_id:
+                    self._add_category(category)
+        return dict(category)
+
+    def page_categories(self, after: Optional[tuple], limit: Optional[int]) -> List[dict]:
+        """Categorías por ('order', id), las `limit` que siguen a `after`."""
+        self._ensure_loaded()
+        categories = self._categories
+        if after is not None:
+            after = tuple(after)
+            categories = [c for c in categories if (c.get("order", 0), c["id"]) > after]
+        return [dict(c) for c in categories[:limit]]
+
+    # --- Equipos ---
+
+    def list_teams(self, category_id: Optional[str] = None) -> List[dict]:
+        self._ensure_loaded()
+        with self._lock:
+            team_ids = self._team_ids_by_category.get(category_id, []) if category_id else self._team_ids
+            return [dict(self._teams[tid]) for tid in team_ids]
+
+    def page_teams(self, category_id: Optional[str], after_id: Optional[str], limit: Optional[int]) -> List[dict]:
+        """Equipos por id, los `limit` que siguen a `after_id` (sin copiar la lista entera)."""
+        self._ensure_loaded()
+        with self._lock:
+            team_ids = self._team_ids_by_category.get(category_id, []) if category_id else self._team_ids
+            start = bisect.bisect_right(team_ids, after_id) if after_id is not None else 0
+            end = None if limit is None else start + limit
+            return [dict(self._teams[tid]) for tid in team_ids[start:end]]
+
+    def get_teams(self, team_ids: List[str]) -> Dict[str, dict]:
+        """Equipos por id. Los que falten se buscan todos juntos en una sola lectura."""
+        self._ensure_loaded()
+        with self._lock:
+            found = {tid: dict(self._teams[tid]) for tid in team_ids if tid in self._teams}
+        missing = [tid for tid in team_ids if tid not in found]
+        if missing:
+            fetched = self._storage.get_teams(missing)
+            with self._lock:
+                for tid, data in fetched.items():
+                    if tid not in self._teams:
+                        self._add_team(dict(data, id=tid))
+                    found[tid] = dict(data, id=tid)
+        return found
@@ -0,0 +1,250 @@
+# replay.py
+"""
+Repetición del partido: el estado en cualquier momento del log.
+
+Para un reclamo ("¿cuánto iba cuando cobraron esa pelota?") o una
+repetición en la transmisión hace falta el partido en un momento dado: en
+un evento del log (`seq`), después del n-ésimo punto (`point`, contando los
+puntos del log, también los que después se deshicieron) o a una hora
+(`at`).
+
+Los snapshots del log (ver event_log.py) son los puntos de control: cada
+uno guarda, además del partido, el `seq`, la hora y la cantidad de puntos
+hasta ahí. Por partido se arma un índice en memoria con esos tres datos
+(una consulta liviana, sin el contenido de los snapshots), así que buscar
+es:
+
+1. bisect en el índice: el último punto de control antes del momento
+   pedido (O(log n));
+2. leer ese snapshot (una lectura);
+3. aplicar los eventos hasta el momento pedido, que como mucho son los que
+   hay hasta el punto de control siguiente (CHECKPOINT_EVERY).
+
+Si al log le faltan puntos de control (partidos jugados sin la proyección
+en memoria, snapshots viejos sin hora ni cantidad de puntos), la primera
+búsqueda recorre el tramo que falta una vez y los escribe; las siguientes,
+en este proceso o en otro, ya no.
+
+`events()` entrega el log por tramos, para repetir el partido por SSE sin
+cargarlo entero.
+"""
+import bisect
+import datetime
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from event_log import GameProjection, SNAPSHOT_EVERY, initial_projection
+from storage import Storage
+
+
+CHECKPOINT_EVERY = SNAPSHOT_EVERY
+
+# Tramo de eventos que se lee de una vez (backfill y stream)
+EVENTS_CHUNK = 500
+
+
+def _as_datetime(value) -> Optional[datetime.datetime]:
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+class _CheckpointIndex:
+    """Puntos de control de un partido, en orden de seq (listas paralelas para bisect)."""
+
+    __slots__ = ("seqs", "timestamps", "point_events")
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.timestamps: List[datetime.datetime] = []
+        self.point_events: List[int] = []
+
+    def add(self, seq: int, timestamp: datetime.datetime, point_events: int):
+        index = bisect.bisect_left(self.seqs, seq)
+        if index < len(self.seqs) and self.seqs[index] == seq:
+            return
+        self.seqs.insert(index, seq)
+        self.timestamps.insert(index, timestamp)
+        self.point_events.insert(index, point_events)
+
+    def first_gap(self, end_seq: int, every: int) -> Optional[int]:
+        """seq desde el que faltan puntos de control (hueco de más de `every`), o None."""
+        previous = 0
+        for seq in self.seqs + [end_seq]:
+            if seq - previous > every:
+                return previous
+            previous = seq
+        return None
+
+
+def replay_state(projection: GameProjection, last_event: Optional[dict]) -> dict:
+    """El partido en ese momento, sin la lista de puntos (ver ReplayState)."""
+    score_t1, score_t2 = projection.scores(projection.current_set_number)
+    return {
+        "seq": projection.seq,
+        "timestamp": projection.timestamp,
+        "point": projection.point_events,
+        "status": projection.status,
+        "winner_id": projection.winner_id,
+        "current_set_number": projection.current_set_number,
+        "current_team1_score": score_t1,
+        "current_team2_score": score_t2,
+        "team1_sets_won": projection.team1_sets_won,
+        "team2_sets_won": projection.team2_sets_won,
+        "sets": [
+            {
+                "set_number": n, "status": game_set["status"], "winner_id": game_set["winner_id"],
+                "team1_score": projection.scores(n)[0], "team2_score": projection.scores(n)[1],
+            }
+            for n, game_set in sorted(projection.sets.items())
+        ],
+        "last_event": last_event,
+    }
+
+
+class GameReplay:
+
+    def __init__(self, storage: Storage, checkpoint_every: int = CHECKPOINT_EVERY, max_games: int = 256):
+        self._storage = storage
+        self._every = checkpoint_every
+        self._max_games = max_games
+        self._indexes: "OrderedDict[str, _CheckpointIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seek(self, game_id: str, seq: Optional[int] = None, point: Optional[int] = None,
+             at: Optional[datetime.datetime] = None) -> Optional[Tuple[GameProjection, Optional[dict]]]:
+        """
+        (proyección, último evento aplicado) en el momento pedido: en `seq`,
+        justo después del punto número `point` o a la hora `at`. Sin nada,
+        el final del log. None si el partido no existe.
+        """
+        game = self._storage.get_game(game_id)
+        if game is None:
+            return None
+        end_seq = game.get("event_seq", 0)
+        index = self._index(game_id, game, end_seq)
+        at = _as_datetime(at)
+
+        # 1. Último punto de control antes del momento pedido
+        if seq is not None:
+            seq = max(0, min(seq, end_seq))
+            i = bisect.bisect_right(index.seqs, seq) - 1
+        elif point is not None:
+            # Estrictamente antes: el estado es el de justo después de ese punto
+            i = bisect.bisect_left(index.point_events, point) - 1
+        elif at is not None:
+            i = bisect.bisect_right(index.timestamps, at) - 1
+        else:
+            seq = end_seq
+            i = bisect.bisect_right(index.seqs, seq) - 1
+
+        # 2. Su snapshot (o el partido antes del log, si no hay ninguno antes)
+        projection = None
+        if i >= 0:
+            snapshot = self._storage.get_latest_snapshot(game_id, max_seq=index.seqs[i])
+            if snapshot is not None and snapshot["seq"] == index.seqs[i]:
+                projection = GameProjection.from_dict(snapshot)
+        if projection is None:
+            i = -1
+            projection = initial_projection(self._storage, game_id, game)
+
+        # 3. Los eventos hasta el momento pedido (como mucho, hasta el punto de control siguiente)
+        upto = index.seqs[i + 1] if i + 1 < len(index.seqs) else end_seq
+        if seq is not None:
+            upto = min(upto, seq)
+        last_event = None
+        if point is not None and projection.point_events >= point:
+            upto = projection.seq # Punto 0 (o antes del primero): no hay nada que aplicar
+        for event in self._storage.list_events(game_id, after_seq=projection.seq, upto_seq=upto):
+            if at is not None and _as_datetime(event["timestamp"]) > at:
+                break
+            projection.apply(event)
+            last_event = event
+            if point is not None and projection.point_events >= point:
+                break
+        return projection, last_event
+
+    def events(self, game_id: str, after_seq: int, upto_seq: int) -> List[dict]:
+        """
+        Un tramo del log: hasta EVENTS_CHUNK eventos con seq > after_seq y
+        <= upto_seq. Vacío, se terminó (para el stream y el backfill).
+        """
+        while after_seq < upto_seq:
+            limit = min(after_seq + EVENTS_CHUNK, upto_seq)
+            chunk = self._storage.list_events(game_id, after_seq=after_seq, upto_seq=limit)
+            if chunk:
+                return chunk
+            # Un hueco en el log no debería pasar, pero no cortamos ahí
+            after_seq = limit
+        return []
+
+    # --- Índice de puntos de control ---
+
+    def _index(self, game_id: str, game: dict, end_seq: int) -> _CheckpointIndex:
+        with self._lock:
+            index = self._indexes.get(game_id)
+            if index is not None:
+                self._indexes.move_to_end(game_id)
+
+        gap = None
+        if index is not None:
+            gap = index.first_gap(end_seq, self._every)
+        if index is None or gap is not None:
+            # Primera vez, o el partido siguió: los snapshots nuevos los escribe ProjectionStore
+            index = self._load_marks(game_id)
+            gap = index.first_gap(end_seq, self._every)
+            while gap is not None:
+                # Hasta el punto de control siguiente al hueco: el resto del log ya tiene los suyos
+                following = bisect.bisect_right(index.seqs, gap)
+                upto = index.seqs[following] if following < len(index.seqs) else end_seq
+                if not self._backfill(game_id, game, index, gap, upto):
+                    break # Faltan eventos en el log: no hay con qué llenar el hueco
+                gap = index.first_gap(end_seq, self._every)
+
+        with self._lock:
+            self._indexes[game_id] = index
+            self._indexes.move_to_end(game_id)
+            while len(self._indexes) > self._max_games:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _load_marks(self, game_id: str) -> _CheckpointIndex:
+        index = _CheckpointIndex()
+        for mark in self._storage.list_snapshot_marks(game_id):
+            # Snapshots viejos, sin hora ni puntos: no sirven de punto de control
+            if mark.get("timestamp") is None or mark.get("point_events") is None:
+                continue
+            index.add(mark["seq"], _as_datetime(mark["timestamp"]), mark["point_events"])
+        return index
+
+    def _backfill(self, game_id: str, game: dict, index: _CheckpointIndex, from_seq: int, upto_seq: int) -> bool:
+        """
+        Recorre el log de `from_seq` (un punto de control o 0) a `upto_seq` y
+        escribe los puntos de control que faltan en el medio. False si no
+        escribió ninguno.
+        """
+        projection = None
+        if from_seq > 0:
+            snapshot = self._storage.get_latest_snapshot(game_id, max_seq=from_seq)
+            if snapshot is not None and snapshot["seq"] == from_seq:
+                projection = GameProjection.from_dict(snapshot)
+        if projection is None:
+            projection = initial_projection(self._storage, game_id, game)
+
+        last_checkpoint = projection.seq
+        written = False
+        while True:
+            chunk = self.events(game_id, projection.seq, upto_seq)
+            if not chunk:
+                break
+            for event in chunk:
+                projection.apply(event)
+                if projection.seq - last_checkpoint >= self._every:
+                    self._storage.put_snapshot(game_id, projection.seq, projection.to_dict())
+                    index.add(projection.seq, _as_datetime(projection.timestamp), projection.point_events)
+                    last_checkpoint = projection.seq
+                    written = True
+        return written
@@ -0,0 +1,97 @@
+# rules.py
+"""
+Reglas del vóley para cerrar solos los sets y el partido.
+
+Un set lo gana el primero que llega a `set_points` (25) con `win_by` (2) de
+diferencia; el set decisivo (2-2 en un partido a 5) se juega a
+`tiebreak_points` (15). El partido lo gana quien llega a la mayoría de
+`best_of` sets.
+
+Las reglas se guardan en el game doc al crearlo (las de la categoría sobre
+las globales), así que increment_score las tiene sin leer nada más y cierra
+el set (y el partido) en la misma escritura que anota el punto. Los
+partidos viejos, sin reglas guardadas, usan las globales.
+
+Globales: variable de entorno GAME_RULES con un JSON parcial, por ejemplo
+`{"best_of": 3}`. Por categoría: campo `rules` del documento de la
+categoría, con el mismo formato. `auto_close: false` deja el cierre a mano,
+como antes.
+"""
+import os
+import json
+from typing import List, Optional, Tuple
+
+from models import GameRules
+
+
+DEFAULT_RULES = GameRules(**json.loads(os.environ.get("GAME_RULES") or "{}"))
+
+
+def rules_for_category(cat_data: Optional[dict]) -> GameRules:
+    """Reglas de un partido nuevo: las de la categoría pisan a las globales."""
+    overrides = (cat_data or {}).get("rules") or {}
+    if not overrides:
+        return DEFAULT_RULES
+    return GameRules(**dict(DEFAULT_RULES.model_dump(), **overrides))
+
+
+def game_rules(rules) -> GameRules:
+    """Reglas guardadas en un partido (dict, GameRules o None si es viejo)."""
+    if rules is None:
+        return DEFAULT_RULES
+    if isinstance(rules, GameRules):
+        return rules
+    return GameRules(**rules)
+
+
+def sets_to_win(rules: GameRules) -> int:
+    return rules.best_of // 2 + 1
+
+
+def set_target(rules: GameRules, team1_sets_won: int, team2_sets_won: int) -> int:
+    """Puntos del set en juego: el decisivo es cuando a los dos les falta un set."""
+    needed = sets_to_win(rules) - 1
+    if rules.best_of > 1 and team1_sets_won == needed and team2_sets_won == needed:
+        return rules.tiebreak_points
+    return rules.set_points
+
+
+def set_winner(rules: GameRules, target: int, score_t1: int, score_t2: int) -> Optional[int]:
+    """1 o 2 si ese score cierra el set, None si sigue."""
+    if score_t1 >= target and score_t1 - score_t2 >= rules.win_by:
+        return 1
+    if score_t2 >= target and score_t2 - score_t1 >= rules.win_by:
+        return 2
+    return None
+
+
+def closing_point(rules: GameRules, team1_sets_won: int, team2_sets_won: int,
+                  scores: List[Tuple[int, int]]) -> Tuple[Optional[int], Optional[dict]]:
+    """
+    Recorre los scores de una tanda de puntos (en orden) y devuelve
+    (índice del punto que cierra el set, cierre) o (None, None) si el set
+    sigue. El cierre es un dict con 'winner' (1 o 2), los sets ganados
+    después del cierre y 'match_winner' (1, 2 o None).
+    """
+    if not rules.auto_close:
+        return None, None
+
+    target = set_target(rules, team1_sets_won, team2_sets_won)
+    for i, (score_t1, score_t2) in enumerate(scores):
+        winner = set_winner(rules, target, score_t1, score_t2)
+        if winner is None:
+            continue
+        sets_t1 = team1_sets_won + (winner == 1)
+        sets_t2 = team2_sets_won + (winner == 2)
+        match_winner = None
+        if sets_t1 >= sets_to_win(rules):
+            match_winner = 1
+        elif sets_t2 >= sets_to_win(rules):
+            match_winner = 2
+        return i, {
+            "winner": winner,
+            "team1_sets_won": sets_t1,
+            "team2_sets_won": sets_t2,
+            "match_winner": match_winner,
+        }
+    return None, None
@@ -0,0 +1,296 @@
+# standings.py
+"""
+Tabla de posiciones por categoría (vista materializada).
+
+Los resultados viven repartidos en los game docs (`winner_id`, sets y
+puntos). Recalcular la tabla leyendo todos los partidos en cada pedido no
+escala (una liga de 200 equipos son ~20 mil partidos), así que el proceso
+la mantiene en memoria y la actualiza con cada escritura de un partido,
+igual que el resumen del lobby:
+
+* Por partido se guarda lo que aporta a la tabla (su "contribución"): sólo
+  los terminados aportan. Cuando un partido cambia (se cierra un set, se
+  termina, se anula) se resta la contribución vieja y se suma la nueva, así
+  que un partido anulado después de terminado sale de la tabla solo.
+* Un índice equipo -> partidos da los resultados de un equipo sin recorrer
+  todos.
+* Los puntos de cada partido son los de sus sets cerrados: el game doc los
+  lleva sumados (`team1_points`, `team2_points`) desde que se cierra cada
+  set (a mano o por las reglas).
+
+La tabla se arma completa una vez (partidos terminados del storage y del
+archivo histórico) en el primer pedido. Con varios workers, cada uno ve
+sólo sus escrituras: STANDINGS_RESYNC_SECONDS la vuelve a armar cada tanto
+(cuesta una lectura por partido terminado; 0, el default, nunca).
+
+Orden: partidos ganados, puntos de tabla (3 por ganar; 2 y 1 si se jugó el
+set decisivo), cociente de sets y cociente de puntos.
+"""
+import os
+import json
+import time
+import secrets
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from archive import ArchiveStore
+from rules import game_rules, sets_to_win
+from storage import Storage
+
+
+STANDINGS_RESYNC_SECONDS = float(os.environ.get("STANDINGS_RESYNC_SECONDS", "0"))
+
+# Los únicos campos del game doc que usa la tabla
+STANDINGS_FIELDS = (
+    "team1_id", "team2_id", "team1_name", "team2_name", "team1_flag", "team2_flag",
+    "category_id", "category_name", "status", "winner_id", "created_at",
+    "team1_sets_won", "team2_sets_won", "team1_points", "team2_points", "rules",
+)
+
+# Sin estos no podemos agregar un partido que todavía no conocemos
+REQUIRED_FIELDS = ("team1_id", "team2_id", "status")
+
+
+def _ratio(won: int, lost: int) -> Optional[float]:
+    """won / lost; None si no perdió ninguno (cociente "infinito")."""
+    if lost == 0:
+        return None if won else 0.0
+    return round(won / lost, 3)
+
+
+def _ratio_key(won: int, lost: int) -> float:
+    return float("inf") if lost == 0 and won else (won / lost if lost else 0.0)
+
+
+def _empty_row(team_id: str) -> dict:
+    return {
+        "team_id": team_id, "team_name": None, "team_flag": None,
+        "played": 0, "wins": 0, "losses": 0, "table_points": 0,
+        "sets_won": 0, "sets_lost": 0, "points_won": 0, "points_lost": 0,
+    }
+
+
+class Standings:
+    """
+    `category_of(game)` da la categoría de un partido (los partidos viejos
+    sólo guardan el nombre; main.py la busca en el cache de referencia).
+    """
+
+    def __init__(self, storage: Storage, archive: ArchiveStore,
+                 category_of: Callable[[dict], Optional[str]] = lambda game: game.get("category_id"),
+                 resync_seconds: float = STANDINGS_RESYNC_SECONDS):
+        self._storage = storage
+        self._archive = archive
+        self._category_of = category_of
+        self._resync_seconds = resync_seconds
+        self._games: Dict[str, dict] = {}                   # game_id -> campos de la tabla
+        self._contributions: Dict[str, tuple] = {}          # game_id -> contribución (sólo terminados)
+        self._rows: Dict[str, Dict[str, dict]] = {}         # categoría -> equipo -> fila
+        self._team_games: Dict[str, Set[str]] = {}          # equipo -> partidos terminados
+        self._built_at: Optional[float] = None
+        self._etag_prefix = secrets.token_hex(4)
+        self._versions: Dict[str, int] = {}
+        self._rendered: Dict[str, Tuple[int, str, str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    # --- Lectura ---
+
+    def render(self, category_id: str, category_name: str) -> Tuple[str, bytes]:
+        """(etag, cuerpo JSON) de la tabla de la categoría."""
+        self._ensure_built()
+        with self._lock:
+            version = self._versions.get(category_id, 0)
+            rendered = self._rendered.get(category_id)
+            if rendered is None or rendered[0] != version or rendered[1] != category_name:
+                body = json.dumps({
+                    "category_id": category_id,
+                    "category_name": category_name,
+                    "teams": self._table(category_id),
+                }, separators=(",", ":")).encode("utf-8")
+                rendered = (version, category_name, f'"{self._etag_prefix}-{category_id}-{version}"', body)
+                self._rendered[category_id] = rendered
+            return rendered[2], rendered[3]
+
+    def team(self, category_id: str, team_id: str) -> Optional[dict]:
+        """Fila del equipo en la tabla y sus resultados, o None si no jugó."""
+        self._ensure_built()
+        with self._lock:
+            table = self._table(category_id)
+            row = next((row for row in table if row["team_id"] == team_id), None)
+            if row is None:
+                return None
+            results = []
+            for game_id in self._team_games.get(team_id, ()):
+                category, team1_id, team2_id, winner_id, sets_t1, sets_t2, points_t1, points_t2, _ = \
+                    self._contributions[game_id]
+                if category != category_id:
+                    continue
+                game = self._games[game_id]
+                home = team_id == team1_id
+                results.append({
+                    "game_id": game_id,
+                    "created_at": game.get("created_at"),
+                    "rival_id": team2_id if home else team1_id,
+                    "rival_name": game.get("team2_name" if home else "team1_name"),
+                    "won": winner_id == team_id,
+                    "sets_won": sets_t1 if home else sets_t2,
+                    "sets_lost": sets_t2 if home else sets_t1,
+                    "points_won": points_t1 if home else points_t2,
+                    "points_lost": points_t2 if home else points_t1,
+                })
+        results.sort(key=lambda result: str(result["created_at"] or ""), reverse=True)
+        return dict(row, results=results)
+
+    def _table(self, category_id: str) -> List[dict]:
+        # Siempre con el lock tomado
+        rows = sorted(
+            self._rows.get(category_id, {}).values(),
+            key=lambda row: (
+                -row["wins"], -row["table_points"],
+                -_ratio_key(row["sets_won"], row["sets_lost"]),
+                -_ratio_key(row["points_won"], row["points_lost"]),
+                row["team_name"] or row["team_id"],
+            )
+        )
+        return [
+            dict(row, position=i + 1,
+                 set_ratio=_ratio(row["sets_won"], row["sets_lost"]),
+                 point_ratio=_ratio(row["points_won"], row["points_lost"]))
+            for i, row in enumerate(rows)
+        ]
+
+    # --- Mantenimiento ---
+
+    def _ensure_built(self):
+        built_at = self._built_at
+        if built_at is None or (self._resync_seconds > 0 and time.monotonic() - built_at > self._resync_seconds):
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Arma la tabla desde cero: partidos terminados del storage y del
+        archivo histórico (los archivados ya no están en el storage).
+        """
+        games = {}
+        for game in self._archive.list_games(limit=None):
+            if game.get("status") != "finished":
+                continue
+            # El archivo guarda el score final de cada set
+            closed = [s for s in game.get("sets", []) if s["status"] == "finished"]
+            games[game["id"]] = dict(
+                {field: game.get(field) for field in STANDINGS_FIELDS},
+                team1_points=sum(s["team1_score"] for s in closed),
+                team2_points=sum(s["team2_score"] for s in closed),
+            )
+        for game in self._storage.list_games(["finished"]):
+            entry = {field: game.get(field) for field in STANDINGS_FIELDS}
+            if game.get("team1_points") is None:
+                # Partido de antes de que el game doc sumara los puntos: salen de los sets cerrados
+                closed = [s for s in self._storage.list_sets(game["id"]) if s.get("status") == "finished"]
+                entry["team1_points"] = sum(s.get("team1_current_score", 0) for s in closed)
+                entry["team2_points"] = sum(s.get("team2_current_score", 0) for s in closed)
+            games[game["id"]] = entry
+
+        with self._lock:
+            # Los que ya conocíamos y no vinieron en la consulta (en juego, o
+            # terminados mientras tanto) siguen como estaban
+            for game_id, entry in self._games.items():
+                games.setdefault(game_id, entry)
+            stale = set(self._versions) | set(self._rows)
+            self._games = games
+            self._contributions = {}
+            self._rows = {}
+            self._team_games = {}
+            for game_id, entry in games.items():
+                contribution = self._contribution(entry)
+                if contribution is not None:
+                    self._add(game_id, contribution, 1)
+            for category_id in stale:
+                self._changed(category_id)
+            self._built_at = time.monotonic()
+
+    def update(self, game_id: str, fields: dict) -> bool:
+        """
+        Mezcla `fields` (game doc completo o sólo lo que cambió) y ajusta la
+        tabla. Devuelve False si el partido no se conocía y los datos no
+        alcanzan (hay que pasar el game doc completo). Thread-safe; no lee
+        el storage.
+        """
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                if not all(field in fields for field in REQUIRED_FIELDS):
+                    return False
+                entry = {}
+            new_entry = dict(entry)
+            new_entry.update((f, fields[f]) for f in STANDINGS_FIELDS if f in fields)
+            self._games[game_id] = new_entry
+
+            if self._built_at is None:
+                return True # La tabla se arma completa al pedirla
+
+            old = self._contributions.get(game_id)
+            new = self._contribution(new_entry)
+            if old != new:
+                if old is not None:
+                    self._add(game_id, old, -1)
+                if new is not None:
+                    self._add(game_id, new, 1)
+            return True
+
+    def _contribution(self, entry: dict) -> Optional[tuple]:
+        """Lo que aporta el partido a la tabla, o None si no aporta (no terminó, anulado)."""
+        team1_id, team2_id, winner_id = entry.get("team1_id"), entry.get("team2_id"), entry.get("winner_id")
+        if entry.get("status") != "finished" or winner_id not in (team1_id, team2_id) or winner_id is None:
+            return None
+        category = self._category_of(entry)
+        if category is None:
+            return None
+        sets_t1, sets_t2 = entry.get("team1_sets_won") or 0, entry.get("team2_sets_won") or 0
+        # Puntos de tabla: el perdedor suma 1 si llegó al set decisivo
+        rules = game_rules(entry.get("rules"))
+        loser_sets = sets_t2 if winner_id == team1_id else sets_t1
+        decisive = rules.best_of > 1 and loser_sets == sets_to_win(rules) - 1
+        return (category, team1_id, team2_id, winner_id, sets_t1, sets_t2,
+                entry.get("team1_points") or 0, entry.get("team2_points") or 0, decisive)
+
+    def _add(self, game_id: str, contribution: tuple, sign: int):
+        # Siempre con el lock tomado. sign: 1 suma el partido, -1 lo resta.
+        category, team1_id, team2_id, winner_id, sets_t1, sets_t2, points_t1, points_t2, decisive = contribution
+        entry = self._games.get(game_id, {})
+        rows = self._rows.setdefault(category, {})
+        sides = (
+            (team1_id, sets_t1, sets_t2, points_t1, points_t2, "team1"),
+            (team2_id, sets_t2, sets_t1, points_t2, points_t1, "team2"),
+        )
+        for team_id, sets_won, sets_lost, points_won, points_lost, side in sides:
+            row = rows.get(team_id)
+            if row is None:
+                row = rows[team_id] = _empty_row(team_id)
+            won = team_id == winner_id
+            row["played"] += sign
+            row["wins" if won else "losses"] += sign
+            row["table_points"] += sign * ((2 if won else 1) if decisive else (3 if won else 0))
+            row["sets_won"] += sign * sets_won
+            row["sets_lost"] += sign * sets_lost
+            row["points_won"] += sign * points_won
+            row["points_lost"] += sign * points_lost
+            if sign > 0:
+                row["team_name"] = entry.get(f"{side}_name") or row["team_name"]
+                row["team_flag"] = entry.get(f"{side}_flag") or row["team_flag"]
+                self._team_games.setdefault(team_id, set()).add(game_id)
+            else:
+                self._team_games.get(team_id, set()).discard(game_id)
+            if row["played"] == 0:
+                del rows[team_id]
+
+        if sign > 0:
+            self._contributions[game_id] = contribution
+        else:
+            self._contributions.pop(game_id, None)
+        self._changed(category)
+
+    def _changed(self, category_id: str):
+        # Siempre con el lock tomado
+        self._versions[category_id] = self._versions.get(category_id, 0) + 1
+        self._rendered.pop(category_id, None)
@@ -0,0 +1,84 @@
+# startup.py
+"""
+Tiempos de arranque (cold start de Cloud Run).
+
+Antes de servir el primer pedido, una instancia nueva importaba
+firebase_admin y abría el cliente de Firestore, aunque el pedido fuera `/`
+o `/login`. Ahora eso queda fuera del camino: el storage se conecta en el
+primer uso y, apenas la app está lista, un warm-up en segundo plano abre la
+conexión, precarga equipos y categorías y comprime lo estático con brotli.
+
+`startup_report` anota cuánto tarda cada etapa:
+
+* `process`: desde que arrancó el proceso hasta que se empezó a importar
+  main.py (intérprete y uvicorn). Sólo en Linux (/proc).
+* `imports`, `storage`, `static`, ...: etapas de main.py.
+* `ready`: desde el inicio de main.py hasta que la app acepta pedidos.
+* `warmup.*`: etapas del warm-up (después de `ready`, no lo demoran).
+
+Se imprime al quedar lista la app y al terminar el warm-up, y está en
+`/metrics` como `voley_startup_seconds{phase="..."}`.
+"""
+import os
+import json
+import time
+import contextlib
+from typing import Dict, Optional
+
+
+def _process_age() -> Optional[float]:
+    """Segundos desde que arrancó el proceso, o None si no se puede saber."""
+    try:
+        with open("/proc/self/stat") as f:
+            # El nombre del proceso va entre paréntesis y puede tener espacios
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._marked = 0.0
+        self.phases: Dict[str, float] = {}
+        age = _process_age()
+        if age is not None:
+            self.phases["process"] = max(0.0, age)
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark(self, name: str):
+        """Etapa que termina ahora y empezó donde terminó la anterior marca."""
+        now = time.perf_counter() - self._start
+        self.record(name, now - self._marked)
+        self._marked = now
+
+    def ready(self):
+        self.record("ready", time.perf_counter() - self._start)
+        self.log("App lista")
+
+    def log(self, title: str):
+        print(f"{title}: " + json.dumps({name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}) + " (ms)")
+
+    def render(self) -> str:
+        lines = ["# HELP voley_startup_seconds Duración de cada etapa del arranque.",
+                 "# TYPE voley_startup_seconds gauge"]
+        for name, seconds in self.phases.items():
+            lines.append(f'voley_startup_seconds{{phase="{name}"}} {seconds:g}')
+        return "\n".join(lines) + "\n"
+
+
+startup_report = StartupReport()
@@ -0,0 +1,192 @@
+# static_bundle.py
+"""
+Páginas y archivos de static/ servidos desde memoria.
+
+Al arrancar se lee todo el directorio una sola vez y, por cada archivo, se
+guardan los bytes, las versiones comprimidas (gzip y, si está instalado el
+paquete `brotli`, br) y un ETag fuerte calculado sobre el contenido. Servir
+una página es elegir una de esas variantes según Accept-Encoding: no hay
+lecturas de disco ni compresión por pedido, y un navegador que ya la tiene
+recibe un 304.
+
+brotli al máximo es lento, así que no se hace al arrancar sino en el warm-up
+(`precompress()`, en segundo plano, ver startup.py); mientras tanto se sirve
+gzip.
+
+Los assets (imágenes, manifest) además tienen una URL con huella,
+`/static/icon.<hash>.png`, que se puede cachear para siempre: si el archivo
+cambia, cambia la URL. Las páginas HTML se reescriben al cargarlas para
+apuntar a esas URLs, y ellas mismas se cachean poco (se revalidan con el
+ETag), así un deploy nuevo se ve enseguida.
+
+Los cambios en static/ se ven al reiniciar el servidor.
+"""
+import os
+import gzip
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError: # Opcional: sin el paquete se sirve sólo gzip
+    brotli = None
+
+
+# Assets con huella en la URL: no cambian nunca
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Assets pedidos por su nombre de siempre (p.ej. desde un HTML viejo)
+ASSET_CACHE = "public, max-age=3600"
+# Páginas públicas: poco tiempo, después se revalidan con el ETag
+PAGE_CACHE = "public, max-age=60"
+# Páginas del manager: nunca en caches compartidos
+PRIVATE_PAGE_CACHE = "private, no-cache"
+
+# Por debajo de esto comprimir no ahorra nada
+MIN_COMPRESS_BYTES = 256
+
+TEXT_TYPES = ("text/", "application/json", "application/javascript", "application/manifest+json", "image/svg+xml")
+
+
+def _is_text(media_type: str) -> bool:
+    return media_type.startswith(TEXT_TYPES)
+
+
+def _accepted_encodings(header: str) -> set:
+    """Codificaciones aceptadas según Accept-Encoding (ignorando las que vienen con q=0)."""
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(token)
+    return accepted
+
+
+class StaticAsset:
+
+    __slots__ = ("name", "media_type", "body", "digest", "etag", "variants", "fingerprinted_name", "compressible")
+
+    def __init__(self, name: str, media_type: str, body: bytes):
+        self.name = name
+        self.media_type = media_type
+        self.body = body
+        self.digest = digest = hashlib.sha256(body).hexdigest()
+        self.etag = f'"{digest[:20]}"'
+        root, ext = os.path.splitext(name)
+        self.fingerprinted_name = f"{root}.{digest[:10]}{ext}"
+
+        # encoding -> (bytes, etag). El ETag es distinto por variante: son otros bytes.
+        self.variants: Dict[str, tuple] = {}
+        self.compressible = _is_text(media_type) and len(body) >= MIN_COMPRESS_BYTES
+        if self.compressible:
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(body):
+                self.variants["gzip"] = (gzipped, f'"{digest[:20]}-gz"')
+
+    def compress_brotli(self):
+        if brotli is None or not self.compressible or "br" in self.variants:
+            return
+        compressed = brotli.compress(self.body, quality=11)
+        if len(compressed) < len(self.body):
+            self.variants["br"] = (compressed, f'"{self.digest[:20]}-br"')
+
+    def select(self, accept_encoding: str):
+        """(bytes, etag, encoding o None) para el cliente."""
+        if self.variants:
+            accepted = _accepted_encodings(accept_encoding)
+            for encoding in ("br", "gzip"):
+                if encoding in self.variants and encoding in accepted:
+                    body, etag = self.variants[encoding]
+                    return body, etag, encoding
+        return self.body, self.etag, None
+
+
+class StaticBundle:
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._assets: Dict[str, StaticAsset] = {}
+        self._by_url_name: Dict[str, StaticAsset] = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        raw = {}
+        for name in sorted(os.listdir(self._directory)):
+            path = os.path.join(self._directory, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                raw[name] = f.read()
+
+        # Primero los binarios, después el resto de los textos (manifest) y al
+        # final las páginas: cada texto se reescribe con las huellas de lo anterior
+        def stage(name):
+            media_type = self._media_type(name)
+            return 2 if media_type == "text/html" else 1 if _is_text(media_type) else 0
+
+        for name in sorted(raw, key=stage):
+            media_type = self._media_type(name)
+            body = raw[name]
+            if _is_text(media_type):
+                text = body.decode("utf-8")
+                for asset in assets.values():
+                    text = text.replace(f"/static/{asset.name}", f"/static/{asset.fingerprinted_name}")
+                body = text.encode("utf-8")
+            assets[name] = StaticAsset(name, media_type, body)
+
+        by_url_name = dict(assets)
+        for asset in assets.values():
+            if asset.media_type != "text/html":
+                by_url_name[asset.fingerprinted_name] = asset
+
+        self._assets = assets
+        self._by_url_name = by_url_name
+
+    def precompress(self):
+        """Variantes brotli de todo (lento: va en el warm-up, fuera del arranque)."""
+        for asset in self._assets.values():
+            asset.compress_brotli()
+
+    @staticmethod
+    def _media_type(name: str) -> str:
+        if name.endswith(".json"):
+            return "application/json"
+        return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    def asset_response(self, request: Request, url_name: str) -> Optional[Response]:
+        """Respuesta para /static/{url_name}, o None si no existe."""
+        asset = self._by_url_name.get(url_name)
+        if asset is None:
+            return None
+        cache_control = IMMUTABLE_CACHE if url_name == asset.fingerprinted_name and url_name != asset.name else ASSET_CACHE
+        return self.response(request, asset, cache_control)
+
+    def page_response(self, request: Request, name: str, cache_control: str = PAGE_CACHE) -> Response:
+        return self.response(request, self._assets[name], cache_control)
+
+    @staticmethod
+    def response(request: Request, asset: StaticAsset, cache_control: str) -> Response:
+        body, etag, encoding = asset.select(request.headers.get("accept-encoding", ""))
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if asset.compressible:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        media_type = asset.media_type
+        if _is_text(media_type):
+            media_type += "; charset=utf-8"
+        return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,1151 @@
+# storage.py
+"""
+Capa de almacenamiento.
+
+main.py ya no habla directo con `firestore.client()`: todo pasa por un
+`Storage`. Hay tres motores:
+
+* `FirestoreStorage`: el de siempre (producción / Cloud Run).
+* `MemoryStorage`: diccionarios en memoria del proceso (tests, benchmarks).
+* `SQLiteStorage`: un archivo local (torneos en la laptop de la cancha).
+
+Las operaciones que en Firestore eran `@firestore.transactional` se expresan
+con `run_game_transaction(game_id, fn)`: `fn` recibe un `GameTransaction`,
+lee lo que necesite y deja las escrituras anotadas (ver event_log.py para
+el log de eventos de cada partido). Las escrituras se aplican
+todas juntas al final (o ninguna, si `fn` lanza una excepción), igual que en
+una transacción de Firestore.
+"""
+import os
+import copy
+import bisect
+import json
+import uuid
+import asyncio
+import functools
+import sqlite3
+import datetime
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Campos que guardamos como datetime (SQLite los guarda como texto ISO)
+DATETIME_FIELDS = ("created_at", "timestamp")
+
+
+# --- Interfaz ---
+
+class StaleGameError(Exception):
+    """La versión del partido cambió desde que la leímos (otro proceso escribió)."""
+
+
+class GameTransaction:
+    """
+    Vista transaccional de un partido (game doc + sets + log de eventos).
+    Regla de Firestore: primero se lee, después se escribe.
+    """
+
+    def get_game(self) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_set(self, set_number: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update_game(self, fields: dict):
+        raise NotImplementedError
+
+    def update_set(self, set_number: int, fields: dict):
+        raise NotImplementedError
+
+    def create_set(self, set_number: int, data: dict):
+        raise NotImplementedError
+
+    def delete_set(self, set_number: int):
+        raise NotImplementedError
+
+    def append_event(self, event: dict):
+        """Agrega un evento al log. Falla si ya existe uno con ese 'seq'."""
+        raise NotImplementedError
+
+
+class Storage:
+    """Interfaz común a todos los motores."""
+
+    # Si las llamadas bloquean el thread (red o disco). Ver StorageRunner.
+    blocking = True
+
+    def connect(self):
+        """
+        Abre la conexión si todavía no está abierta (bloqueante). Los motores
+        la abren solos en el primer uso; esto sirve para adelantarla.
+        """
+        pass
+
+    # Categorías
+    def list_categories(self) -> List[dict]:
+        raise NotImplementedError
+
+    def get_category(self, category_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put_category(self, category_id: str, data: dict):
+        raise NotImplementedError
+
+    # Equipos
+    def list_teams(self, category_id: Optional[str] = None) -> List[dict]:
+        raise NotImplementedError
+
+    def get_team(self, team_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_teams(self, team_ids: List[str]) -> Dict[str, dict]:
+        """Varios equipos en una sola lectura. Los que no existen no aparecen."""
+        raise NotImplementedError
+
+    def put_team(self, team_id: str, data: dict):
+        raise NotImplementedError
+
+    # Partidos
+    def create_game(self, game_data: dict, first_set: dict) -> str:
+        """Crea el partido y su set 1. Devuelve el ID del partido."""
+        raise NotImplementedError
+
+    def create_games(self, games: List[Tuple[dict, dict]]) -> List[str]:
+        """
+        Varios (game_data, first_set) en una sola escritura atómica. Devuelve
+        los IDs en el mismo orden. En Firestore, hasta 250 partidos por llamada
+        (500 escrituras por batch).
+        """
+        raise NotImplementedError
+
+    def get_game(self, game_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_game_versioned(self, game_id: str) -> Tuple[Optional[dict], Any]:
+        """
+        Como get_game, pero además devuelve un token de versión opaco
+        para usar con write_game_if_version.
+        """
+        raise NotImplementedError
+
+    def list_games(self, statuses: List[str], limit: Optional[int] = None) -> List[dict]:
+        """Partidos con status en `statuses`, más nuevos primero (con 'id')."""
+        raise NotImplementedError
+
+    def query_games(self, statuses: Optional[List[str]] = None, category_id: Optional[str] = None,
+                    created_from: Optional[datetime.datetime] = None,
+                    created_to: Optional[datetime.datetime] = None,
+                    after: Optional[Tuple[datetime.datetime, str]] = None,
+                    limit: int = 100, fields: Optional[List[str]] = None,
+                    category_name: Optional[str] = None) -> List[dict]:
+        """
+        Partidos filtrados, ordenados por (created_at, id) del más nuevo al más
+        viejo, empezando después de `after` (paginación por keyset, ver
+        listing.py). created_from incluido, created_to excluido. Con `fields`
+        se traen sólo esos campos, más 'id' y 'created_at' (el cursor).
+        `category_name` sirve para los partidos viejos, que no guardan category_id.
+        """
+        raise NotImplementedError
+
+    def update_game(self, game_id: str, fields: dict):
+        raise NotImplementedError
+
+    def delete_game(self, game_id: str) -> int:
+        """
+        Borra el partido entero: game doc, sets (con los puntos de los
+        partidos viejos), eventos y snapshots (ver archive.py). Devuelve
+        cuántos documentos se borraron.
+        """
+        raise NotImplementedError
+
+    # Sets (lectura)
+    def list_sets(self, game_id: str) -> List[dict]:
+        raise NotImplementedError
+
+    def list_legacy_points(self, game_id: str, set_number: int) -> List[dict]:
+        """
+        Puntos del set en `sets/{n}/points`, en orden cronológico: la historia
+        de los partidos de antes del log (ver event_log.initial_projection).
+        Sólo Firestore tiene partidos así; los motores locales nacieron con el log.
+        """
+        return []
+
+    # Log de eventos (ver event_log.py)
+    def list_events(self, game_id: str, after_seq: int = 0, upto_seq: Optional[int] = None) -> List[dict]:
+        """Eventos con seq > after_seq (y <= upto_seq, si se pasa), en orden."""
+        raise NotImplementedError
+
+    def get_latest_snapshot(self, game_id: str, max_seq: Optional[int] = None) -> Optional[dict]:
+        """El snapshot más nuevo (con seq <= max_seq, si se pasa)."""
+        raise NotImplementedError
+
+    def list_snapshot_marks(self, game_id: str) -> List[dict]:
+        """
+        Índice de los snapshots, en orden de seq: sólo 'seq', 'timestamp' y
+        'point_events' de cada uno, sin el partido (ver replay.py).
+        """
+        raise NotImplementedError
+
+    def put_snapshot(self, game_id: str, seq: int, data: dict):
+        raise NotImplementedError
+
+    def watch_game(self, game_id: str, callback: Callable[[dict], None]) -> Optional[Callable[[], None]]:
+        """
+        Listener de cambios del game doc (de cualquier proceso). Devuelve una
+        función para cortarlo, o None si el motor no lo soporta (los motores
+        locales viven en un solo proceso: alcanza con el camino de escritura).
+        """
+        return None
+
+    # Transacciones
+    def run_game_transaction(self, game_id: str, fn: Callable[[GameTransaction], Any]) -> Any:
+        raise NotImplementedError
+
+    def write_game_if_version(self, game_id: str, version: Any,
+                              fn: Callable[[GameTransaction], Any]) -> Any:
+        """
+        Escritura sin lecturas: `fn` sólo puede escribir. Se aplica si el partido
+        sigue en `version`; si no, lanza StaleGameError. Devuelve la nueva versión.
+        Toda escritura a sets/eventos pasa también por el game doc, así que su
+        versión cubre el partido entero.
+        """
+        raise NotImplementedError
+
+
+# --- Firestore ---
+
+class _FirestoreGameTransaction(GameTransaction):
+
+    def __init__(self, game_ref, transaction):
+        self._game_ref = game_ref
+        self._transaction = transaction
+
+    def _set_ref(self, set_number):
+        return self._game_ref.collection("sets").document(str(set_number))
+
+    def get_game(self):
+        snapshot = self._game_ref.get(transaction=self._transaction)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def get_set(self, set_number):
+        snapshot = self._set_ref(set_number).get(transaction=self._transaction)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def update_game(self, fields):
+        from firebase_admin import firestore
+        self._transaction.update(self._game_ref, dict(fields, version=firestore.Increment(1)))
+
+    def update_set(self, set_number, fields):
+        self._transaction.update(self._set_ref(set_number), fields)
+
+    def create_set(self, set_number, data):
+        self._transaction.set(self._set_ref(set_number), data)
+
+    def delete_set(self, set_number):
+        self._transaction.delete(self._set_ref(set_number))
+
+    def append_event(self, event):
+        event_ref = self._game_ref.collection("events").document(f"{event['seq']:08d}")
+        self._transaction.create(event_ref, event)
+
+
+class _FirestoreGameBatch(GameTransaction):
+    """Sólo escrituras, en un WriteBatch con precondición sobre el game doc."""
+
+    def __init__(self, db, game_ref, version):
+        self._db = db
+        self._game_ref = game_ref
+        self._version = version
+        self.batch = db.batch()
+        self.game_write_index = None
+        self._count = 0
+
+    def _set_ref(self, set_number):
+        return self._game_ref.collection("sets").document(str(set_number))
+
+    def update_game(self, fields):
+        from firebase_admin import firestore
+        # Si la tanda actualiza el game doc más de una vez (ver write_behind.py),
+        # la precondición va en la primera: el batch es atómico
+        option = self._db.write_option(last_update_time=self._version) if self.game_write_index is None else None
+        self.batch.update(self._game_ref, dict(fields, version=firestore.Increment(1)), option=option)
+        self.game_write_index = self._count
+        self._count += 1
+
+    def update_set(self, set_number, fields):
+        self.batch.update(self._set_ref(set_number), fields)
+        self._count += 1
+
+    def create_set(self, set_number, data):
+        self.batch.set(self._set_ref(set_number), data)
+        self._count += 1
+
+    def delete_set(self, set_number):
+        self.batch.delete(self._set_ref(set_number))
+        self._count += 1
+
+    def append_event(self, event):
+        event_ref = self._game_ref.collection("events").document(f"{event['seq']:08d}")
+        self.batch.create(event_ref, event)
+        self._count += 1
+
+
+class FirestoreStorage(Storage):
+
+    def __init__(self):
+        # firebase_admin se importa y el cliente se abre en el primer uso (o en
+        # el warm-up del arranque, ver startup.py): importarlo solo ya tarda
+        self._db = None
+        self._firestore_module = None
+        self._connect_lock = threading.Lock()
+
+    def connect(self):
+        if self._db is not None:
+            return
+        with self._connect_lock:
+            if self._db is not None:
+                return
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                try:
+                    cred = credentials.Certificate("serviceAccountKey.json")
+                    firebase_admin.initialize_app(cred)
+                    print("Firebase inicializado con serviceAccountKey.json (Modo Local)")
+                except FileNotFoundError:
+                    firebase_admin.initialize_app()
+                    print("Firebase inicializado con credenciales de GCP (Modo Cloud Run)")
+
+            self._firestore_module = firestore
+            self._db = firestore.client()
+
+    @property
+    def db(self):
+        if self._db is None:
+            self.connect()
+        return self._db
+
+    @property
+    def _firestore(self):
+        if self._firestore_module is None:
+            self.connect()
+        return self._firestore_module
+
+    @staticmethod
+    def _with_id(snapshot) -> dict:
+        data = snapshot.to_dict()
+        data["id"] = snapshot.id
+        return data
+
+    def list_categories(self):
+        docs = self.db.collection("categories").order_by("order").stream()
+        return [self._with_id(doc) for doc in docs]
+
+    def get_category(self, category_id):
+        snapshot = self.db.collection("categories").document(category_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def put_category(self, category_id, data):
+        self.db.collection("categories").document(category_id).set(data)
+
+    def list_teams(self, category_id=None):
+        teams_ref = self.db.collection("teams")
+        if category_id:
+            teams_ref = teams_ref.where(
+                filter=self._firestore.FieldFilter("category_id", "==", category_id)
+            )
+        return [self._with_id(doc) for doc in teams_ref.stream()]
+
+    def get_team(self, team_id):
+        snapshot = self.db.collection("teams").document(team_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def get_teams(self, team_ids):
+        refs = [self.db.collection("teams").document(team_id) for team_id in team_ids]
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists}
+
+    def put_team(self, team_id, data):
+        self.db.collection("teams").document(team_id).set(data)
+
+    def create_game(self, game_data, first_set):
+        update_time, game_ref = self.db.collection("games").add(game_data)
+        game_ref.collection("sets").document(str(first_set["set_number"])).set(first_set)
+        return game_ref.id
+
+    def create_games(self, games):
+        batch = self.db.batch()
+        game_ids = []
+        for game_data, first_set in games:
+            game_ref = self.db.collection("games").document() # ID automático, como add()
+            batch.set(game_ref, game_data)
+            batch.set(game_ref.collection("sets").document(str(first_set["set_number"])), first_set)
+            game_ids.append(game_ref.id)
+        batch.commit()
+        return game_ids
+
+    def get_game(self, game_id):
+        snapshot = self.db.collection("games").document(game_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def get_game_versioned(self, game_id):
+        snapshot = self.db.collection("games").document(game_id).get()
+        if not snapshot.exists:
+            return None, None
+        return snapshot.to_dict(), snapshot.update_time
+
+    def list_games(self, statuses, limit=None):
+        query = self.db.collection("games").where(
+            filter=self._firestore.FieldFilter("status", "in", statuses)
+        ).order_by("created_at", direction=self._firestore.Query.DESCENDING)
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._with_id(doc) for doc in query.stream()]
+
+    def query_games(self, statuses=None, category_id=None, created_from=None, created_to=None,
+                    after=None, limit=100, fields=None, category_name=None):
+        # Necesita índices compuestos (status/category_id/category_name + created_at + __name__), ver README
+        field_filter = self._firestore.FieldFilter
+        games_ref = self.db.collection("games")
+        query = games_ref
+        if statuses:
+            query = query.where(filter=field_filter("status", "in", list(statuses)))
+        if category_id:
+            query = query.where(filter=field_filter("category_id", "==", category_id))
+        if category_name:
+            query = query.where(filter=field_filter("category_name", "==", category_name))
+        if created_from is not None:
+            query = query.where(filter=field_filter("created_at", ">=", created_from))
+        if created_to is not None:
+            query = query.where(filter=field_filter("created_at", "<", created_to))
+        query = query.order_by("created_at", direction=self._firestore.Query.DESCENDING) \
+            .order_by(self._firestore.FieldPath.document_id(), direction=self._firestore.Query.DESCENDING)
+        if after is not None:
+            query = query.start_after({"created_at": after[0], "__name__": games_ref.document(after[1])})
+        if fields is not None:
+            query = query.select(sorted(set(fields) - {"id"} | {"created_at"}))
+        return [self._with_id(doc) for doc in query.limit(limit).stream()]
+
+    def update_game(self, game_id, fields):
+        self.db.collection("games").document(game_id).update(
+            dict(fields, version=self._firestore.Increment(1))
+        )
+
+    def delete_game(self, game_id):
+        # Borra también las subcolecciones, anidadas incluidas: sets (y sus
+        # `points` de los partidos viejos), events y snapshots
+        return self.db.recursive_delete(self.db.collection("games").document(game_id))
+
+    def list_sets(self, game_id):
+        docs = self.db.collection("games").document(game_id).collection("sets") \
+            .order_by("set_number").stream()
+        return [doc.to_dict() for doc in docs]
+
+    def list_legacy_points(self, game_id, set_number):
+        docs = self.db.collection("games").document(game_id).collection("sets") \
+            .document(str(set_number)).collection("points").order_by("timestamp").stream()
+        return [doc.to_dict() for doc in docs]
+
+    def list_events(self, game_id, after_seq=0, upto_seq=None):
+        query = self.db.collection("games").document(game_id).collection("events") \
+            .where(filter=self._firestore.FieldFilter("seq", ">", after_seq))
+        if upto_seq is not None:
+            query = query.where(filter=self._firestore.FieldFilter("seq", "<=", upto_seq))
+        return [doc.to_dict() for doc in query.order_by("seq").stream()]
+
+    def get_latest_snapshot(self, game_id, max_seq=None):
+        query = self.db.collection("games").document(game_id).collection("snapshots")
+        if max_seq is not None:
+            query = query.where(filter=self._firestore.FieldFilter("seq", "<=", max_seq))
+        docs = list(query.order_by("seq", direction=self._firestore.Query.DESCENDING).limit(1).stream())
+        return docs[0].to_dict() if docs else None
+
+    def put_snapshot(self, game_id, seq, data):
+        self.db.collection("games").document(game_id).collection("snapshots") \
+            .document(f"{seq:08d}").set(data)
+
+    def list_snapshot_marks(self, game_id):
+        docs = self.db.collection("games").document(game_id).collection("snapshots") \
+            .select(["seq", "timestamp", "point_events"]).order_by("seq").stream()
+        return [doc.to_dict() for doc in docs]
+
+    def watch_game(self, game_id, callback):
+        def on_snapshot(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    callback(snapshot.to_dict())
+
+        watch = self.db.collection("games").document(game_id).on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+    def run_game_transaction(self, game_id, fn):
+        game_ref = self.db.collection("games").document(game_id)
+
+        @self._firestore.transactional
+        def in_transaction(transaction):
+            return fn(_FirestoreGameTransaction(game_ref, transaction))
+
+        return in_transaction(self.db.transaction())
+
+    def write_game_if_version(self, game_id, version, fn):
+        from google.api_core import exceptions
+
+        game_ref = self.db.collection("games").document(game_id)
+        writer = _FirestoreGameBatch(self.db, game_ref, version)
+        fn(writer)
+        if writer.game_write_index is None:
+            raise ValueError("write_game_if_version necesita escribir el game doc")
+        try:
+            results = writer.batch.commit()
+        except (exceptions.FailedPrecondition, exceptions.NotFound) as e:
+            raise StaleGameError(str(e))
+        return results[writer.game_write_index].update_time
+
+
+# --- Motores locales ---
+
+class _StagedGameTransaction(GameTransaction):
+    """
+    Base para los motores locales: las lecturas van directo al motor y las
+    escrituras se acumulan en `self.writes` hasta el commit.
+    """
+
+    def __init__(self, storage, game_id):
+        self._storage = storage
+        self._game_id = game_id
+        self.writes: List[Tuple] = []
+
+    def update_game(self, fields):
+        self.writes.append(("update_game", dict(fields)))
+
+    def update_set(self, set_number, fields):
+        self.writes.append(("update_set", set_number, dict(fields)))
+
+    def create_set(self, set_number, data):
+        self.writes.append(("create_set", set_number, dict(data)))
+
+    def delete_set(self, set_number):
+        self.writes.append(("delete_set", set_number))
+
+    def append_event(self, event):
+        self.writes.append(("append_event", dict(event)))
+
+
+class _MemoryGameTransaction(_StagedGameTransaction):
+
+    def get_game(self):
+        return self._storage.get_game(self._game_id)
+
+    def get_set(self, set_number):
+        data = self._storage._sets.get((self._game_id, set_number))
+        return dict(data) if data is not None else None
+
+
+
+class MemoryStorage(Storage):
+    """Todo en diccionarios. Un lock global hace de 'transacción'."""
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._categories: Dict[str, dict] = {}
+        self._teams: Dict[str, dict] = {}
+        self._games: Dict[str, dict] = {}
+        self._sets: Dict[Tuple[str, int], dict] = {}
+        self._events: Dict[str, List[dict]] = {}
+        self._snapshots: Dict[str, List[dict]] = {}
+
+    def list_categories(self):
+        with self._lock:
+            cats = [dict(data, id=cid) for cid, data in self._categories.items()]
+        return sorted(cats, key=lambda c: c.get("order", 0))
+
+    def get_category(self, category_id):
+        with self._lock:
+            data = self._categories.get(category_id)
+            return dict(data) if data is not None else None
+
+    def put_category(self, category_id, data):
+        with self._lock:
+            self._categories[category_id] = dict(data)
+
+    def list_teams(self, category_id=None):
+        with self._lock:
+            return [
+                dict(data, id=tid) for tid, data in self._teams.items()
+                if not category_id or data.get("category_id") == category_id
+            ]
+
+    def get_team(self, team_id):
+        with self._lock:
+            data = self._teams.get(team_id)
+            return dict(data) if data is not None else None
+
+    def get_teams(self, team_ids):
+        with self._lock:
+            return {tid: dict(self._teams[tid]) for tid in team_ids if tid in self._teams}
+
+    def put_team(self, team_id, data):
+        with self._lock:
+            self._teams[team_id] = dict(data)
+
+    def create_game(self, game_data, first_set):
+        return self.create_games([(game_data, first_set)])[0]
+
+    def create_games(self, games):
+        game_ids = []
+        with self._lock:
+            for game_data, first_set in games:
+                game_id = uuid.uuid4().hex
+                self._games[game_id] = dict(game_data)
+                self._sets[(game_id, first_set["set_number"])] = dict(first_set)
+                game_ids.append(game_id)
+        return game_ids
+
+    def get_game(self, game_id):
+        with self._lock:
+            data = self._games.get(game_id)
+            return dict(data) if data is not None else None
+
+    def get_game_versioned(self, game_id):
+        with self._lock:
+            data = self._games.get(game_id)
+            if data is None:
+                return None, None
+            return dict(data), data.get("version", 0)
+
+    def list_games(self, statuses, limit=None):
+        with self._lock:
+            games = [
+                dict(data, id=gid) for gid, data in self._games.items()
+                if data.get("status") in statuses
+            ]
+        return sorted(games, key=lambda g: g["created_at"], reverse=True)[:limit]
+
+    def query_games(self, statuses=None, category_id=None, created_from=None, created_to=None,
+                    after=None, limit=100, fields=None, category_name=None):
+        with self._lock:
+            keys = [
+                (data["created_at"], gid) for gid, data in self._games.items()
+                if (not statuses or data.get("status") in statuses)
+                and (not category_id or data.get("category_id") == category_id)
+                and (not category_name or data.get("category_name") == category_name)
+                and (created_from is None or data["created_at"] >= created_from)
+                and (created_to is None or data["created_at"] < created_to)
+                and (after is None or (data["created_at"], gid) < tuple(after))
+            ]
+            keys.sort(reverse=True)
+            games = []
+            for created_at, gid in keys[:limit]:
+                data = self._games[gid]
+                if fields is not None:
+                    data = {field: data[field] for field in fields if field in data}
+                games.append(dict(data, id=gid, created_at=created_at))
+        return games
+
+    def _update_game_data(self, game_id, fields):
+        if game_id not in self._games:
+            raise KeyError(f"No existe el partido {game_id}")
+        data = self._games[game_id]
+        data.update(fields)
+        data["version"] = data.get("version", 0) + 1
+
+    def update_game(self, game_id, fields):
+        with self._lock:
+            self._update_game_data(game_id, fields)
+
+    def delete_game(self, game_id):
+        with self._lock:
+            if self._games.pop(game_id, None) is None:
+                return 0
+            set_keys = [key for key in self._sets if key[0] == game_id]
+            for key in set_keys:
+                del self._sets[key]
+            events = self._events.pop(game_id, [])
+            snapshots = self._snapshots.pop(game_id, [])
+            return 1 + len(set_keys) + len(events) + len(snapshots)
+
+    def list_sets(self, game_id):
+        with self._lock:
+            sets = [dict(data) for (gid, _), data in self._sets.items() if gid == game_id]
+        return sorted(sets, key=lambda s: s["set_number"])
+
+    def list_events(self, game_id, after_seq=0, upto_seq=None):
+        with self._lock:
+            # El log está ordenado por seq y sin huecos: cortamos directo
+            events = self._events.get(game_id, [])
+            start, end = 0, len(events)
+            if events:
+                start = max(0, after_seq - events[0]["seq"] + 1)
+                if upto_seq is not None:
+                    end = max(start, upto_seq - events[0]["seq"] + 1)
+            return [dict(e) for e in events[start:end]]
+
+    def get_latest_snapshot(self, game_id, max_seq=None):
+        with self._lock:
+            for snapshot in reversed(self._snapshots.get(game_id, [])):
+                if max_seq is None or snapshot["seq"] <= max_seq:
+                    return copy.deepcopy(snapshot)
+        return None
+
+    def put_snapshot(self, game_id, seq, data):
+        with self._lock:
+            snapshots = self._snapshots.setdefault(game_id, [])
+            # Ordenados por seq; uno en el mismo seq se reemplaza (como el doc en Firestore)
+            index = bisect.bisect_left([snapshot["seq"] for snapshot in snapshots], seq)
+            snapshot = copy.deepcopy(dict(data, seq=seq))
+            if index < len(snapshots) and snapshots[index]["seq"] == seq:
+                snapshots[index] = snapshot
+            else:
+                snapshots.insert(index, snapshot)
+
+    def list_snapshot_marks(self, game_id):
+        with self._lock:
+            return [
+                {field: snapshot[field] for field in ("seq", "timestamp", "point_events") if field in snapshot}
+                for snapshot in self._snapshots.get(game_id, [])
+            ]
+
+    def _apply(self, game_id, writes):
+        # Sin rollback en memoria: validamos antes de escribir nada
+        last_seq = self._events[game_id][-1]["seq"] if self._events.get(game_id) else 0
+        existing_sets = {key[1] for key in self._sets if key[0] == game_id}
+        for write in writes:
+            if write[0] == "append_event":
+                if write[1]["seq"] <= last_seq:
+                    raise ValueError(f"Ya existe el evento {write[1]['seq']} en {game_id}")
+                last_seq = write[1]["seq"]
+            elif write[0] in ("update_game", "update_set") and game_id not in self._games:
+                raise KeyError(f"No existe el partido {game_id}")
+            if write[0] == "create_set":
+                existing_sets.add(write[1])
+            elif write[0] == "delete_set":
+                existing_sets.discard(write[1])
+            elif write[0] == "update_set" and write[1] not in existing_sets:
+                # Como Firestore (NotFound) y SQLite (rollback): no se aplica nada
+                raise KeyError(f"No existe el set {write[1]} en {game_id}")
+
+        for write in writes:
+            op = write[0]
+            if op == "update_game":
+                self._update_game_data(game_id, write[1])
+            elif op == "update_set":
+                self._sets[(game_id, write[1])].update(write[2])
+            elif op == "create_set":
+                self._sets[(game_id, write[1])] = write[2]
+            elif op == "delete_set":
+                self._sets.pop((game_id, write[1]), None)
+            elif op == "append_event":
+                self._events.setdefault(game_id, []).append(write[1])
+
+    def run_game_transaction(self, game_id, fn):
+        with self._lock:
+            transaction = _MemoryGameTransaction(self, game_id)
+            result = fn(transaction)
+            self._apply(game_id, transaction.writes)
+            return result
+
+    def write_game_if_version(self, game_id, version, fn):
+        with self._lock:
+            data = self._games.get(game_id)
+            if data is None or data.get("version", 0) != version:
+                raise StaleGameError(f"El partido {game_id} cambió de versión")
+            writer = _StagedGameTransaction(self, game_id)
+            fn(writer)
+            self._apply(game_id, writer.writes)
+            return self._games[game_id].get("version", 0)
+
+
+def _encode(data: dict) -> str:
+    return json.dumps(data, default=lambda v: v.isoformat())
+
+
+def _decode(raw: str) -> dict:
+    data = json.loads(raw)
+    for field in DATETIME_FIELDS:
+        if isinstance(data.get(field), str):
+            data[field] = datetime.datetime.fromisoformat(data[field])
+    return data
+
+
+class _SQLiteGameTransaction(_StagedGameTransaction):
+
+    def get_game(self):
+        return self._storage.get_game(self._game_id)
+
+    def get_set(self, set_number):
+        row = self._storage._conn.execute(
+            "SELECT data FROM sets WHERE game_id = ? AND set_number = ?",
+            (self._game_id, set_number)
+        ).fetchone()
+        return _decode(row[0]) if row else None
+
+
+
+class SQLiteStorage(Storage):
+    """
+    Un archivo SQLite. Cada documento se guarda como JSON; las columnas extra
+    son sólo las que usamos para filtrar u ordenar.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS categories (
+            id TEXT PRIMARY KEY, sort_order INTEGER, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS teams (
+            id TEXT PRIMARY KEY, category_id TEXT, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS games (
+            id TEXT PRIMARY KEY, status TEXT, created_at TEXT, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS sets (
+            game_id TEXT, set_number INTEGER, data TEXT NOT NULL,
+            PRIMARY KEY (game_id, set_number));
+        CREATE TABLE IF NOT EXISTS events (
+            game_id TEXT, seq INTEGER, data TEXT NOT NULL,
+            PRIMARY KEY (game_id, seq));
+        CREATE TABLE IF NOT EXISTS snapshots (
+            game_id TEXT, seq INTEGER, data TEXT NOT NULL,
+            PRIMARY KEY (game_id, seq));
+        CREATE INDEX IF NOT EXISTS idx_teams_category ON teams (category_id);
+        CREATE INDEX IF NOT EXISTS idx_games_status ON games (status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_games_category ON games (json_extract(data, '$.category_id'), created_at);
+    """
+
+    def __init__(self, path: str = "voley.db"):
+        # isolation_level=None: manejamos BEGIN/COMMIT a mano
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.RLock()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def list_categories(self):
+        rows = self._query("SELECT id, data FROM categories ORDER BY sort_order")
+        return [dict(_decode(data), id=cid) for cid, data in rows]
+
+    def get_category(self, category_id):
+        rows = self._query("SELECT data FROM categories WHERE id = ?", (category_id,))
+        return _decode(rows[0][0]) if rows else None
+
+    def put_category(self, category_id, data):
+        self._execute(
+            "INSERT OR REPLACE INTO categories (id, sort_order, data) VALUES (?, ?, ?)",
+            (category_id, data.get("order", 0), _encode(data))
+        )
+
+    def list_teams(self, category_id=None):
+        if category_id:
+            rows = self._query("SELECT id, data FROM teams WHERE category_id = ?", (category_id,))
+        else:
+            rows = self._query("SELECT id, data FROM teams")
+        return [dict(_decode(data), id=tid) for tid, data in rows]
+
+    def get_team(self, team_id):
+        rows = self._query("SELECT data FROM teams WHERE id = ?", (team_id,))
+        return _decode(rows[0][0]) if rows else None
+
+    def get_teams(self, team_ids):
+        if not team_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in team_ids)
+        rows = self._query(f"SELECT id, data FROM teams WHERE id IN ({placeholders})", tuple(team_ids))
+        return {tid: _decode(data) for tid, data in rows}
+
+    def put_team(self, team_id, data):
+        self._execute(
+            "INSERT OR REPLACE INTO teams (id, category_id, data) VALUES (?, ?, ?)",
+            (team_id, data.get("category_id"), _encode(data))
+        )
+
+    def create_game(self, game_data, first_set):
+        return self.create_games([(game_data, first_set)])[0]
+
+    def create_games(self, games):
+        game_ids = [uuid.uuid4().hex for _ in games]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO games (id, status, created_at, data) VALUES (?, ?, ?, ?)",
+                    [(game_id, game_data["status"], game_data["created_at"].isoformat(), _encode(game_data))
+                     for game_id, (game_data, _) in zip(game_ids, games)]
+                )
+                self._conn.executemany(
+                    "INSERT INTO sets (game_id, set_number, data) VALUES (?, ?, ?)",
+                    [(game_id, first_set["set_number"], _encode(first_set))
+                     for game_id, (_, first_set) in zip(game_ids, games)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return game_ids
+
+    def get_game(self, game_id):
+        rows = self._query("SELECT data FROM games WHERE id = ?", (game_id,))
+        return _decode(rows[0][0]) if rows else None
+
+    def get_game_versioned(self, game_id):
+        data = self.get_game(game_id)
+        if data is None:
+            return None, None
+        return data, data.get("version", 0)
+
+    def list_games(self, statuses, limit=None):
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._query(
+            f"SELECT id, data FROM games WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+            tuple(statuses) + (-1 if limit is None else limit,)
+        )
+        return [dict(_decode(data), id=gid) for gid, data in rows]
+
+    def query_games(self, statuses=None, category_id=None, created_from=None, created_to=None,
+                    after=None, limit=100, fields=None, category_name=None):
+        where, params = [], []
+        if statuses:
+            where.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if category_id:
+            where.append("json_extract(data, '$.category_id') = ?")
+            params.append(category_id)
+        if category_name:
+            where.append("json_extract(data, '$.category_name') = ?")
+            params.append(category_name)
+        if created_from is not None:
+            where.append("created_at >= ?")
+            params.append(created_from.isoformat())
+        if created_to is not None:
+            where.append("created_at < ?")
+            params.append(created_to.isoformat())
+        if after is not None:
+            after_created_at = after[0].isoformat()
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after_created_at, after_created_at, after[1]])
+
+        # La proyección se hace en SQLite: no viaja (ni se decodifica) el documento entero
+        if fields is None:
+            columns = "data"
+        else:
+            wanted = sorted(set(fields) - {"id"} | {"created_at"})
+            columns = "json_object(" + ", ".join("?, json_extract(data, ?)" for _ in wanted) + ")"
+            params = [value for field in wanted for value in (field, f"$.{field}")] + params
+
+        sql = f"SELECT id, {columns} FROM games"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        rows = self._query(sql, tuple(params) + (limit,))
+        return [dict(_decode(data), id=gid) for gid, data in rows]
+
+    def _update_game_row(self, game_id, fields):
+        row = self._conn.execute("SELECT data FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No existe el partido {game_id}")
+        data = _decode(row[0])
+        data.update(fields)
+        data["version"] = data.get("version", 0) + 1
+        self._conn.execute(
+            "UPDATE games SET status = ?, data = ? WHERE id = ?",
+            (data.get("status"), _encode(data), game_id)
+        )
+
+    def update_game(self, game_id, fields):
+        with self._lock:
+            self._update_game_row(game_id, fields)
+
+    def delete_game(self, game_id):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = 0
+                for table, column in (("games", "id"), ("sets", "game_id"), ("events", "game_id"), ("snapshots", "game_id")):
+                    deleted += self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (game_id,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def list_sets(self, game_id):
+        rows = self._query(
+            "SELECT data FROM sets WHERE game_id = ? ORDER BY set_number", (game_id,)
+        )
+        return [_decode(data) for (data,) in rows]
+
+    def list_events(self, game_id, after_seq=0, upto_seq=None):
+        rows = self._query(
+            "SELECT data FROM events WHERE game_id = ? AND seq > ? AND seq <= ? ORDER BY seq",
+            (game_id, after_seq, upto_seq if upto_seq is not None else 2 ** 62)
+        )
+        return [_decode(data) for (data,) in rows]
+
+    def get_latest_snapshot(self, game_id, max_seq=None):
+        rows = self._query(
+            "SELECT data FROM snapshots WHERE game_id = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+            (game_id, max_seq if max_seq is not None else 2 ** 62)
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def put_snapshot(self, game_id, seq, data):
+        self._execute(
+            "INSERT OR REPLACE INTO snapshots (game_id, seq, data) VALUES (?, ?, ?)",
+            (game_id, seq, _encode(dict(data, seq=seq)))
+        )
+
+    def list_snapshot_marks(self, game_id):
+        rows = self._query(
+            "SELECT seq, json_extract(data, '$.timestamp'), json_extract(data, '$.point_events') "
+            "FROM snapshots WHERE game_id = ? ORDER BY seq",
+            (game_id,)
+        )
+        marks = []
+        for seq, timestamp, point_events in rows:
+            mark = {"seq": seq}
+            if timestamp is not None:
+                mark["timestamp"] = datetime.datetime.fromisoformat(timestamp)
+            if point_events is not None:
+                mark["point_events"] = point_events
+            marks.append(mark)
+        return marks
+
+    def _apply(self, game_id, writes):
+        for write in writes:
+            op = write[0]
+            if op == "update_game":
+                self._update_game_row(game_id, write[1])
+            elif op == "update_set":
+                row = self._conn.execute(
+                    "SELECT data FROM sets WHERE game_id = ? AND set_number = ?", (game_id, write[1])
+                ).fetchone()
+                if row is None:
+                    raise KeyError(f"No existe el set {write[1]} en {game_id}")
+                data = _decode(row[0])
+                data.update(write[2])
+                self._conn.execute(
+                    "UPDATE sets SET data = ? WHERE game_id = ? AND set_number = ?",
+                    (_encode(data), game_id, write[1])
+                )
+            elif op == "create_set":
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sets (game_id, set_number, data) VALUES (?, ?, ?)",
+                    (game_id, write[1], _encode(write[2]))
+                )
+            elif op == "delete_set":
+                self._conn.execute("DELETE FROM sets WHERE game_id = ? AND set_number = ?", (game_id, write[1]))
+            elif op == "append_event":
+                self._conn.execute(
+                    "INSERT INTO events (game_id, seq, data) VALUES (?, ?, ?)",
+                    (game_id, write[1]["seq"], _encode(write[1]))
+                )
+
+    def run_game_transaction(self, game_id, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                transaction = _SQLiteGameTransaction(self, game_id)
+                result = fn(transaction)
+                self._apply(game_id, transaction.writes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def write_game_if_version(self, game_id, version, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                data = self.get_game(game_id)
+                if data is None or data.get("version", 0) != version:
+                    raise StaleGameError(f"El partido {game_id} cambió de versión")
+                writer = _StagedGameTransaction(self, game_id)
+                fn(writer)
+                self._apply(game_id, writer.writes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return data.get("version", 0) + 1
+
+
+# --- Acceso async ---
+
+class StorageRunner:
+    """
+    Capa async sobre el storage para los endpoints `async def`.
+
+    El cliente de firebase_admin (y sqlite3) bloquean el thread, así que esas
+    llamadas van a un pool propio, separado del threadpool de uvicorn, con un
+    semáforo que limita cuántas hay en vuelo. Un Firestore lento no le roba
+    threads al resto de la app. El motor en memoria no bloquea: corre directo
+    en el event loop, sin saltos de thread.
+    """
+
+    def __init__(self, storage: Storage, max_concurrency: int = 64):
+        self.storage = storage
+        self._inline = not storage.blocking
+        self._executor = None if self._inline else ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="storage"
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecuta `fn` (que usa el storage de forma bloqueante) sin trabar el event loop."""
+        if self._inline:
+            return fn(*args, **kwargs)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            # Copiamos el contexto: las métricas del pedido (metrics.py) viajan al thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+# --- Selección de motor ---
+
+def load_seed(storage: Storage, path: str):
+    """
+    Carga categorías y equipos desde un JSON:
+    {"categories": {"<id>": {...}}, "teams": {"<id>": {...}}}
+    Útil para los motores locales, que arrancan vacíos.
+    """
+    with open(path, encoding="utf-8") as f:
+        seed = json.load(f)
+    for category_id, data in seed.get("categories", {}).items():
+        storage.put_category(category_id, data)
+    for team_id, data in seed.get("teams", {}).items():
+        storage.put_team(team_id, data)
+
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    """
+    Crea el motor según STORAGE_BACKEND: "firestore" (default), "memory" o "sqlite".
+    SQLITE_PATH elige el archivo y STORAGE_SEED un JSON con categorías y equipos.
+    """
+    backend = (backend or os.environ.get("STORAGE_BACKEND", "firestore")).lower()
+
+    if backend == "firestore":
+        storage = FirestoreStorage()
+    elif backend == "memory":
+        storage = MemoryStorage()
+    elif backend == "sqlite":
+        storage = SQLiteStorage(os.environ.get("SQLITE_PATH", "voley.db"))
+    else:
+        raise ValueError(f"STORAGE_BACKEND desconocido: {backend}")
+
+    seed_path = os.environ.get("STORAGE_SEED")
+    if seed_path and backend != "firestore":
+        load_seed(storage, seed_path)
+
+    print(f"Storage inicializado: {backend}" + (" (se conecta en el primer uso)" if backend == "firestore" else ""))
+    return storage
@@ -0,0 +1,37 @@
+# tests/conftest.py
+"""
+Los tests corren contra el motor en memoria, con el seed de tests/seed.json
+(categorías `fa` y `mini`, equipos `arg` y `bra`) y el archivo histórico en
+un directorio temporal. main.py lee la
+configuración al importarse: por eso se arma el entorno acá, antes.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("STORAGE_SEED", os.path.join(os.path.dirname(__file__), "seed.json"))
+os.environ.setdefault("STARTUP_WARM_UP", "0")
+os.environ.setdefault("ARCHIVE_DIR", tempfile.mkdtemp(prefix="voley-archive-"))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    client = TestClient(main.app)
+    client.post("/auth/login", json={"username": "manager", "password": "voley123"})
+    return client
+
+
+@pytest.fixture
+def new_game(client):
+    """Crea un partido arg-bra (categoría `mini`: sets a 3, al mejor de 3) y devuelve su id."""
+    def create(category_id="mini"):
+        response = client.post("/manager/games", json={"team1_id": "arg", "team2_id": "bra", "category_id": category_id})
+        assert response.status_code == 200, response.text
+        # La respuesta no trae el id: el más nuevo de la lista del manager
+        return client.get("/manager/games/list").json()[0]["id"]
+    return create
@@ -0,0 +1,35 @@
+import datetime
+
+import main
+
+
+def category_stats(client, category_id):
+    main.analytics._tournaments.clear() # Sin esperar el TTL del torneo
+    response = client.get(f"/categories/{category_id}/stats")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_category_stats_keep_legacy_and_archived_games(client):
+    before = category_stats(client, "fa")
+
+    # Partido de antes de category_id: es de la categoría por el nombre
+    game_id = main.storage.create_game({
+        "team1_id": "arg", "team2_id": "bra", "team1_name": "Argentina", "team2_name": "Brasil",
+        "category_name": "Femenino A", "status": "upcoming",
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+    }, {"set_number": 1, "status": "live", "winner_id": None, "team1_current_score": 0, "team2_current_score": 0})
+    for team in ("arg", "bra", "arg"):
+        response = client.post(f"/manager/games/{game_id}/increment", json={"set_number": 1, "scoring_team_id": team})
+        assert response.status_code == 201, response.text
+    played = category_stats(client, "fa")
+    assert (played["games"], played["points"]) == (before["games"] + 1, before["points"] + 3)
+
+    # Archivado sigue contando, con los mismos puntos
+    assert client.post(f"/manager/games/{game_id}/finish_game", json={"winner_team_id": "arg"}).status_code == 200
+    response = client.post("/manager/archive/run", params={"older_than_days": -1})
+    assert game_id in response.json()["game_ids"]
+    assert main.storage.get_game(game_id) is None
+    archived = category_stats(client, "fa")
+    assert (archived["games"], archived["points"]) == (played["games"], played["points"])
+    assert {team["team_id"]: team["points"] for team in archived["teams"]}["arg"] >= 2
@@ -0,0 +1,88 @@
+import os
+
+import main
+from archive import ArchiveStore
+
+
+class FakeBlob:
+
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self.name = name
+
+    def upload_from_filename(self, path):
+        with open(path, "rb") as f:
+            self._bucket.blobs[self.name] = f.read()
+
+    def download_to_filename(self, path):
+        with open(path, "wb") as f:
+            f.write(self._bucket.blobs[self.name])
+
+
+class FakeBucket:
+
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        return [FakeBlob(self, name) for name in sorted(self.blobs) if name.startswith(prefix)]
+
+
+def finished_game(client, new_game):
+    game_id = new_game()
+    assert client.post(f"/manager/games/{game_id}/finish_game", json={"winner_team_id": "arg"}).status_code == 200
+    return game_id
+
+
+def test_archive_refuses_without_durable_storage(client, new_game, monkeypatch, tmp_path):
+    game_id = finished_game(client, new_game)
+    monkeypatch.setattr(main, "archive", ArchiveStore(str(tmp_path), bucket="", persistent_dir=False))
+
+    response = client.post("/manager/archive/run", params={"older_than_days": -1})
+    assert response.status_code == 409
+    assert main.storage.get_game(game_id) is not None
+    assert os.listdir(tmp_path) == []
+
+
+def test_archived_game_leaves_spectator_reads(client, new_game):
+    game_id = finished_game(client, new_game)
+    assert client.get(f"/games/{game_id}").status_code == 200 # queda en el micro-cache
+
+    response = client.post("/manager/archive/run", params={"older_than_days": -1})
+    assert game_id in response.json()["game_ids"]
+    assert client.get(f"/games/{game_id}").status_code == 404
+    assert client.get(f"/games/{game_id}/sets/1/points").status_code == 404
+    assert client.get(f"/archive/games/{game_id}").status_code == 200
+
+
+def test_segments_go_to_bucket_before_delete(client, new_game, monkeypatch, tmp_path):
+    bucket = FakeBucket()
+    store = ArchiveStore(str(tmp_path / "a"), bucket="voley/archivo", persistent_dir=False)
+    store._bucket = bucket
+    monkeypatch.setattr(main, "archive", store)
+    game_id = finished_game(client, new_game)
+
+    response = client.post("/manager/archive/run", params={"older_than_days": -1})
+    assert response.status_code == 200
+    assert main.storage.get_game(game_id) is None
+    assert bucket.blobs and all(name.startswith("archivo/") for name in bucket.blobs)
+
+    # Otra instancia, con el disco vacío, lo baja del bucket
+    other = ArchiveStore(str(tmp_path / "b"), bucket="voley/archivo", persistent_dir=False)
+    other._bucket = bucket
+    assert other.get_game(game_id)["winner_id"] == "arg"
+
+
+def test_sync_uploads_segments_left_by_an_interrupted_run(tmp_path):
+    bucket = FakeBucket()
+    first = ArchiveStore(str(tmp_path), bucket="voley", persistent_dir=False)
+    first._bucket = bucket
+    path = tmp_path / "mini" / "2026-01" / "corrida.vcol"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"VOLEYCOL")
+
+    first.sync()
+    assert list(bucket.blobs) == ["mini/2026-01/corrida.vcol"]
@@ -0,0 +1,49 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import auth
+import main
+from auth import ROLE_SCORER, SessionSigner
+
+
+def test_token_is_signed_with_the_secret():
+    signer = SessionSigner(b"secreto")
+    token, expires_at = signer.issue("manager")
+    session = signer.verify(token)
+    assert (session.username, session.is_manager, session.expires_at) == ("manager", True, expires_at)
+
+    # Otro secreto, la firma o el payload tocados: no vale
+    assert SessionSigner(b"otro").verify(token) is None
+    payload, _, signature = token.partition(".")
+    assert signer.verify(payload + "." + signature[::-1]) is None
+    forged = auth._b64encode(b'{"sub":"manager","role":"manager","exp":9999999999}')
+    assert signer.verify(f"{forged}.{signature}") is None
+    assert signer.verify("basura") is None and signer.verify(None) is None
+
+
+def test_token_expires_even_when_cached(monkeypatch):
+    signer = SessionSigner(b"secreto", ttl_seconds=60)
+    token, _ = signer.issue("planillero", role=ROLE_SCORER, games=["g1"])
+    session = signer.verify(token)
+    assert session.can_score("g1") and not session.can_score("g2")
+    assert signer.verify(token) is session # del cache
+    expired, _ = signer.issue("manager", ttl_seconds=-1)
+    assert signer.verify(expired) is None
+
+    now = time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + 61)
+    assert signer.verify(token) is None
+    assert SessionSigner(b"secreto").verify(token) is None
+
+
+def test_scorer_token_only_scores_its_game(client, new_game):
+    game_id, other_id = new_game(), new_game()
+    login_url = client.post(f"/manager/games/{game_id}/scorer_token").json()["login_url"]
+
+    scorer = TestClient(main.app, follow_redirects=False)
+    assert scorer.get(login_url).headers["location"] == f"/manager/game?id={game_id}"
+    increment = {"set_number": 1, "scoring_team_id": "arg"}
+    assert scorer.post(f"/manager/games/{game_id}/increment", json=increment).status_code == 201
+    assert scorer.post(f"/manager/games/{other_id}/increment", json=increment).status_code == 403
+    assert scorer.get("/manager/games/list").status_code == 403
@@ -0,0 +1,56 @@
+import main
+from client_ops import pending_ops
+from models import PointCreate
+
+
+def op(client_id, client_seq):
+    return PointCreate(set_number=1, scoring_team_id="arg", client_id=client_id, client_seq=client_seq)
+
+
+def test_pending_ops_skips_what_each_client_already_sent():
+    ops = [op("a", 3), op("a", 4), op("b", 1), op("a", 4), op(None, None), op("b", 1)]
+    pending, marks = pending_ops(ops, {"a": 3})
+    assert [(p.client_id, p.client_seq) for p in pending] == [("a", 4), ("b", 1), (None, None)]
+    assert marks == {"a": 4, "b": 1}
+    assert pending_ops(ops[:3], {"a": 4, "b": 1}) == ([], {})
+
+
+def increment(client, game_id, set_number, client_seq, team_id="arg"):
+    return client.post(f"/manager/games/{game_id}/increment", json={
+        "set_number": set_number, "scoring_team_id": team_id, "client_id": "tablet-1", "client_seq": client_seq
+    })
+
+
+def test_retried_point_is_applied_once(client, new_game):
+    game_id = new_game() # mini: sets a 3
+    assert increment(client, game_id, 1, 1).status_code == 201
+    retry = increment(client, game_id, 1, 1)
+    assert (retry.status_code, retry.json()["detail"]) == (409, "El punto ya estaba anotado.")
+
+    # Una tanda que repite el primero: sólo se anotan los nuevos
+    response = client.post(f"/manager/games/{game_id}/increment_batch", json={"points": [
+        {"set_number": 1, "scoring_team_id": "arg", "client_id": "tablet-1", "client_seq": seq} for seq in (1, 2)
+    ]})
+    assert response.status_code == 201, response.text
+    assert [p["team1_score_after"] for p in response.json()["points"]] == [2]
+    game = main.storage.get_game(game_id)
+    assert (game["current_team1_score"], game["client_seqs"]) == (2, {"tablet-1": 2})
+
+
+def test_retry_after_the_set_closed_is_a_duplicate(client, new_game):
+    game_id = new_game()
+    for seq in (1, 2, 3):
+        assert increment(client, game_id, 1, seq).status_code == 201
+    assert client.get(f"/manager/games/{game_id}").json()["current_set_number"] == 2
+
+    # El punto que cerró el set llega de nuevo: no es un punto del set 2 ni un error
+    assert increment(client, game_id, 1, 3).status_code == 409
+    assert increment(client, game_id, 2, 4, "bra").status_code == 201
+    undo = {"client_id": "tablet-1", "client_seq": 5}
+    assert client.post(f"/manager/games/{game_id}/undo_point", json=undo).status_code == 200
+    assert client.post(f"/manager/games/{game_id}/undo_point", json=undo).status_code == 409
+
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert (game["current_set_number"], game["team1_sets_won"]) == (2, 1)
+    assert (game["current_team1_score"], game["current_team2_score"]) == (0, 0)
+    assert len(client.get(f"/games/{game_id}/sets/1/points").json()) == 3
@@ -0,0 +1,55 @@
+import asyncio
+
+from coalescer import Coalescer
+
+
+def test_concurrent_items_share_one_flush():
+    async def run():
+        flushes = []
+
+        async def flush(key, items):
+            flushes.append((key, items))
+            return [item * 10 for item in items]
+
+        coalescer = Coalescer(0.01, flush)
+        results = await asyncio.gather(*(coalescer.submit("game:1", n) for n in range(5)))
+        assert results == [0, 10, 20, 30, 40]
+        assert flushes == [("game:1", [0, 1, 2, 3, 4])]
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_does_not_strand_the_group():
+    async def run():
+        flushes = []
+
+        async def flush(key, items):
+            flushes.append(list(items))
+            return list(items)
+
+        coalescer = Coalescer(0.01, flush)
+        leader = asyncio.ensure_future(coalescer.submit("game:1", "a"))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(coalescer.submit("game:1", "b"))
+        await asyncio.sleep(0)
+        leader.cancel() # El cliente del primer pedido se desconectó
+
+        assert await asyncio.wait_for(follower, 1) == "b"
+        assert flushes == [["a", "b"]]
+        # La ventana se cerró: el siguiente abre un grupo nuevo
+        assert await asyncio.wait_for(coalescer.submit("game:1", "c"), 1) == "c"
+
+    asyncio.run(run())
+
+
+def test_failed_flush_reaches_every_member():
+    async def run():
+        async def flush(key, items):
+            raise RuntimeError("storage caído")
+
+        coalescer = Coalescer(0.01, flush)
+        results = await asyncio.gather(*(coalescer.submit("game:1", n) for n in range(3)), return_exceptions=True)
+        assert [type(result) for result in results] == [RuntimeError] * 3
+        assert coalescer._open == {}
+
+    asyncio.run(run())
@@ -0,0 +1,94 @@
+import datetime
+
+import main
+from event_log import ProjectionStore, new_event
+from replay import GameReplay
+from storage import MemoryStorage
+
+
+def test_older_projection_does_not_replace_newer(client, new_game):
+    game_id = new_game()
+    for team in ("arg", "bra", "arg"):
+        assert client.post(f"/manager/games/{game_id}/increment", json={"set_number": 1, "scoring_team_id": team}).status_code == 201
+    latest = main.projections.get(game_id)
+    assert latest.seq == 3
+
+    older = main.projections.get(game_id, upto_seq=1)
+    assert older.seq == 1
+    assert main.projections.get(game_id) is latest
+    assert main.projections.get(game_id, upto_seq=3) is latest
+
+
+def legacy_game(storage):
+    """
+    Un partido de antes del log, como lo dejaba la versión anterior: set 1
+    ganado por arg (3-1), el set 2 en juego (1-0) y sin eventos.
+    """
+    start = datetime.datetime(2025, 3, 1, 18, 0, tzinfo=datetime.timezone.utc)
+    game_id = storage.create_game({
+        "team1_id": "arg", "team2_id": "bra", "team1_name": "Argentina", "team2_name": "Brasil",
+        "category_id": "mini", "status": "live", "created_at": start, "current_set_number": 2,
+        "current_team1_score": 1, "current_team2_score": 0, "team1_sets_won": 1, "team2_sets_won": 0,
+    }, {"set_number": 1, "status": "finished", "winner_id": "arg", "team1_current_score": 3, "team2_current_score": 1})
+    storage.run_game_transaction(game_id, lambda transaction: transaction.create_set(2, {
+        "set_number": 2, "status": "live", "winner_id": None, "team1_current_score": 1, "team2_current_score": 0,
+    }))
+
+    points, score = {}, {}
+    for i, (set_number, team) in enumerate([(1, "arg"), (1, "bra"), (1, "arg"), (1, "arg"), (2, "arg")]):
+        t1, t2 = score.get(set_number, (0, 0))
+        score[set_number] = (t1 + (team == "arg"), t2 + (team == "bra"))
+        points.setdefault(set_number, []).append({
+            "timestamp": start + datetime.timedelta(minutes=i), "scoring_team_id": team,
+            "team1_score_after": score[set_number][0], "team2_score_after": score[set_number][1],
+        })
+    return game_id, points
+
+
+class LegacyStorage(MemoryStorage):
+    """Memoria con los `sets/{n}/points` que en producción sólo tiene Firestore."""
+
+    def __init__(self):
+        super().__init__()
+        self.legacy_points = {}
+
+    def list_legacy_points(self, game_id, set_number):
+        return [dict(point) for point in self.legacy_points.get(game_id, {}).get(set_number, [])]
+
+
+def test_legacy_game_is_seeded_from_its_points_once():
+    storage = LegacyStorage()
+    game_id, points = legacy_game(storage)
+    storage.legacy_points[game_id] = points
+
+    projection = ProjectionStore(storage).get(game_id)
+    assert (projection.seq, projection.point_events, projection.status) == (0, 5, "live")
+    assert (projection.current_set_number, projection.team1_sets_won) == (2, 1)
+    assert (projection.sets[1]["status"], projection.sets[1]["winner_id"]) == ("finished", "arg")
+    assert projection.scores(1) == (3, 1) and projection.scores(2) == (1, 0)
+    assert storage.get_latest_snapshot(game_id)["seq"] == 0
+
+    # Un undo en el log: se reconstruye desde el snapshot, sin volver a los puntos viejos
+    def undo(transaction):
+        transaction.append_event(new_event(1, "undo", 2))
+        transaction.update_game({"current_team1_score": 0, "event_seq": 1})
+    storage.run_game_transaction(game_id, undo)
+    storage.legacy_points.clear()
+    projection = ProjectionStore(storage).get(game_id, upto_seq=1)
+    assert projection.scores(1) == (3, 1) and projection.set_points(2) == []
+
+    replayed, _ = GameReplay(storage).seek(game_id, point=2)
+    assert replayed.scores(2) == (1, 0) and replayed.seq == 0
+
+
+def test_undo_on_a_legacy_game(client, monkeypatch):
+    game_id, points = legacy_game(main.storage)
+    monkeypatch.setattr(main.storage, "list_legacy_points",
+                        lambda gid, set_number: points.get(set_number, []) if gid == game_id else [], raising=False)
+
+    assert [p["scoring_team_id"] for p in client.get(f"/games/{game_id}/sets/1/points").json()] == ["arg", "arg", "bra", "arg"]
+    response = client.post(f"/manager/games/{game_id}/undo_point")
+    assert response.status_code == 200, response.text
+    assert response.json()["new_scores"] == {"set_number": 2, "team1_score": 0, "team2_score": 0}
+    assert main.projections.get(game_id).set_points(2) == []
+    assert len(main.projections.get(game_id).set_points(1)) == 4
@@ -0,0 +1,65 @@
+import main
+
+
+def fixture(client, games):
+    response = client.post("/manager/games/bulk", json={"games": games})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_fixture_is_written_in_chunks_with_a_result_per_game(client, monkeypatch):
+    monkeypatch.setattr(main, "FIXTURE_CHUNK_SIZE", 2)
+    create_games = main.storage.create_games
+    chunks = []
+
+    def recording(games):
+        chunks.append(len(games))
+        return create_games(games)
+
+    monkeypatch.setattr(main.storage, "create_games", recording)
+    games = [
+        {"team1_id": "arg", "team2_id": "bra", "category_id": "mini"},
+        {"team1_id": "arg", "team2_id": "arg"},
+        {"team1_id": "bra", "team2_id": "arg", "category_id": "fa"},
+        {"team1_id": "arg", "team2_id": "zzz"},
+        {"team1_id": "arg", "team2_id": "bra"},
+    ]
+    result = fixture(client, games)
+
+    assert (result["created"], result["failed"]) == (3, 2)
+    assert [r["index"] for r in result["results"]] == [0, 1, 2, 3, 4]
+    assert [r["ok"] for r in result["results"]] == [True, False, True, False, True]
+    assert result["results"][1]["detail"] == "Un equipo no puede jugar contra sí mismo."
+    assert result["results"][3]["detail"] == "Equipos no encontrados."
+    # Sólo los válidos van al storage, de a FIXTURE_CHUNK_SIZE
+    assert sorted(chunks) == [1, 2]
+
+    # El lobby los muestra en el orden del fixture, con nombres y categoría
+    created = [r["game_id"] for r in result["results"] if r["ok"]]
+    lobby = client.get("/manager/games/list").json()
+    assert [g["id"] for g in lobby[:3]] == created
+    assert (lobby[0]["team1_name"], lobby[0]["category_name"]) == ("Argentina", "Mini")
+    assert lobby[1]["category_name"] == "Femenino A"
+
+
+def test_failed_chunk_only_fails_its_games(client, monkeypatch):
+    monkeypatch.setattr(main, "FIXTURE_CHUNK_SIZE", 2)
+    create_games = main.storage.create_games
+
+    def failing(games):
+        if any(game["team1_id"] == "bra" for game, _ in games):
+            raise RuntimeError("batch rechazado")
+        return create_games(games)
+
+    monkeypatch.setattr(main.storage, "create_games", failing)
+    games = [
+        {"team1_id": "arg", "team2_id": "bra"},
+        {"team1_id": "arg", "team2_id": "bra"},
+        {"team1_id": "bra", "team2_id": "arg"},
+    ]
+    result = fixture(client, games)
+
+    assert (result["created"], result["failed"]) == (2, 1)
+    assert result["results"][2]["detail"] == "Error al guardar: batch rechazado"
+    for r in result["results"][:2]:
+        assert main.storage.get_game(r["game_id"])["team1_id"] == "arg"
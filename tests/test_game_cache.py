@@ -0,0 +1,47 @@
+import pytest
+
+import main
+from storage import StaleGameError
+
+
+def point(client, game_id, team_id):
+    response = client.post(f"/manager/games/{game_id}/increment", json={"set_number": 1, "scoring_team_id": team_id})
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.mark.skipif(main.write_behind is not None, reason="con write-behind cada partido tiene un solo dueño")
+def test_outside_write_makes_the_cache_reread(client, new_game):
+    game_id = new_game("fa")
+    point(client, game_id, "arg")
+    assert main.game_cache.get(game_id).current_team1_score == 1
+
+    # Otro proceso escribe el partido: el cache queda con una versión vieja
+    main.storage.update_game(game_id, {"current_team1_score": 10})
+    assert point(client, game_id, "arg")["team1_score_after"] == 11
+    assert main.storage.get_game(game_id)["current_team1_score"] == 11
+    state = main.game_cache.get(game_id)
+    assert (state.current_team1_score, state.version) == (11, main.storage.get_game_versioned(game_id)[1])
+
+
+def test_stale_write_is_retried_from_the_cache(client, new_game, monkeypatch):
+    game_id = new_game("fa")
+    point(client, game_id, "arg")
+
+    write_game_if_version = main.storage.write_game_if_version
+    calls = []
+
+    def stale_once(game_id, version, fn):
+        calls.append(version)
+        if len(calls) == 1:
+            raise StaleGameError(f"El partido {game_id} cambió de versión")
+        return write_game_if_version(game_id, version, fn)
+
+    monkeypatch.setattr(main.storage, "write_game_if_version", stale_once)
+    assert point(client, game_id, "bra")["team2_score_after"] == 1
+
+    # El segundo intento sigue por el camino rápido, con el estado releído, y el punto va una sola vez
+    assert len(calls) == 2
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert (game["current_team1_score"], game["current_team2_score"]) == (1, 1)
+    assert len(client.get(f"/games/{game_id}/sets/1/points").json()) == 2
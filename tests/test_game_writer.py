@@ -0,0 +1,79 @@
+import asyncio
+
+from game_writer import GameWriters
+
+
+class SlowFlush:
+    """Guarda cada tanda; la primera escritura espera hasta `release`."""
+
+    def __init__(self):
+        self.log = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, game_id, points):
+        self.log.append((game_id, list(points)))
+        if len(self.log) == 1:
+            await self.release.wait()
+        return [f"{game_id}:{point}" for point in points]
+
+
+def test_points_queued_behind_a_write_go_in_one_batch_in_order():
+    async def run():
+        flush = SlowFlush()
+        writers = GameWriters(flush, max_points=3)
+        order = []
+
+        async def job():
+            order.append("job")
+            return "hecho"
+
+        first = asyncio.ensure_future(writers.submit_point("g1", 0))
+        await asyncio.sleep(0)
+        # Mientras la primera escritura está en vuelo, todo espera en el buzón
+        rest = [asyncio.ensure_future(writers.submit_point("g1", i)) for i in range(1, 5)]
+        queued_job = asyncio.ensure_future(writers.submit("g1", job))
+        last = asyncio.ensure_future(writers.submit_point("g1", 5))
+        other = asyncio.ensure_future(writers.submit_point("g2", 0))
+        await asyncio.sleep(0)
+        assert writers.pending() == 7
+
+        flush.release.set()
+        results = await asyncio.gather(first, *rest, queued_job, last, other)
+        assert results == ["g1:0", "g1:1", "g1:2", "g1:3", "g1:4", "hecho", "g1:5", "g2:0"]
+        # Tandas de hasta max_points, cortadas por el job, cada partido con su escritor
+        assert [points for game_id, points in flush.log if game_id == "g1"] == [[0], [1, 2, 3], [4], [5]]
+        assert [points for game_id, points in flush.log if game_id == "g2"] == [[0]]
+        assert order == ["job"] and writers.pending() == 0
+
+    asyncio.run(run())
+
+
+def test_failed_write_fails_its_whole_batch_only():
+    async def run():
+        async def flush(game_id, points):
+            if "malo" in points:
+                raise RuntimeError("storage caído")
+            return points
+
+        writers = GameWriters(flush)
+        batch = [asyncio.ensure_future(writers.submit_point("g1", point)) for point in ("a", "malo")]
+        results = await asyncio.gather(*batch, return_exceptions=True)
+        assert [str(result) for result in results] == ["storage caído", "storage caído"]
+        assert await writers.submit_point("g1", "b") == "b"
+
+    asyncio.run(run())
+
+
+def test_writer_stops_when_idle():
+    async def run():
+        async def flush(game_id, points):
+            return points
+
+        writers = GameWriters(flush, idle_seconds=0.01)
+        assert await writers.submit_point("g1", "a") == "a"
+        assert "g1" in writers._writers
+        await asyncio.sleep(0.05)
+        assert "g1" not in writers._writers
+        assert await writers.submit_point("g1", "b") == "b"
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+def list_games(client, **params):
+    response = client.get("/manager/games/list", params=params)
+    assert response.status_code == 200, response.text
+    return response.json(), response.headers.get("x-next-cursor")
+
+
+def test_cursor_pages_are_stable_while_games_are_added(client, new_game):
+    for _ in range(5):
+        new_game("fa")
+    everything, _ = list_games(client, category_id="fa", limit=1000)
+
+    seen = []
+    page, cursor = list_games(client, category_id="fa", limit=2)
+    seen += page
+    new_game("fa") # Entra adelante de todo: no corre las páginas que siguen
+    while cursor:
+        page, cursor = list_games(client, category_id="fa", limit=2, cursor=cursor)
+        assert len(page) <= 2
+        seen += page
+
+    assert [g["id"] for g in seen] == [g["id"] for g in everything]
+    created = [g["created_at"] for g in seen]
+    assert created == sorted(created, reverse=True)
+
+
+def test_fields_are_projected(client, new_game):
+    older_id, game_id = new_game(), new_game()
+    page, cursor = list_games(client, category_id="mini", limit=1, fields="team1_name,status,team1_name")
+    assert page == [{"id": game_id, "team1_name": "Argentina", "status": "upcoming"}]
+    assert cursor is not None
+
+    # El cursor sigue sirviendo aunque la proyección no traiga los campos de orden
+    next_page, _ = list_games(client, category_id="mini", limit=1, fields="status", cursor=cursor)
+    assert next_page[0] == {"id": older_id, "status": "upcoming"}
+
+    assert client.get("/manager/games/list", params={"fields": "team1_name,secreto"}).status_code == 400
+    assert client.get("/manager/games/list", params={"cursor": "no-es-un-cursor"}).status_code == 400
@@ -0,0 +1,76 @@
+import asyncio
+import datetime
+
+from live_stream import LiveHub
+from storage import MemoryStorage
+
+
+class SlowWatchRunner:
+    """StorageRunner de prueba: watch_game espera a `opened` (un listener de Firestore que tarda)."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.opened = asyncio.Event()
+
+    async def run(self, fn, *args):
+        if fn == self.storage.watch_game:
+            await self.opened.wait()
+        return fn(*args)
+
+
+class WatchingStorage(MemoryStorage):
+
+    def __init__(self):
+        super().__init__()
+        self.watching = 0
+
+    def watch_game(self, game_id, callback):
+        self.watching += 1
+
+        def unwatch():
+            self.watching -= 1
+        return unwatch
+
+
+def create_game(storage):
+    return storage.create_game(
+        {"team1_id": "arg", "team2_id": "bra", "team1_name": "Argentina", "team2_name": "Brasil",
+         "status": "live", "created_at": datetime.datetime.now(datetime.timezone.utc)},
+        {"set_number": 1, "status": "live", "team1_current_score": 0, "team2_current_score": 0},
+    )
+
+
+def test_last_subscriber_releases_the_upstream_watch():
+    async def run():
+        storage = WatchingStorage()
+        runner = SlowWatchRunner(storage)
+        runner.opened.set()
+        hub, game_id = LiveHub(runner), create_game(storage)
+
+        subscriber = await hub.subscribe(game_id)
+        assert (hub.subscriber_count(game_id), storage.watching) == (1, 1)
+        hub.unsubscribe(game_id, subscriber)
+        assert (hub.subscriber_count(), storage.watching) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_request_cancelled_while_opening_the_watch_leaks_nothing():
+    async def run():
+        storage = WatchingStorage()
+        runner = SlowWatchRunner(storage)
+        hub, game_id = LiveHub(runner), create_game(storage)
+
+        pending = asyncio.ensure_future(hub.subscribe(game_id))
+        await asyncio.sleep(0.01)
+        assert hub.subscriber_count(game_id) == 1
+        pending.cancel() # El espectador cerró la pestaña
+        await asyncio.gather(pending, return_exceptions=True)
+        assert hub.subscriber_count() == 0 and game_id not in hub._channels
+
+        # El listener termina de abrirse después: se suelta en el momento
+        runner.opened.set()
+        await asyncio.sleep(0.01)
+        assert storage.watching == 0
+
+    asyncio.run(run())
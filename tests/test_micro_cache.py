@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+from micro_cache import MicroCache
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache, calls = MicroCache(0.25), []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        results = await asyncio.gather(*(cache.get("game:1", load) for _ in range(1000)))
+        assert results == [1] * 1000 and len(calls) == 1
+        assert await cache.get("game:1", load) == 1
+        assert (cache.hits, cache.coalesced, cache.loads) == (1, 999, 1)
+
+    asyncio.run(run())
+
+
+def test_invalidation_keeps_no_state_per_key():
+    async def run():
+        cache = MicroCache(0.25)
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return "viejo"
+
+        for n in range(10000):
+            cache.invalidate(f"game:{n}")
+        assert cache._generations == {}
+
+        # Invalidada durante la carga: se entrega, pero no se guarda
+        pending = asyncio.ensure_future(cache.get("game:1", load))
+        await asyncio.sleep(0)
+        cache.invalidate("game:1")
+        assert await pending == "viejo"
+        assert "game:1" not in cache._entries
+        assert cache._generations == {}
+
+    asyncio.run(run())
+
+
+def test_invalidation_from_another_thread_runs_on_the_loop():
+    threads = []
+
+    class RecordingCache(MicroCache):
+        def _invalidate(self, key):
+            threads.append(threading.get_ident())
+            super()._invalidate(key)
+
+    async def run():
+        cache = RecordingCache(0.25)
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return "viejo"
+
+        pending = asyncio.ensure_future(cache.get("game:1", load))
+        await asyncio.sleep(0)
+        # Como game_changed desde el pool del storage
+        await asyncio.get_running_loop().run_in_executor(None, cache.invalidate, "game:1")
+        assert cache._generations == {"game:1": 1}
+        assert await pending == "viejo"
+        assert "game:1" not in cache._entries
+        assert cache._generations == {}
+
+    asyncio.run(run())
+    assert threads == [threading.get_ident()]
@@ -0,0 +1,13 @@
+import main
+
+
+def test_game_in_category_created_after_cache_load(client, new_game):
+    assert client.get("/manager/categories").status_code == 200 # cache cargado
+    main.storage.put_category("nueva", {"name": "Nueva", "order": 3, "rules": {"set_points": 5, "best_of": 1}})
+
+    game_id = new_game("nueva")
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert game["category_name"] == "Nueva"
+    assert game["rules"]["set_points"] == 5
+    assert game["rules"]["best_of"] == 1
+    assert [c["id"] for c in main.reference_cache.list_categories()] == ["fa", "mini", "nueva"]
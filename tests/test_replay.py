@@ -0,0 +1,72 @@
+import main
+from event_log import initial_projection
+from replay import GameReplay, replay_state
+
+
+def play(client, game_id, moves):
+    """`moves`: equipo que anota, o "undo"."""
+    for move in moves:
+        if move == "undo":
+            response = client.post(f"/manager/games/{game_id}/undo_point")
+        else:
+            game = client.get(f"/manager/games/{game_id}").json()
+            response = client.post(f"/manager/games/{game_id}/increment",
+                                   json={"set_number": game["current_set_number"], "scoring_team_id": move})
+        assert response.status_code in (200, 201), response.text
+
+
+def replayed(game_id, events):
+    """El partido aplicando el log desde el principio, sin puntos de control."""
+    projection = initial_projection(main.storage, game_id, main.storage.get_game(game_id))
+    for event in events:
+        projection.apply(event)
+    return replay_state(projection, None)
+
+
+def test_seek_matches_the_whole_log_and_backfills_checkpoints(client, new_game):
+    game_id = new_game() # mini: sets a 3
+    play(client, game_id, ["arg", "bra", "undo", "arg", "arg", "arg", "bra", "bra", "undo", "bra", "bra", "bra", "arg"])
+    events = main.storage.list_events(game_id)
+    assert len(events) == 15 # con los dos finish_set
+
+    replay = GameReplay(main.storage, checkpoint_every=4)
+    for seq in range(len(events) + 1):
+        projection, _ = replay.seek(game_id, seq=seq)
+        assert replay_state(projection, None) == replayed(game_id, events[:seq]), seq
+
+    # La primera búsqueda escribió los puntos de control que faltaban, con hora y puntos
+    marks = [m for m in main.storage.list_snapshot_marks(game_id) if m.get("point_events") is not None]
+    assert [m["seq"] for m in marks] == [4, 8, 12]
+    assert [m["point_events"] for m in marks] == [3, 6, 9]
+
+
+def test_seek_by_point_and_time_reads_at_most_one_stretch(client, new_game, monkeypatch):
+    game_id = new_game("fa")
+    play(client, game_id, ["arg", "bra"] * 10 + ["undo", "arg"])
+    events = main.storage.list_events(game_id)
+    points = [i for i, event in enumerate(events) if event["type"] == "point"]
+    replay = GameReplay(main.storage, checkpoint_every=5)
+    replay.seek(game_id) # Arma el índice (y los puntos de control)
+
+    list_events = main.storage.list_events
+    read = []
+
+    def counting(*args, **kwargs):
+        chunk = list_events(*args, **kwargs)
+        read.append(len(chunk))
+        return chunk
+
+    monkeypatch.setattr(main.storage, "list_events", counting)
+    for n in (1, 7, 20, len(points)):
+        projection, last_event = replay.seek(game_id, point=n)
+        # Justo después del punto n (contando el que después se deshizo)
+        assert (projection.point_events, projection.seq) == (n, points[n - 1] + 1)
+        assert replay_state(projection, None) == replayed(game_id, events[:points[n - 1] + 1])
+    for k in (2, 13, len(events) - 1):
+        projection, _ = replay.seek(game_id, at=events[k]["timestamp"])
+        assert projection.seq >= k + 1
+        assert replay_state(projection, None) == replayed(game_id, events[:projection.seq])
+    assert max(read) <= 5
+
+    response = client.get(f"/games/{game_id}/replay", params={"point": 7})
+    assert (response.status_code, response.json()["seq"]) == (200, points[6] + 1)
@@ -0,0 +1,69 @@
+import json
+
+from archive import ArchiveStore
+from standings import Standings
+from storage import MemoryStorage
+
+
+MINI_RULES = {"set_points": 3, "tiebreak_points": 2, "best_of": 3}
+
+
+def table(standings):
+    return [
+        (row["team_id"], row["played"], row["wins"], row["table_points"],
+         row["sets_won"], row["sets_lost"], row["points_won"], row["points_lost"])
+        for row in json.loads(standings.render("mini", "Mini")[1])["teams"]
+    ]
+
+
+def test_status_changes_add_and_subtract_games(tmp_path):
+    storage = MemoryStorage()
+    standings = Standings(storage, ArchiveStore(str(tmp_path), bucket="", persistent_dir=False))
+    assert table(standings) == []
+    etag = standings.render("mini", "Mini")[0]
+
+    game = {"team1_id": "arg", "team2_id": "bra", "team1_name": "Argentina", "team2_name": "Brasil",
+            "category_id": "mini", "status": "live", "rules": MINI_RULES}
+    assert standings.update("g1", game)
+    assert table(standings) == []
+    # Gana arg en el set decisivo: 2 puntos de tabla, y 1 para bra
+    standings.update("g1", {"status": "finished", "winner_id": "arg", "team1_sets_won": 2, "team2_sets_won": 1,
+                            "team1_points": 8, "team2_points": 7})
+    assert table(standings) == [("arg", 1, 1, 2, 2, 1, 8, 7), ("bra", 1, 0, 1, 1, 2, 7, 8)]
+    assert standings.render("mini", "Mini")[0] != etag
+
+    standings.update("g2", dict(game, team1_id="bra", team2_id="arg", team1_name="Brasil", team2_name="Argentina",
+                                status="finished", winner_id="bra", team1_sets_won=2, team2_sets_won=0,
+                                team1_points=6, team2_points=1))
+    assert table(standings) == [("bra", 2, 1, 4, 3, 2, 13, 9), ("arg", 2, 1, 2, 2, 3, 9, 13)]
+
+    # Un undo reabre g1: sale de la tabla hasta que se vuelva a cerrar
+    standings.update("g1", {"status": "live", "winner_id": None, "team1_sets_won": 1})
+    assert table(standings) == [("bra", 1, 1, 3, 2, 0, 6, 1), ("arg", 1, 0, 0, 0, 2, 1, 6)]
+    assert [r["game_id"] for r in standings.team("mini", "arg")["results"]] == ["g2"]
+
+    # Anulado después de terminado: sale solo
+    standings.update("g2", {"status": "cancelled"})
+    assert table(standings) == []
+    assert standings.team("mini", "arg") is None
+
+    # Sin el game doc completo no se puede sumar un partido desconocido
+    assert not standings.update("g3", {"status": "finished"})
+
+
+def test_cancelled_game_leaves_the_table(client, new_game):
+    def arg_played():
+        response = client.get("/categories/mini/standings/arg")
+        return response.json()["played"] if response.status_code == 200 else 0
+
+    before = arg_played()
+    game_id = new_game()
+    for set_number in (1, 2):
+        for _ in range(3):
+            response = client.post(f"/manager/games/{game_id}/increment",
+                                   json={"set_number": set_number, "scoring_team_id": "arg"})
+            assert response.status_code == 201, response.text
+    assert arg_played() == before + 1
+
+    assert client.post(f"/manager/games/{game_id}/cancel").status_code == 200
+    assert arg_played() == before
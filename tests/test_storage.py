@@ -0,0 +1,31 @@
+import pytest
+
+from storage import MemoryStorage
+
+
+def test_memory_transaction_is_all_or_nothing():
+    storage = MemoryStorage()
+    game_id = storage.create_game({"status": "live", "current_team1_score": 0}, {"set_number": 1, "status": "live"})
+    before = storage.get_game(game_id)
+
+    def write(transaction):
+        transaction.update_game({"current_team1_score": 1})
+        transaction.update_set(1, {"team1_current_score": 1})
+        transaction.update_set(2, {"team1_current_score": 1}) # no existe
+
+    with pytest.raises(KeyError):
+        storage.run_game_transaction(game_id, write)
+    assert storage.get_game(game_id) == before
+    assert storage.list_sets(game_id)[0].get("team1_current_score") is None
+
+
+def test_memory_update_of_set_created_in_same_transaction():
+    storage = MemoryStorage()
+    game_id = storage.create_game({"status": "live"}, {"set_number": 1, "status": "live"})
+
+    def write(transaction):
+        transaction.create_set(2, {"set_number": 2, "status": "live"})
+        transaction.update_set(2, {"team1_current_score": 1})
+
+    storage.run_game_transaction(game_id, write)
+    assert storage.list_sets(game_id)[1]["team1_current_score"] == 1
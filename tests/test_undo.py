@@ -0,0 +1,69 @@
+import main
+
+
+def point(client, game_id, set_number, team_id):
+    response = client.post(f"/manager/games/{game_id}/increment", json={"set_number": set_number, "scoring_team_id": team_id})
+    assert response.status_code == 201, response.text
+
+
+def undo(client, game_id):
+    response = client.post(f"/manager/games/{game_id}/undo_point")
+    assert response.status_code == 200, response.text
+    return response.json()["new_scores"]
+
+
+def test_undo_set_point_reopens_the_set(client, new_game):
+    game_id = new_game() # mini: sets a 3, al mejor de 3
+    for team in ("arg", "bra", "arg", "arg"):
+        point(client, game_id, 1, team)
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert (game["current_set_number"], game["team1_sets_won"], game["team1_points"]) == (2, 1, 3)
+
+    assert undo(client, game_id) == {"set_number": 1, "team1_score": 2, "team2_score": 1}
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert game["current_set_number"] == 1
+    assert (game["current_team1_score"], game["current_team2_score"]) == (2, 1)
+    assert (game["team1_sets_won"], game["team2_sets_won"], game["team1_points"], game["team2_points"]) == (0, 0, 0, 0)
+    assert game["status"] == "live"
+    sets = client.get(f"/games/{game_id}").json()["sets"]
+    assert [(s["set_number"], s["status"], s["winner_id"]) for s in sets] == [(1, "live", None)]
+
+    # El set sigue como si el punto no hubiera existido
+    point(client, game_id, 1, "bra")
+    assert len(client.get(f"/games/{game_id}/sets/1/points").json()) == 4
+    projection = main.projections.get(game_id)
+    assert projection.current_set_number == 1 and projection.team1_sets_won == 0
+    assert sorted(projection.sets) == [1]
+
+
+def test_undo_match_point_reopens_the_match(client, new_game):
+    game_id = new_game()
+    for set_number in (1, 2):
+        for _ in range(3):
+            point(client, game_id, set_number, "arg")
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert (game["status"], game["winner_id"], game["team1_sets_won"]) == ("finished", "arg", 2)
+
+    assert undo(client, game_id) == {"set_number": 2, "team1_score": 2, "team2_score": 0}
+    game = client.get(f"/manager/games/{game_id}").json()
+    assert (game["status"], game["winner_id"]) == ("live", None)
+    assert (game["current_set_number"], game["team1_sets_won"], game["team1_points"]) == (2, 1, 3)
+    results = client.get("/categories/mini/standings/arg").json()["results"]
+    assert game_id not in [result["game_id"] for result in results]
+
+    # Un segundo undo ya es un punto común; el set 1 sigue cerrado
+    assert undo(client, game_id) == {"set_number": 2, "team1_score": 1, "team2_score": 0}
+    sets = client.get(f"/games/{game_id}").json()["sets"]
+    assert [(s["set_number"], s["status"]) for s in sets] == [(1, "finished"), (2, "live")]
+
+    # Y se puede volver a cerrar
+    point(client, game_id, 2, "arg")
+    point(client, game_id, 2, "arg")
+    assert client.get(f"/manager/games/{game_id}").json()["status"] == "finished"
+    results = client.get("/categories/mini/standings/arg").json()["results"]
+    assert [result["sets_won"] for result in results if result["game_id"] == game_id] == [2]
+
+
+def test_undo_on_an_empty_first_set_is_rejected(client, new_game):
+    game_id = new_game()
+    assert client.post(f"/manager/games/{game_id}/undo_point").status_code == 400
@@ -0,0 +1,26 @@
+import struct
+
+import wire
+
+
+FRAMES = {"accept": wire.FRAME_MEDIA_TYPE}
+
+
+def test_frames_keep_the_json_status_codes(client, new_game):
+    game_id = new_game()
+    body = {"set_number": 1, "scoring_team_id": "arg"}
+
+    as_json = client.post(f"/manager/games/{game_id}/increment", json=body)
+    as_frame = client.post(f"/manager/games/{game_id}/increment", json=body, headers=FRAMES)
+    assert as_json.status_code == as_frame.status_code == 201
+    assert as_frame.headers["content-type"] == wire.FRAME_MEDIA_TYPE
+    assert struct.unpack("<BBBHHq", as_frame.content)[3:5] == (2, 0)
+
+    batch = {"points": [{"set_number": 1, "scoring_team_id": "bra"}]}
+    as_json = client.post(f"/manager/games/{game_id}/increment_batch", json=batch)
+    as_frame = client.post(f"/manager/games/{game_id}/increment_batch", json=batch, headers=FRAMES)
+    assert as_json.status_code == as_frame.status_code == 201
+
+    as_json = client.post(f"/manager/games/{game_id}/undo_point")
+    as_frame = client.post(f"/manager/games/{game_id}/undo_point", headers=FRAMES)
+    assert as_json.status_code == as_frame.status_code == 200
@@ -0,0 +1,88 @@
+import pytest
+
+from event_log import new_event
+from storage import MemoryStorage
+from write_behind import WriteBehindStorage
+
+
+class FlakyStorage(MemoryStorage):
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    def write_game_if_version(self, game_id, version, fn):
+        if self.down:
+            raise ConnectionError("sin red")
+        return super().write_game_if_version(game_id, version, fn)
+
+
+@pytest.fixture
+def backend():
+    return FlakyStorage()
+
+
+@pytest.fixture
+def write_behind(backend, tmp_path):
+    return WriteBehindStorage(backend, str(tmp_path / "voley.journal"), retry_seconds=60)
+
+
+def new_game(backend):
+    return backend.create_game({"team1_id": "arg", "team2_id": "bra", "status": "upcoming", "event_seq": 0},
+                               {"set_number": 1, "status": "live"})
+
+
+def score(write_behind, game_id, seq, version=None):
+    """Un punto por el camino rápido. Sin `version`, se lee (y se manda lo pendiente)."""
+    if version is None:
+        _, version = write_behind.get_game_versioned(game_id)
+
+    def write(writer):
+        writer.append_event(new_event(seq, "point", 1, "arg"))
+        writer.update_game({"current_team1_score": seq, "event_seq": seq, "status": "live"})
+
+    return write_behind.write_game_if_version(game_id, version, write)
+
+
+def test_reads_see_pending_writes_without_flushing(backend, write_behind):
+    game_id = new_game(backend)
+    score(write_behind, game_id, 1)
+
+    assert backend.get_game(game_id)["event_seq"] == 0
+    assert write_behind.get_game(game_id)["current_team1_score"] == 1
+    assert [event["seq"] for event in write_behind.list_events(game_id)] == [1]
+    assert write_behind.list_events(game_id, after_seq=1) == []
+    assert write_behind.pending() == 1
+
+
+def test_failed_flush_keeps_entries_and_backs_off(backend, write_behind):
+    game_id = new_game(backend)
+    score(write_behind, game_id, 1)
+    backend.down = True
+
+    with pytest.raises(ConnectionError):
+        write_behind.flush()
+    assert write_behind.pending() == 1
+    assert write_behind.retrying() == 1
+    assert write_behind.flush(only_due=True) == 0 # Esperando para reintentar: ni lo intenta
+
+    backend.down = False
+    assert write_behind.flush() == 1
+    assert write_behind.retrying() == 0
+    assert backend.get_game(game_id)["current_team1_score"] == 1
+
+
+def test_entries_that_cannot_be_applied_are_kept_aside(backend, write_behind, tmp_path):
+    game_id = new_game(backend)
+    score(write_behind, game_id, 2, version=score(write_behind, game_id, 1))
+    backend.delete_game(game_id)
+
+    assert write_behind.flush() == 2
+    assert write_behind.pending() == 0
+    assert write_behind.rejected_entries == 2
+    assert "voley_write_behind_rejected 2" in write_behind.render()
+
+    # Siguen en disco, con el motivo, también después de reiniciar
+    restarted = WriteBehindStorage(MemoryStorage(), str(tmp_path / "voley.journal"))
+    assert restarted.pending() == 0
+    assert restarted.rejected_entries == 2
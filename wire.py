@@ -0,0 +1,87 @@
+# wire.py
+"""
+Formato binario compacto para las actualizaciones de score.
+
+Un PointDocument en JSON son ~130 bytes (timestamp ISO, ids de equipo
+largos, nombres de campo); con miles de celulares en la red de la cancha
+eso pesa. Si el cliente manda `Accept: application/vnd.voley.frame`, los
+endpoints de planilla y el stream responden con frames binarios de tamaño
+fijo (little-endian), con el índice del equipo (0 = team1, 1 = team2) en
+lugar de su id:
+
+    POINT     15 B  <B B B H H q   tipo=1, set, equipo, score1, score2, timestamp (ms epoch)
+    SCORE      6 B  <B B H H       tipo=2, set, score1, score2
+    STATE     14 B  <B B H H B B B B I
+                                   tipo=3, set, score1, score2, sets1, sets2,
+                                   status (ver STATUSES), ganador (0 nadie, 1, 2), versión
+    SNAPSHOT 3+n B  <B H + JSON    tipo=4, largo, game doc completo (con los ids)
+    PING       1 B  <B             tipo=0
+
+El tipo define el largo, así que en el stream los frames van uno atrás del
+otro sin separadores. El primero es siempre un SNAPSHOT: de ahí salen los
+ids de los equipos para traducir los índices.
+"""
+import struct
+import datetime
+from typing import Optional
+
+
+FRAME_MEDIA_TYPE = "application/vnd.voley.frame"
+
+PING, POINT, SCORE, STATE, SNAPSHOT = 0, 1, 2, 3, 4
+
+STATUSES = ("upcoming", "live", "finished", "cancelled")
+
+_POINT = struct.Struct("<BBBHHq")
+_SCORE = struct.Struct("<BBHH")
+_STATE = struct.Struct("<BBHHBBBBI")
+_SNAPSHOT = struct.Struct("<BH")
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+PING_FRAME = struct.pack("<B", PING)
+
+
+def wants_frames(accept: Optional[str]) -> bool:
+    """Si el cliente pidió frames binarios en Accept (y no con q=0)."""
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        if media_type.strip().lower() != FRAME_MEDIA_TYPE:
+            continue
+        params = params.replace(" ", "")
+        return not (params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
+def _team_index(team_id: Optional[str], team1_id: str, team2_id: str) -> int:
+    """0 nadie, 1 team1, 2 team2."""
+    if team_id is None:
+        return 0
+    return 1 if team_id == team1_id else 2 if team_id == team2_id else 0
+
+
+def point_frame(set_number: int, team_index: int, score_t1: int, score_t2: int,
+                timestamp: datetime.datetime) -> bytes:
+    millis = (timestamp - _EPOCH) // datetime.timedelta(milliseconds=1)
+    return _POINT.pack(POINT, set_number, team_index, score_t1, score_t2, millis)
+
+
+def score_frame(set_number: int, score_t1: int, score_t2: int) -> bytes:
+    return _SCORE.pack(SCORE, set_number, score_t1, score_t2)
+
+
+def state_frame(game: dict) -> bytes:
+    """Estado del marcador completo (para el stream: cada frame se basta solo)."""
+    status = game.get("status")
+    return _STATE.pack(
+        STATE, game.get("current_set_number", 1),
+        game.get("current_team1_score", 0), game.get("current_team2_score", 0),
+        game.get("team1_sets_won", 0), game.get("team2_sets_won", 0),
+        STATUSES.index(status) if status in STATUSES else 0,
+        _team_index(game.get("winner_id"), game.get("team1_id"), game.get("team2_id")),
+        game.get("version", 0) & 0xFFFFFFFF
+    )
+
+
+def snapshot_frame(game_json: bytes) -> bytes:
+    return _SNAPSHOT.pack(SNAPSHOT, len(game_json)) + game_json
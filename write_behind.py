@@ -0,0 +1,503 @@
+# write_behind.py
+"""
+Write-behind para el camino rápido de los puntos (WRITE_BEHIND=1).
+
+Con Firestore, cada /increment esperaba el commit remoto antes de
+responder: la latencia que ve el planillero era la del peor salto de red de
+la cancha. En este modo, la escritura condicional del camino rápido
+(`write_game_if_version`, ver main.apply_points_from_cache) no va al
+storage: se agrega a un journal local, se hace fsync y se responde. Un
+flusher en segundo plano (main.flush_write_behind) manda lo pendiente de
+cada partido en una sola escritura cada WRITE_BEHIND_FLUSH_MS.
+
+* El journal es un archivo append-only (WRITE_BEHIND_JOURNAL): cada
+  registro lleva su largo y un CRC, así que una escritura cortada a la mitad
+  (el proceso murió durante el append) se descarta al leerlo. Cuando no
+  queda nada pendiente se vacía; si crece igual, se reescribe sólo con lo
+  pendiente. Es un `open(..., "ab")` común, no un mmap: la durabilidad la
+  da el fsync de cada append, y un log con mmap necesitaría reservar el
+  archivo de antemano y volver a mapearlo al crecer, sin ganar nada para
+  registros de unos cientos de bytes.
+* Al arrancar, lo que quedó sin mandar se vuelve a cargar y el flusher lo
+  manda. Reenviar es seguro: cada tanda lleva sus eventos del log, y si el
+  `event_seq` del partido ya los incluye (el proceso murió después del
+  commit y antes de anotarlo) la tanda se saltea.
+* Si el flush de un partido falla (red, storage caído), sus tandas quedan
+  en el journal y se reintentan con espera creciente (hasta
+  MAX_RETRY_SECONDS). Las que no se pueden aplicar nunca (el partido ya no
+  existe, o su log siguió por otro lado) no se pierden: pasan al archivo
+  `<journal>.rejected`, con el motivo, y se cuentan en las métricas.
+* Las lecturas del partido (`get_game`, `list_sets`, `list_events`) no
+  esperan el flush: leen el storage y le aplican encima lo pendiente. Todo
+  lo demás sobre un partido con escrituras pendientes (la versión para
+  escribir, una transacción, anularlo, los snapshots) primero las manda.
+  Los listados (lobby, tabla) mandan las de todos los partidos.
+* La versión que devuelve `write_game_if_version` mientras hay pendientes es
+  del journal (`_JournalVersion`); el cache de main.py la guarda como
+  cualquier otra.
+
+Cada tanda del journal actualiza el game doc una vez, igual que antes: el
+campo `version` del partido avanza lo mismo que sin write-behind.
+
+Con varios procesos, cada partido tiene que tener un solo dueño (ver
+game_writer.py): el journal es local. En Cloud Run el disco es memoria, así
+que el journal sólo sobrevive a un crash del proceso, no a la pérdida de la
+instancia; para la cancha (laptop, VM) conviene un disco de verdad.
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from storage import GameTransaction, StaleGameError, Storage, _StagedGameTransaction
+
+
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "") not in ("", "0")
+WRITE_BEHIND_JOURNAL = os.environ.get("WRITE_BEHIND_JOURNAL", "voley.journal")
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get("WRITE_BEHIND_FLUSH_MS", "200"))
+
+# Firestore acepta hasta 500 escrituras por batch
+MAX_FLUSH_WRITES = 400
+
+# Espera máxima entre reintentos del flush de un partido que falla
+MAX_RETRY_SECONDS = 30.0
+
+# Si el journal pasa de esto con escrituras pendientes, se reescribe sólo con ellas
+JOURNAL_COMPACT_BYTES = 8 * 1024 * 1024
+
+_HEADER = struct.Struct("<II") # largo, crc32
+
+_fsync = getattr(os, "fdatasync", os.fsync)
+
+# Las que van sobre un partido: antes, se mandan sus pendientes (las lecturas
+# get_game, list_sets y list_events no: se sirven con lo pendiente encima)
+_GAME_OPERATIONS = ("get_game_versioned", "get_latest_snapshot", "list_snapshot_marks", "put_snapshot",
+                    "update_game", "delete_game", "run_game_transaction")
+# Listados de partidos: antes, se mandan las pendientes de todos
+_LISTINGS = ("list_games", "query_games")
+_PASSTHROUGH = ("list_categories", "get_category", "put_category", "list_teams", "get_team", "get_teams",
+                "put_team", "create_game", "create_games", "watch_game")
+
+
+def _encode(record: dict) -> bytes:
+    return json.dumps(
+        record, separators=(",", ":"),
+        default=lambda value: {"$dt": value.isoformat()} if isinstance(value, datetime.datetime) else str(value)
+    ).encode("utf-8")
+
+
+def _decode(raw: bytes) -> dict:
+    def hook(data):
+        if len(data) == 1 and "$dt" in data:
+            return datetime.datetime.fromisoformat(data["$dt"])
+        return data
+    return json.loads(raw, object_hook=hook)
+
+
+class Journal:
+    """
+    Registros {"id", "game_id", "writes"} (una tanda) y {"flushed", "game_id"}
+    (las tandas del partido hasta ese id ya están en el storage).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self.size = 0
+
+    def load(self) -> List[dict]:
+        """Tandas sin mandar, en orden. Corta el final si quedó un registro a medias."""
+        records, good = [], 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            while good + _HEADER.size <= len(data):
+                length, crc = _HEADER.unpack_from(data, good)
+                start = good + _HEADER.size
+                raw = data[start:start + length]
+                if len(raw) < length or zlib.crc32(raw) != crc:
+                    break
+                records.append(_decode(raw))
+                good = start + length
+            if good < len(data):
+                print(f"Journal: se descartan {len(data) - good} bytes incompletos al final de {self.path}")
+
+        self._file = open(self.path, "ab")
+        self._file.truncate(good)
+        self.size = good
+
+        flushed: Dict[str, int] = {}
+        for record in records:
+            if "flushed" in record:
+                flushed[record["game_id"]] = max(flushed.get(record["game_id"], 0), record["flushed"])
+        return [
+            record for record in records
+            if "flushed" not in record and record["id"] > flushed.get(record["game_id"], 0)
+        ]
+
+    def append(self, record: dict, sync: bool = True):
+        raw = _encode(record)
+        try:
+            self._file.write(_HEADER.pack(len(raw), zlib.crc32(raw)) + raw)
+            self._file.flush()
+            if sync:
+                _fsync(self._file.fileno())
+        except OSError:
+            # Disco lleno o similar: que no quede un registro que el llamador cree que falló
+            self._file.truncate(self.size)
+            raise
+        self.size += _HEADER.size + len(raw)
+
+    def rewrite(self, records: List[dict]):
+        """Deja en el journal sólo `records` (vacío si no hay ninguno)."""
+        if not records:
+            self._file.truncate(0)
+            _fsync(self._file.fileno())
+            self.size = 0
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            for record in records:
+                raw = _encode(record)
+                f.write(_HEADER.pack(len(raw), zlib.crc32(raw)) + raw)
+            f.flush()
+            _fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, "ab")
+        self.size = self._file.tell()
+
+
+class _JournalVersion:
+    """Versión de un partido con escrituras pendientes (se compara por identidad)."""
+
+    __slots__ = ("entry_id",)
+
+    def __init__(self, entry_id: int):
+        self.entry_id = entry_id
+
+
+class _PendingGame:
+
+    __slots__ = ("entries", "version", "token", "flush_lock", "failures", "retry_at")
+
+    def __init__(self, version: Any):
+        self.entries: List[dict] = []       # Tandas en orden: {"id", "game_id", "writes"}
+        self.version = version              # Del storage, antes de la primera pendiente (None: a leer)
+        self.token: Optional[_JournalVersion] = None
+        self.flush_lock = threading.Lock()
+        self.failures = 0                   # Flushes fallidos seguidos
+        self.retry_at = 0.0                 # time.monotonic() del próximo intento del flusher
+
+
+def _event_seqs(entries: List[dict]) -> Tuple[Optional[int], Optional[int]]:
+    seqs = [write[1]["seq"] for entry in entries for write in entry["writes"] if write[0] == "append_event"]
+    return (min(seqs), max(seqs)) if seqs else (None, None)
+
+
+def _already_applied(entry: dict, event_seq: int) -> bool:
+    """Si los eventos de la tanda ya están en el log del partido (hasta `event_seq`)."""
+    last_seq = _event_seqs([entry])[1]
+    return last_seq is not None and last_seq <= event_seq
+
+
+class WriteBehindStorage(Storage):
+    """
+    Envuelve un storage (va adentro de InstrumentedStorage: las métricas
+    cuentan lo que responde el pedido, no el flush).
+    """
+
+    def __init__(self, inner: Storage, journal_path: str = WRITE_BEHIND_JOURNAL,
+                 retry_seconds: float = WRITE_BEHIND_FLUSH_MS / 1000):
+        self._inner = inner
+        self.blocking = inner.blocking
+        self._journal = Journal(journal_path)
+        # Tandas que no se pudieron aplicar: quedan acá para recuperarlas a mano
+        self._rejected = Journal(journal_path + ".rejected")
+        self._retry_seconds = retry_seconds
+        self._pending: Dict[str, _PendingGame] = {}
+        # Último token por partido ya mandado -> versión del storage
+        self._flushed: Dict[str, Tuple[_JournalVersion, Any]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.flushed_entries = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.rejected_entries = len(self._rejected.load())
+
+        for record in self._journal.load():
+            pending = self._pending.setdefault(record["game_id"], _PendingGame(None))
+            record["writes"] = [tuple(write) for write in record["writes"]]
+            pending.entries.append(record)
+            pending.token = _JournalVersion(record["id"])
+            self._next_id = max(self._next_id, record["id"] + 1)
+        if self._pending:
+            print(f"Write-behind: {self.pending()} escrituras pendientes en {journal_path}, se reenvían al storage")
+
+        for name in _GAME_OPERATIONS:
+            setattr(self, name, self._after_game_flush(name))
+        for name in _LISTINGS:
+            setattr(self, name, self._after_flush(name))
+        for name in _PASSTHROUGH:
+            setattr(self, name, getattr(inner, name))
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def connect(self):
+        self._inner.connect()
+
+    def pending(self) -> int:
+        """Tandas en el journal que todavía no están en el storage."""
+        with self._lock:
+            return sum(len(pending.entries) for pending in self._pending.values())
+
+    def retrying(self) -> int:
+        with self._lock:
+            return sum(1 for pending in self._pending.values() if pending.failures)
+
+    def _after_game_flush(self, name: str) -> Callable:
+        def wrapper(game_id, *args, **kwargs):
+            self.flush_game(game_id)
+            return getattr(self._inner, name)(game_id, *args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    # --- Lecturas (storage + lo pendiente encima) ---
+
+    def _pending_writes(self, game_id: str) -> List[tuple]:
+        # Antes de leer el storage: una tanda que se manda en el medio queda en
+        # los dos lados, y aplicarla otra vez no cambia nada (valores, no sumas)
+        with self._lock:
+            pending = self._pending.get(game_id)
+            return [write for entry in pending.entries for write in entry["writes"]] if pending else []
+
+    def get_game(self, game_id):
+        writes = self._pending_writes(game_id)
+        data = self._inner.get_game(game_id)
+        if data is not None:
+            for write in writes:
+                if write[0] == "update_game":
+                    data.update(write[1])
+        return data
+
+    def list_sets(self, game_id):
+        writes = self._pending_writes(game_id)
+        sets = self._inner.list_sets(game_id)
+        if not writes:
+            return sets
+        by_number = {game_set["set_number"]: game_set for game_set in sets}
+        for write in writes:
+            if write[0] == "create_set":
+                by_number[write[1]] = dict(write[2])
+            elif write[0] == "update_set" and write[1] in by_number:
+                by_number[write[1]] = dict(by_number[write[1]], **write[2])
+            elif write[0] == "delete_set":
+                by_number.pop(write[1], None)
+        return [by_number[n] for n in sorted(by_number)]
+
+    def list_events(self, game_id, after_seq=0, upto_seq=None):
+        writes = self._pending_writes(game_id)
+        events = self._inner.list_events(game_id, after_seq=after_seq, upto_seq=upto_seq)
+        seen = {event["seq"] for event in events}
+        extra = [
+            dict(write[1]) for write in writes
+            if write[0] == "append_event" and write[1]["seq"] > after_seq and write[1]["seq"] not in seen
+            and (upto_seq is None or write[1]["seq"] <= upto_seq)
+        ]
+        return events + sorted(extra, key=lambda event: event["seq"]) if extra else events
+
+    def _after_flush(self, name: str) -> Callable:
+        def wrapper(*args, **kwargs):
+            self.flush()
+            return getattr(self._inner, name)(*args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    # --- Escritura (al journal) ---
+
+    def write_game_if_version(self, game_id, version, fn):
+        writer = _StagedGameTransaction(self, game_id)
+        with self._lock:
+            pending = self._pending.get(game_id)
+            if pending is not None:
+                if version is not pending.token:
+                    raise StaleGameError(f"El partido {game_id} cambió de versión")
+            else:
+                flushed = self._flushed.get(game_id)
+                if flushed is not None and version is flushed[0]:
+                    version = flushed[1]
+                elif isinstance(version, _JournalVersion):
+                    # Una versión del journal que ya no corresponde (p.ej. tanda descartada)
+                    raise StaleGameError(f"El partido {game_id} cambió de versión")
+
+            fn(writer)
+            if not any(write[0] == "update_game" for write in writer.writes):
+                raise ValueError("write_game_if_version necesita escribir el game doc")
+
+            entry = {"id": self._next_id, "game_id": game_id, "writes": writer.writes}
+            # Primero al disco: si esto falla, no se anotó nada
+            self._journal.append(entry)
+            self._next_id += 1
+            if pending is None:
+                pending = self._pending[game_id] = _PendingGame(version)
+            pending.entries.append(entry)
+            pending.token = _JournalVersion(entry["id"])
+            return pending.token
+
+    # --- Flush (al storage) ---
+
+    def flush(self, only_due: bool = False) -> int:
+        """
+        Manda lo pendiente de todos los partidos. Devuelve cuántas tandas mandó.
+        Con `only_due` (el flusher) se saltean los que están esperando para
+        reintentar. Si alguno falla se sigue con los demás y al final se
+        lanza el error.
+        """
+        now = time.monotonic()
+        with self._lock:
+            game_ids = [game_id for game_id, pending in self._pending.items()
+                        if not only_due or pending.retry_at <= now]
+        flushed, error = 0, None
+        for game_id in game_ids:
+            try:
+                flushed += self.flush_game(game_id)
+            except Exception as e:
+                error = e
+        if error is not None:
+            raise error
+        return flushed
+
+    def flush_game(self, game_id: str) -> int:
+        with self._lock:
+            pending = self._pending.get(game_id)
+        if pending is None:
+            return 0
+
+        flushed = 0
+        # Uno a la vez por partido; las escrituras nuevas no esperan (van al journal)
+        with pending.flush_lock:
+            while True:
+                with self._lock:
+                    if self._pending.get(game_id) is not pending or not pending.entries:
+                        break
+                    entries, count = [], 0
+                    for entry in pending.entries:
+                        if entries and count + len(entry["writes"]) > MAX_FLUSH_WRITES:
+                            break
+                        entries.append(entry)
+                        count += len(entry["writes"])
+                    version = pending.version
+
+                try:
+                    new_version, reason = self._commit(game_id, version, entries)
+                except Exception:
+                    # Siguen en el journal: el flusher reintenta con espera creciente
+                    with self._lock:
+                        self.flush_errors += 1
+                        pending.failures += 1
+                        pending.retry_at = time.monotonic() + min(
+                            self._retry_seconds * 2 ** pending.failures, MAX_RETRY_SECONDS
+                        )
+                    raise
+
+                with self._lock:
+                    pending.failures = 0
+                    pending.retry_at = 0.0
+                    if new_version is None:
+                        # Lo que vino detrás se armó sobre ellas: tampoco se puede aplicar
+                        entries = list(pending.entries)
+                        self._reject(game_id, entries, reason)
+                        del self._pending[game_id]
+                        self._flushed.pop(game_id, None)
+                    else:
+                        del pending.entries[:len(entries)]
+                        pending.version = new_version
+                        if not pending.entries:
+                            del self._pending[game_id]
+                            self._flushed[game_id] = (pending.token, new_version)
+                    # Sin fsync: si se pierde, al reenviar la tanda se ve que ya estaba
+                    self._journal.append({"flushed": entries[-1]["id"], "game_id": game_id}, sync=False)
+                    self.flushed_entries += len(entries)
+                    self.flushes += 1
+                    flushed += len(entries)
+                    self._compact()
+        return flushed
+
+    def _commit(self, game_id: str, version: Any, entries: List[dict]) -> Tuple[Any, Optional[str]]:
+        """
+        Una escritura condicional con todas las tandas. Devuelve (versión
+        nueva, None), o (None, motivo) si las tandas no se pueden aplicar.
+        """
+        def apply(writer: GameTransaction):
+            for entry in entries:
+                for write in entry["writes"]:
+                    getattr(writer, write[0])(*write[1:])
+
+        for attempt in range(2):
+            if version is None:
+                # Recién recuperadas del journal, o alguien más escribió el partido
+                game_data, version = self._inner.get_game_versioned(game_id)
+                if game_data is None:
+                    return None, "el partido ya no existe"
+                # Las que ya están en el log (murió después del commit y antes de anotarlo) se saltean
+                event_seq = game_data.get("event_seq", 0)
+                entries = [entry for entry in entries if not _already_applied(entry, event_seq)]
+                if not entries:
+                    return version, None
+                first_seq = _event_seqs(entries)[0]
+                if first_seq is not None and first_seq != event_seq + 1:
+                    return None, f"el log está en {event_seq} y las tandas empiezan en {first_seq}"
+            try:
+                return self._inner.write_game_if_version(game_id, version, apply), None
+            except StaleGameError:
+                version = None
+        raise StaleGameError(f"El partido {game_id} cambió de versión durante el flush")
+
+    def _reject(self, game_id: str, entries: List[dict], reason: str):
+        # Siempre con el lock tomado. Primero al disco: recién después salen del journal
+        for entry in entries:
+            self._rejected.append(dict(entry, reason=reason))
+        self.rejected_entries += len(entries)
+        print(f"Write-behind: {len(entries)} tandas de {game_id} no se pueden aplicar ({reason}); "
+              f"quedan en {self._rejected.path}")
+
+    def _compact(self):
+        # Siempre con el lock tomado
+        if not self._pending:
+            self._journal.rewrite([])
+        elif self._journal.size > JOURNAL_COMPACT_BYTES:
+            self._journal.rewrite(sorted(
+                (entry for pending in self._pending.values() for entry in pending.entries),
+                key=lambda entry: entry["id"]
+            ))
+
+    def render(self) -> str:
+        """Métricas en formato Prometheus (se suman a /metrics)."""
+        return "\n".join([
+            "# HELP voley_write_behind_pending Tandas en el journal que todavía no están en el storage.",
+            "# TYPE voley_write_behind_pending gauge",
+            f"voley_write_behind_pending {self.pending()}",
+            "# HELP voley_write_behind_flushed_total Tandas mandadas al storage.",
+            "# TYPE voley_write_behind_flushed_total counter",
+            f"voley_write_behind_flushed_total {self.flushed_entries}",
+            "# HELP voley_write_behind_flushes_total Escrituras al storage del flush.",
+            "# TYPE voley_write_behind_flushes_total counter",
+            f"voley_write_behind_flushes_total {self.flushes}",
+            "# HELP voley_write_behind_flush_errors_total Flushes que fallaron (se reintentan).",
+            "# TYPE voley_write_behind_flush_errors_total counter",
+            f"voley_write_behind_flush_errors_total {self.flush_errors}",
+            "# HELP voley_write_behind_retrying Partidos cuyo flush falló y espera para reintentar.",
+            "# TYPE voley_write_behind_retrying gauge",
+            f"voley_write_behind_retrying {self.retrying()}",
+            "# HELP voley_write_behind_rejected Tandas que no se pudieron aplicar (en <journal>.rejected).",
+            "# TYPE voley_write_behind_rejected gauge",
+            f"voley_write_behind_rejected {self.rejected_entries}",
+            "# HELP voley_write_behind_journal_bytes Tamaño del journal.",
+            "# TYPE voley_write_behind_journal_bytes gauge",
+            f"voley_write_behind_journal_bytes {self._journal.size}",
+        ]) + "\n"